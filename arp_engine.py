@@ -0,0 +1,191 @@
+# arp_engine.py
+"""
+Motor ARP de baixo custo baseado em socket AF_PACKET (somente Linux).
+
+Alternativa ao scapy para segmentos grandes, onde montar um objeto scapy por
+requisição e dissecar cada resposta em Python puro domina o uso de CPU:
+- Um único frame Ethernet/ARP pré-alocado; por envio só o IP alvo é trocado
+- Filtro BPF no kernel: apenas respostas ARP (is-at) chegam ao processo
+- Recepção em buffer reutilizado, lendo só IP/MAC do remetente via memoryview
+- Envio limitado também pelo orçamento global de pacotes (ratelimit), se informado
+
+Produz o mesmo formato de discovery.discovery_arp: {'ip', 'mac'}.
+"""
+
+import ctypes
+import ipaddress
+import itertools
+import select
+import socket
+import struct
+import time
+
+import netifaces
+
+ETH_P_ARP = 0x0806
+SO_ATTACH_FILTER = 26
+
+# Offsets no frame Ethernet (14 bytes) + ARP (28 bytes)
+_OFF_ARP_OP = 20
+_OFF_SENDER_MAC = 22
+_OFF_SENDER_IP = 28
+_OFF_TARGET_IP = 38
+_FRAME_LEN = 42
+
+# BPF clássico equivalente a "arp and arp[6:2] = 2" (apenas is-at)
+_BPF_ARP_REPLY = [
+    (0x28, 0, 0, 12),          # ldh [12]          (ethertype)
+    (0x15, 0, 3, ETH_P_ARP),   # jeq #0x806        senão descarta
+    (0x28, 0, 0, _OFF_ARP_OP), # ldh [20]          (opcode ARP)
+    (0x15, 0, 1, 2),           # jeq #2            senão descarta
+    (0x06, 0, 0, _FRAME_LEN),  # ret #42           (só os bytes que usamos)
+    (0x06, 0, 0, 0),           # ret #0
+]
+
+
+def _mac_to_bytes(mac):
+    return bytes(int(part, 16) for part in mac.split(':'))
+
+
+def _build_template(src_mac, src_ip):
+    """Frame de requisição ARP em broadcast; o IP alvo é preenchido a cada envio."""
+    frame = bytearray(_FRAME_LEN)
+    struct.pack_into(
+        '!6s6sH HHBBH 6s4s6s4s', frame, 0,
+        b'\xff' * 6, src_mac, ETH_P_ARP,
+        1, 0x0800, 6, 4, 1,  # Ethernet, IPv4, who-has
+        src_mac, src_ip, b'\x00' * 6, b'\x00' * 4
+    )
+    return frame
+
+
+class AfPacketArpScanner:
+    """
+    Varredura ARP por socket AF_PACKET em uma interface.
+    Requer root (CAP_NET_RAW).
+    """
+
+    def __init__(self, iface):
+        self.iface = iface
+        link = netifaces.ifaddresses(iface)
+        src_mac = _mac_to_bytes(link[netifaces.AF_LINK][0]['addr'])
+        src_ip = socket.inet_aton(link[netifaces.AF_INET][0]['addr'])
+
+        self._sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ARP))
+        self._sock.bind((iface, ETH_P_ARP))
+        self._attach_filter()
+        self._sock.setblocking(False)
+
+        self._template = _build_template(src_mac, src_ip)
+        self._recv_buf = bytearray(2048)
+        self._recv_view = memoryview(self._recv_buf)
+
+    def _attach_filter(self):
+        program = b''.join(struct.pack('HBBI', *ins) for ins in _BPF_ARP_REPLY)
+        # O buffer precisa continuar vivo enquanto o kernel copia o programa
+        self._bpf_buf = ctypes.create_string_buffer(program)
+        fprog = struct.pack('HL', len(_BPF_ARP_REPLY), ctypes.addressof(self._bpf_buf))
+        self._sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, fprog)
+
+    def close(self):
+        self._sock.close()
+
+    def sweep(self, network_cidr, pps=500, timeout=1.0, budget=None, stop=None, start=0, progress=None):
+        """
+        Envia uma requisição ARP para cada host do CIDR a no máximo 'pps' pacotes/s
+        (e dentro do orçamento 'budget', um ratelimit.PacketBudget, se informado)
+        e gera {'ip', 'mac'} para cada host que responder (sem repetições).
+        Termina 'timeout' segundos após o último envio, ou assim que a função
+        'stop' (opcional) retornar True.
+
+        Os endereços são percorridos a partir do deslocamento 'start' (dando a volta
+        no fim do CIDR). Em 'progress' (dicionário opcional) ficam 'sent', quantos
+        endereços foram enviados, e 'complete', se a varredura chegou ao fim.
+        """
+        network = ipaddress.ip_network(network_cidr, strict=False)
+        net_first = int(network.network_address)
+        net_last = int(network.broadcast_address)
+        start = net_first + start % network.num_addresses
+        targets = (struct.pack('!I', addr) for addr in itertools.chain(range(start, net_last + 1),
+                                                                        range(net_first, start)))
+        if progress is None:
+            progress = {}
+        progress.update(sent=0, complete=False)
+
+        template = self._template
+        view = self._recv_view
+        sock = self._sock
+        seen = set()
+
+        interval = 1.0 / pps
+        next_send = time.monotonic()
+        finish_at = None
+
+        while True:
+            if stop is not None and stop():
+                return
+            now = time.monotonic()
+
+            # 1. Envia tudo o que o orçamento de pps permite até agora
+            if finish_at is None:
+                while next_send <= now:
+                    if budget is not None:
+                        wait = budget.try_acquire('arp')
+                        if wait > 0:
+                            budget.record_throttled('arp', wait)
+                            next_send = now + wait
+                            break
+                    target = next(targets, None)
+                    if target is None:
+                        finish_at = now + timeout
+                        break
+                    template[_OFF_TARGET_IP:_OFF_TARGET_IP + 4] = target
+                    try:
+                        sock.send(template)
+                    except (BlockingIOError, InterruptedError):
+                        # Fila de envio cheia: tenta o mesmo alvo no próximo ciclo
+                        targets = _prepend(target, targets)
+                        break
+                    progress['sent'] += 1
+                    next_send += interval
+            elif now >= finish_at:
+                progress['complete'] = True
+                return
+
+            # 2. Drena as respostas disponíveis
+            wake_at = finish_at if finish_at is not None else next_send
+            readable, _, _ = select.select([sock], [], [], max(0.0, wake_at - time.monotonic()))
+            if not readable:
+                continue
+            while True:
+                try:
+                    nbytes = sock.recv_into(self._recv_buf)
+                except (BlockingIOError, InterruptedError):
+                    break
+                if nbytes < _FRAME_LEN:
+                    continue
+                sender_ip = bytes(view[_OFF_SENDER_IP:_OFF_SENDER_IP + 4])
+                if sender_ip in seen:
+                    continue
+                addr = int.from_bytes(sender_ip, 'big')
+                if addr < net_first or addr > net_last:
+                    continue
+                seen.add(sender_ip)
+                yield {
+                    'ip': socket.inet_ntoa(sender_ip),
+                    'mac': view[_OFF_SENDER_MAC:_OFF_SENDER_MAC + 6].hex(':')
+                }
+
+
+def _prepend(item, iterator):
+    yield item
+    yield from iterator
+
+
+def arp_sweep(network_cidr, iface, pps=500, timeout=1.0, budget=None, stop=None):
+    """Atalho: abre o scanner na interface, varre o CIDR e fecha o socket ao terminar."""
+    scanner = AfPacketArpScanner(iface)
+    try:
+        yield from scanner.sweep(network_cidr, pps=pps, timeout=timeout, budget=budget, stop=stop)
+    finally:
+        scanner.close()
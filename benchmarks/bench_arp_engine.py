@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# bench_arp_engine.py
+"""
+Benchmark: varredura ARP via scapy (discovery_arp) x motor AF_PACKET (arp_engine).
+
+Cria um namespace de rede com um par veth; o lado de dentro recebe N endereços
+IP (cada um responde ARP), e as duas implementações varrem o mesmo CIDR pelo
+lado de fora. Mede tempo de parede, tempo de CPU do processo e respostas obtidas.
+
+Uso (root, Linux):
+    sudo venv/bin/python benchmarks/bench_arp_engine.py --responders 1000 --prefix 20
+"""
+
+import argparse
+import ipaddress
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from scapy.all import arping  # noqa: E402
+
+import arp_engine  # noqa: E402
+
+NETNS = 'bench-arp'
+VETH_OUT = 'bench-arp0'
+VETH_IN = 'bench-arp1'
+
+
+def _ip(*args, stdin=None):
+    subprocess.run(['ip', *args], input=stdin, text=True, check=True)
+
+
+def setup(network, responders):
+    hosts = network.hosts()
+    local_ip = next(hosts)
+    _ip('netns', 'add', NETNS)
+    _ip('link', 'add', VETH_OUT, 'type', 'veth', 'peer', 'name', VETH_IN)
+    _ip('link', 'set', VETH_IN, 'netns', NETNS)
+    _ip('addr', 'add', f'{local_ip}/{network.prefixlen}', 'dev', VETH_OUT)
+    _ip('link', 'set', VETH_OUT, 'up')
+
+    batch = [f'addr add {next(hosts)}/{network.prefixlen} dev {VETH_IN}' for _ in range(responders)]
+    batch.append(f'link set {VETH_IN} up')
+    _ip('-n', NETNS, '-batch', '-', stdin='\n'.join(batch) + '\n')
+
+
+def teardown():
+    subprocess.run(['ip', 'link', 'del', VETH_OUT], stderr=subprocess.DEVNULL)
+    subprocess.run(['ip', 'netns', 'del', NETNS], stderr=subprocess.DEVNULL)
+
+
+def flush_neighbors():
+    subprocess.run(['ip', 'neigh', 'flush', 'dev', VETH_OUT], stderr=subprocess.DEVNULL)
+
+
+def measure(label, fn):
+    flush_neighbors()
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    found = fn()
+    cpu = time.process_time() - cpu_start
+    wall = time.perf_counter() - wall_start
+    print(f"  {label:<10} respostas={found:<6} parede={wall:7.3f}s  cpu={cpu:7.3f}s")
+    return wall, cpu
+
+
+def run_scapy(cidr, timeout):
+    ans, _ = arping(cidr, iface=VETH_OUT, timeout=timeout, verbose=False)
+    return len([{'ip': r.psrc, 'mac': r.hwsrc} for _, r in ans])
+
+
+def run_afpacket(cidr, timeout, pps):
+    return len(list(arp_engine.arp_sweep(cidr, VETH_OUT, pps=pps, timeout=timeout)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--prefix', type=int, default=20, help='prefixo do CIDR varrido (padrão: /20)')
+    parser.add_argument('--responders', type=int, default=1000, help='hosts que respondem ARP')
+    parser.add_argument('--pps', type=int, default=100000, help='taxa do motor AF_PACKET')
+    parser.add_argument('--timeout', type=float, default=1.0, help='espera final por respostas (s)')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    if os.geteuid() != 0:
+        print("Este benchmark precisa ser rodado como root (sudo).")
+        sys.exit(1)
+
+    network = ipaddress.ip_network(f'10.123.0.0/{args.prefix}')
+    cidr = str(network)
+    teardown()
+    try:
+        setup(network, args.responders)
+        print(f"CIDR {cidr} ({network.num_addresses} endereços), {args.responders} respondedores\n")
+        results = {'scapy': [], 'afpacket': []}
+        for i in range(args.repeat):
+            print(f"Rodada {i + 1}:")
+            results['scapy'].append(measure('scapy', lambda: run_scapy(cidr, args.timeout)))
+            results['afpacket'].append(measure('afpacket', lambda: run_afpacket(cidr, args.timeout, args.pps)))
+
+        print("\nMelhor rodada:")
+        best = {name: min(runs, key=lambda r: r[1]) for name, runs in results.items()}
+        for name, (wall, cpu) in best.items():
+            print(f"  {name:<10} parede={wall:7.3f}s  cpu={cpu:7.3f}s")
+        print(f"  CPU scapy/afpacket: {best['scapy'][1] / max(best['afpacket'][1], 1e-9):.1f}x")
+    finally:
+        teardown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# bench_arp_processes.py
+"""
+Benchmark: varredura ARP do modo 'process' (discovery_arp_processes) com 1, 2,
+4... processos sobre o mesmo CIDR.
+
+Usa o mesmo par veth/namespace de bench_arp_engine.py: o lado de dentro recebe
+N endereços IP (cada um responde ARP) e a varredura é feita pelo lado de fora,
+com uma taxa total alta (--pps), para que o custo seja a CPU do scapy
+(montagem e dissecação dos pacotes). Mede tempo de parede, respostas e o ganho em relação a 1 processo.
+
+Uso (root, Linux):
+    sudo venv/bin/python benchmarks/bench_arp_processes.py --responders 2000 --prefix 18
+"""
+
+import argparse
+import ipaddress
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import config  # noqa: E402
+import discovery  # noqa: E402
+import ratelimit  # noqa: E402
+from bench_arp_engine import VETH_OUT, flush_neighbors, setup, teardown  # noqa: E402
+
+
+def measure(cidr, processes, pps, timeout):
+    flush_neighbors()
+    # Sobe o pool antes de medir (o 'spawn' importa o scapy em cada processo)
+    pool = discovery._get_process_pool(processes)
+    list(pool.map(abs, range(processes)))
+
+    start = time.perf_counter()
+    found = len(list(discovery.discovery_arp_processes(cidr, processes, pps=pps, iface=VETH_OUT)))
+    wall = time.perf_counter() - start - timeout  # Desconta a espera final por respostas
+    return found, wall
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--prefix', type=int, default=18, help='prefixo do CIDR varrido (padrão: /18)')
+    parser.add_argument('--responders', type=int, default=2000, help='hosts que respondem ARP')
+    parser.add_argument('--processes', type=int, nargs='+',
+                        help='quantidades de processos a medir (padrão: 1, 2, 4... até o número de núcleos)')
+    parser.add_argument('--pps', type=int, default=20000, help='taxa total, dividida entre os processos')
+    parser.add_argument('--timeout', type=float, default=1.0, help='espera final por respostas (s)')
+    args = parser.parse_args()
+
+    if os.geteuid() != 0:
+        print("Este benchmark precisa ser rodado como root (sudo).")
+        sys.exit(1)
+
+    counts = args.processes
+    if not counts:
+        cores = os.cpu_count() or 1
+        counts = [1]
+        while counts[-1] * 2 <= cores:
+            counts.append(counts[-1] * 2)
+        if counts[-1] != cores:
+            counts.append(cores)
+
+    config.SCAN_TIMEOUT = args.timeout
+    ratelimit.get_budget().configure(total_pps=0, class_pps={'arp': 0})
+    network = ipaddress.ip_network(f'10.123.0.0/{args.prefix}')
+    cidr = str(network)
+    teardown()
+    try:
+        setup(network, args.responders)
+        print(f"CIDR {cidr} ({network.num_addresses} endereços), {args.responders} respondedores, "
+              f"{os.cpu_count()} núcleo(s)\n")
+        base = None
+        for processes in counts:
+            found, wall = measure(cidr, processes, args.pps, args.timeout)
+            base = base or wall
+            print(f"  processos={processes:<3} respostas={found:<6} parede={wall:7.3f}s  "
+                  f"ganho={base / max(wall, 1e-9):5.2f}x  (ideal {processes}x)")
+    finally:
+        teardown()
+
+
+if __name__ == '__main__':
+    main()
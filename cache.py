@@ -0,0 +1,188 @@
+# cache.py
+"""
+Caches em memória usados pelo orquestrador entre um ciclo e outro.
+
+EnrichmentCache guarda, por endereço MAC, o último resultado das sondagens
+caras (portas TCP, SNMP e fabricante), para que dispositivos que não mudaram
+não sejam sondados de novo a cada ciclo:
+- Validade configurável (TTL em segundos)
+- Tamanho máximo com descarte LRU
+- Invalidação quando o IP ou o TTL do ping do dispositivo mudam
+- Contadores de hits/misses expostos pela CLI
+
+SnmpCredentialCache lembra, por MAC, qual community SNMP funcionou por último
+e mantém um cache negativo com backoff exponencial (em ciclos de scan) para
+hosts que não responderam, evitando esperar SNMP_TIMEOUT neles a todo ciclo.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+import config
+
+
+class EnrichmentCache:
+    """Cache LRU com expiração, indexado por MAC e validado pelo IP/TTL atuais."""
+
+    def __init__(self, ttl=None, max_entries=None):
+        self.ttl = ttl if ttl is not None else config.ENRICHMENT_CACHE_TTL
+        self.max_entries = max_entries if max_entries is not None else config.ENRICHMENT_CACHE_MAX_ENTRIES
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, mac, ip, ping_ttl=None):
+        """
+        Retorna a entrada do MAC se ainda for válida para este IP/TTL, ou None.
+        Entradas vencidas ou de outro IP/TTL são removidas (invalidação).
+        """
+        with self._lock:
+            entry = self._entries.get(mac)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expired = time.time() - entry['stored_at'] > self.ttl
+            changed = entry['ip'] != ip or (ping_ttl is not None and entry['ping_ttl'] != ping_ttl)
+            if expired or changed:
+                del self._entries[mac]
+                self.invalidations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(mac)
+            self.hits += 1
+            return entry
+
+    def peek(self, mac):
+        """Retorna a entrada do MAC sem validar nem contar hit/miss (ou None)."""
+        with self._lock:
+            return self._entries.get(mac)
+
+    def put(self, mac, ip, ping_ttl, open_ports, snmp_info, producer, stored_at=None):
+        """Grava (ou substitui) o resultado das sondagens de um dispositivo."""
+        with self._lock:
+            self._entries[mac] = {
+                'ip': ip,
+                'ping_ttl': ping_ttl,
+                'open_ports': list(open_ports),
+                'snmp': dict(snmp_info or {}),
+                'producer': producer,
+                'stored_at': stored_at if stored_at is not None else time.time()
+            }
+            self._entries.move_to_end(mac)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, mac):
+        with self._lock:
+            if self._entries.pop(mac, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def stats(self):
+        """Retorna os contadores atuais (para exibição na CLI)."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits / lookups * 100.0) if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
+
+
+class SnmpCredentialCache:
+    """
+    Memória de credenciais SNMP e cache negativo por dispositivo (MAC).
+
+    Um host que não respondeu ao SNMP só volta a ser consultado após um número
+    de ciclos que dobra a cada falha (até SNMP_NEGATIVE_BACKOFF_MAX), ou antes
+    disso se suas portas abertas ou seu TTL mudarem.
+    """
+
+    def __init__(self, backoff_base=None, backoff_max=None):
+        self.backoff_base = backoff_base if backoff_base is not None else config.SNMP_NEGATIVE_BACKOFF_BASE
+        self.backoff_max = backoff_max if backoff_max is not None else config.SNMP_NEGATIVE_BACKOFF_MAX
+        self.cycle = 0
+        self._credentials = {}  # mac -> community que funcionou por último
+        self._negative = {}     # mac -> {'failures', 'retry_cycle', 'ports', 'ttl'}
+        self._lock = threading.Lock()
+        self.skipped = 0
+        self.retried = 0
+
+    def begin_cycle(self):
+        """Marca o início de um novo ciclo de scan (unidade do backoff)."""
+        with self._lock:
+            self.cycle += 1
+
+    def should_query(self, mac, open_ports, ping_ttl):
+        """Indica se o host deve ser consultado via SNMP neste ciclo."""
+        with self._lock:
+            entry = self._negative.get(mac)
+            if entry is None:
+                return True
+            changed = entry['ports'] != tuple(open_ports) or entry['ttl'] != ping_ttl
+            if changed or self.cycle >= entry['retry_cycle']:
+                self.retried += 1
+                return True
+            self.skipped += 1
+            return False
+
+    def candidates(self, mac):
+        """Communities a tentar, começando pela que funcionou por último neste MAC."""
+        communities = [config.SNMP_COMMUNITY] + [c for c in config.SNMP_COMMUNITIES if c != config.SNMP_COMMUNITY]
+        with self._lock:
+            remembered = self._credentials.get(mac)
+        if remembered:
+            communities = [remembered] + [c for c in communities if c != remembered]
+        return communities
+
+    def record_success(self, mac, community):
+        with self._lock:
+            self._credentials[mac] = community
+            self._negative.pop(mac, None)
+
+    def record_failure(self, mac, open_ports, ping_ttl):
+        with self._lock:
+            entry = self._negative.get(mac)
+            failures = entry['failures'] + 1 if entry else 1
+            backoff = min(self.backoff_base * 2 ** (failures - 1), self.backoff_max)
+            self._negative[mac] = {
+                'failures': failures,
+                'retry_cycle': self.cycle + backoff,
+                'ports': tuple(open_ports),
+                'ttl': ping_ttl
+            }
+
+    def clear(self):
+        with self._lock:
+            self._credentials.clear()
+            self._negative.clear()
+            self.skipped = self.retried = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'cycle': self.cycle,
+                'known_agents': len(self._credentials),
+                'negative_entries': len(self._negative),
+                'skipped': self.skipped,
+                'retried': self.retried
+            }
@@ -11,9 +11,16 @@ Implementa shell baseado em cmd.Cmd com comandos para:
 """
 
 import cmd
+import ipaddress
+import threading
+import time
+
 import config
 import database
 import discovery
+import metrics
+import ratelimit
+import retention
 
 class ControlShell(cmd.Cmd):
     """
@@ -23,9 +30,16 @@ class ControlShell(cmd.Cmd):
              "Dica: Para desativar as mensagens de status do orquestrador, digite 'silent on'.")
     prompt = config.CLI_PROMPT
 
-    def __init__(self, shared_state):
+    def __init__(self, shared_state, lock=None):
         super().__init__()
         self.shared_state = shared_state
+        # Mesmo lock usado pelo orquestrador e pelas threads das redes
+        self.lock = lock or threading.Lock()
+
+    def _network_states(self):
+        """Cópia do estado de cada rede, tirada sob o lock das threads das redes."""
+        with self.lock:
+            return {key: dict(net) for key, net in self.shared_state.get('network_states', {}).items()}
 
     def do_help(self, arg):
         """Lista os comandos disponíveis ou a ajuda de um comando específico."""
@@ -49,8 +63,22 @@ class ControlShell(cmd.Cmd):
         if status == 'rodando':
             print(f"  Próximo scan em: {next_scan_in:.0f} segundos")
 
+        nets = self._network_states()
+        for key, net in sorted(nets.items()):
+            st = net['scheduler'].stats()
+            if len(nets) > 1:
+                print(f"  Rede {key}: {net['device_count']} dispositivo(s), próximo scan em {net['next_scan_in']:.0f}s")
+            print(f"  Fila de sondagens: {st['queue_depth']} agendada(s), {st['overdue']} vencida(s)")
+            for name in ('flapping', 'recent', 'stable'):
+                print(f"    {name:<9} {st['per_class'][name]:>5} dispositivo(s)  a cada {st['intervals'][name]}s")
+            print(f"  Sondagens individuais: {st['probes']} ({st['changes']} com mudança)")
+            incomplete = net['scheduler'].incomplete()
+            if incomplete:
+                print(f"  Sondagens incompletas (prazo esgotado) a retomar: {incomplete}")
+
     def help_status(self):
-        print("Sintaxe: status\n  -> Mostra o estado atual do serviço (rodando/pausado) e o tempo para a próxima varredura.")
+        print("Sintaxe: status\n  -> Mostra o estado atual do serviço (rodando/pausado), o tempo para a próxima varredura\n"
+              "     e a fila de sondagens por dispositivo (profundidade e intervalo de cada classe).")
 
     def do_pause(self, arg):
         """Pausa o processo de descoberta automática."""
@@ -85,7 +113,7 @@ class ControlShell(cmd.Cmd):
         elif subcommand == 'view':
             self._scan_view(sub_args)
         elif subcommand == 'diff':
-            self._scan_diff()
+            self._scan_diff(sub_args)
         elif subcommand == 'rollback':
             self._scan_rollback(sub_args)
         else:
@@ -98,7 +126,7 @@ class ControlShell(cmd.Cmd):
         print("  run              - Força a execução de uma nova varredura.")
         print("  list [N]         - Lista os últimos N scans salvos (snapshots). Padrão: 10.")
         print("  view [ID]        - Mostra os dispositivos de um scan. Sem ID, mostra o último.")
-        print("  diff             - Mostra as mudanças (novos/offline) do último scan.")
+        print("  diff [CIDR]      - Mostra as mudanças (novos/offline) do último scan (da rede informada).")
         print("  rollback <ID>    - (Destrutivo) Restaura o banco para o estado de um scan antigo.")
 
     def _scan_run(self):
@@ -117,11 +145,14 @@ class ControlShell(cmd.Cmd):
             print("  -> Nenhum histórico de scan encontrado.")
             return
 
-        print(f"{'SCAN_ID':<8} {'TIMESTAMP':<26} {'TOTAL':<7} {'ONLINE'}")
-        print(f"{'-'*7:<8} {'-'*25:<26} {'-'*6:<7} {'-'*6}")
+        print(f"{'SCAN_ID':<8} {'TIMESTAMP':<26} {'REDE':<19} {'TOTAL':<7} {'ONLINE'}")
+        print(f"{'-'*7:<8} {'-'*25:<26} {'-'*18:<19} {'-'*6:<7} {'-'*6}")
         for r in history:
             online = r.get('online_count') or 0
-            print(f"{r.get('scan_id'):<8} {str(r.get('timestamp')):<26} {r.get('total',0):<7} {online}")
+            # Scan ainda sendo gravado em micro-lotes
+            in_progress = '  (em andamento)' if not r.get('complete', 1) else ''
+            print(f"{r.get('scan_id'):<8} {str(r.get('timestamp')):<26} {(r.get('network') or 'N/A'):<19} "
+                  f"{r.get('total',0):<7} {online}{in_progress}")
 
 
     def _scan_view(self, args):
@@ -134,6 +165,12 @@ class ControlShell(cmd.Cmd):
                 return
         
         devices = database.get_devices_for_scan_with_first_seen(scan_id)
+        if not devices and scan_id is not None:
+            # Scan podado pela retenção: lido do arquivo do dia
+            archived = retention.get_archived_scan(scan_id)
+            if archived is not None:
+                print(f"  (Scan arquivado em {archived['timestamp'][:10]}; lido de {config.ARCHIVE_DIR}.)")
+                devices = archived['devices']
         if not devices:
             print("  -> Nenhum dispositivo encontrado para este scan.")
             return
@@ -144,6 +181,7 @@ class ControlShell(cmd.Cmd):
         """Função auxiliar para imprimir tabelas de dispositivos de forma consistente."""
         print(f"{'IP':<18} {'MAC':<20} {'STATUS':<14} {'PAPEL':<10} {'FABRICANTE':<20} {'PORTAS ABERTAS'}")
         print(f"{'-'*17:<18} {'-'*19:<20} {'-'*13:<14} {'-'*9:<10} {'-'*19:<20} {'-'*20}")
+        partial = []
         for d in devices:
             # Formata a lista de portas para exibição
             ports = d.get('open_ports', [])
@@ -151,9 +189,16 @@ class ControlShell(cmd.Cmd):
                 ports_str = ",".join(map(str, ports))
             else:
                 ports_str = "N/A"
-            print(f"{(d.get('ip') or 'N/A'):<18} {(d.get('mac') or 'N/A'):<20} {(d.get('status') or 'N/A'):<14} {(d.get('role') or 'N/A'):<10} {(d.get('producer') or 'N/A'):<20} {ports_str}")
-    def _scan_diff(self):
-        changes = database.get_changes_for_last_scan()
+            status = d.get('status') or 'N/A'
+            # Sondagem interrompida pelo prazo do ciclo
+            if d.get('stages') is not None:
+                status += '*'
+                partial.append(d)
+            print(f"{(d.get('ip') or 'N/A'):<18} {(d.get('mac') or 'N/A'):<20} {status:<14} {(d.get('role') or 'N/A'):<10} {(d.get('producer') or 'N/A'):<20} {ports_str}")
+        for d in partial:
+            print(f"  * {d.get('ip')}: sondagem incompleta, estágios concluídos: {', '.join(d['stages']) or 'nenhum'}")
+    def _scan_diff(self, args):
+        changes = database.get_changes_for_last_scan(args[0] if args else None)
         new_list = changes.get('new', [])
         off_list = changes.get('offline', [])
 
@@ -202,6 +247,365 @@ class ControlShell(cmd.Cmd):
         print("Sintaxe: snmp test <ip>\n  -> Testa as credenciais SNMP básicas em um dispositivo.")
 
 
+    def do_cache(self, arg):
+        """Mostra ou limpa o cache de enriquecimento: cache [stats|clear]."""
+        cache = self.shared_state.get('enrichment_cache')
+        if cache is None:
+            print("  -> Cache de enriquecimento desativado.")
+            return
+
+        subcommand = (arg or 'stats').strip().lower()
+        if subcommand == 'stats':
+            s = cache.stats()
+            print("--- Cache de Enriquecimento (portas/SNMP/fabricante) ---")
+            print(f"  Entradas:      {s['entries']}/{s['max_entries']}")
+            print(f"  Validade:      {s['ttl']}s")
+            print(f"  Hits:          {s['hits']}")
+            print(f"  Misses:        {s['misses']}")
+            print(f"  Taxa de acerto: {s['hit_rate']:.1f}%")
+            print(f"  Invalidações:  {s['invalidations']}")
+            print(f"  Descartes LRU: {s['evictions']}")
+            snmp_cache = self.shared_state.get('snmp_cache')
+            if snmp_cache is not None:
+                n = snmp_cache.stats()
+                print("--- Cache SNMP (credenciais e negativo) ---")
+                print(f"  Agentes com credencial conhecida: {n['known_agents']}")
+                print(f"  Hosts em backoff:                 {n['negative_entries']}")
+                print(f"  Consultas evitadas:               {n['skipped']}")
+                print(f"  Novas tentativas:                 {n['retried']}")
+        elif subcommand == 'clear':
+            cache.clear()
+            cache.reset_stats()
+            if self.shared_state.get('snmp_cache') is not None:
+                self.shared_state['snmp_cache'].clear()
+            print("  -> Caches limpos. O próximo scan sondará todos os dispositivos.")
+        else:
+            self.help_cache()
+
+    def help_cache(self):
+        print("Gerencia o cache de enriquecimento por MAC.\n")
+        print("Uso: cache <subcomando>\n")
+        print("  stats  - Mostra entradas, hits/misses, invalidações, descartes e o cache SNMP.")
+        print("  clear  - Esvazia os caches (força nova sondagem completa).")
+
+
+    def do_budget(self, arg):
+        """Mostra ou zera os contadores do orçamento global de pacotes: budget [stats|reset]."""
+        budget = ratelimit.get_budget()
+        subcommand = (arg or 'stats').strip().lower()
+        if subcommand == 'stats':
+            s = budget.stats()
+            total = f"{s['total_pps']} pps" if s['total_pps'] else 'sem limite'
+            print(f"--- Orçamento de Pacotes (teto global: {total}) ---")
+            print(f"{'CLASSE':<6} {'LIMITE':>10} {'PACOTES':>10} {'ESPERAS':>8} {'TEMPO CONTIDO':>14}")
+            for name, c in s['classes'].items():
+                limit = f"{c['pps']} pps" if c['pps'] else 'global'
+                print(f"{name:<6} {limit:>10} {c['packets']:>10} {c['throttle_events']:>8} {c['throttled']:>13.1f}s")
+        elif subcommand == 'reset':
+            budget.reset_stats()
+            print("  -> Contadores do orçamento de pacotes zerados.")
+        else:
+            self.help_budget()
+
+    def help_budget(self):
+        print("Mostra o orçamento global de pacotes por segundo (ARP, ICMP, TCP e SNMP).\n")
+        print("Uso: budget <subcomando>\n")
+        print("  stats  - Limites, pacotes enviados e tempo em que cada classe ficou contida pelo limite.")
+        print("  reset  - Zera os contadores.")
+        print("Os limites são ajustados com 'config set budget <total|arp|icmp|tcp|snmp> <pps>' (0 = sem limite).")
+
+
+    def do_passive(self, arg):
+        """Mostra o inventário da descoberta passiva: passive [N]."""
+        listener = self.shared_state.get('passive_listener')
+        if listener is None:
+            print("  -> Descoberta passiva desativada. Use 'config set passive on'.")
+            return
+        try:
+            limit = int(arg) if arg.strip() else 20
+        except ValueError:
+            print("Erro: O limite deve ser um número inteiro.")
+            return
+
+        s = listener.stats()
+        print(f"  Escuta: {'ativa' if s['running'] else 'parada'} | Dispositivos: {s['devices']} | Pacotes ARP/DHCP: {s['packets']}")
+        entries = sorted(listener.snapshot(), key=lambda e: e['last_seen'], reverse=True)[:limit]
+        if not entries:
+            print("  -> Nenhum dispositivo observado ainda.")
+            return
+        now = time.time()
+        print(f"{'IP':<18} {'MAC':<20} {'VISTO HÁ':<10} {'ORIGEM'}")
+        print(f"{'-'*17:<18} {'-'*19:<20} {'-'*9:<10} {'-'*12}")
+        for e in entries:
+            age = f"{now - e['last_seen']:.0f}s"
+            print(f"{e['ip']:<18} {e['mac']:<20} {age:<10} {e['source']}")
+
+    def help_passive(self):
+        print("Sintaxe: passive [N]\n  -> Lista os N dispositivos vistos mais recentemente pela escuta passiva de ARP/DHCP (padrão: 20).")
+
+
+    def do_network(self, arg):
+        """Gerencia as redes monitoradas em paralelo: network [list|add|remove]."""
+        parts = (arg or 'list').strip().split()
+        subcommand = parts[0].lower()
+        networks = self.shared_state.setdefault('networks', [])
+
+        if subcommand == 'list':
+            nets = self._network_states()
+            if not networks:
+                print(f"  -> Monitorando uma única rede: {self.shared_state.get('network_cidr') or 'auto'}.")
+                print("     Use 'network add <CIDR>' para monitorar várias redes em paralelo.")
+                return
+            print(f"{'REDE':<19} {'INTERFACE':<12} {'INTERVALOS':<12} {'DISPOSITIVOS':<13} {'PRÓXIMO SCAN'}")
+            print(f"{'-'*18:<19} {'-'*11:<12} {'-'*11:<12} {'-'*12:<13} {'-'*12}")
+            for target in networks:
+                net = nets.get(target['cidr'])
+                intervals = (f"{target.get('interval_stable') or self.shared_state.get('interval_stable')}/"
+                             f"{target.get('interval_change') or self.shared_state.get('interval_change')}s")
+                count = net['device_count'] if net else 0
+                next_scan = f"{net['next_scan_in']:.0f}s" if net else 'aguardando'
+                print(f"{target['cidr']:<19} {(target.get('iface') or 'auto'):<12} {intervals:<12} {count:<13} {next_scan}")
+
+        elif subcommand == 'add' and len(parts) >= 2:
+            try:
+                cidr = str(ipaddress.ip_network(parts[1], strict=False))
+                target = {'cidr': cidr}
+                if len(parts) >= 3 and parts[2] != 'auto':
+                    target['iface'] = parts[2]
+                if len(parts) >= 4:
+                    target['interval_stable'] = int(parts[3])
+                if len(parts) >= 5:
+                    target['interval_change'] = int(parts[4])
+                if any(target.get(k, 1) <= 0 for k in ('interval_stable', 'interval_change')):
+                    raise ValueError("O intervalo deve ser positivo.")
+            except ValueError as e:
+                print(f"  -> Valor inválido. ({e})")
+                return
+            # Substituir a lista (em vez de alterá-la) evita que o orquestrador a veja pela metade
+            self.shared_state['networks'] = [t for t in networks if t['cidr'] != cidr] + [target]
+            print(f"  -> Rede {cidr} adicionada ao monitoramento (varredura inicia em instantes).")
+
+        elif subcommand == 'remove' and len(parts) == 2:
+            try:
+                cidr = str(ipaddress.ip_network(parts[1], strict=False))
+            except ValueError as e:
+                print(f"  -> Valor inválido. ({e})")
+                return
+            remaining = [t for t in networks if t['cidr'] != cidr]
+            if len(remaining) == len(networks):
+                print(f"  -> A rede {cidr} não está sendo monitorada.")
+                return
+            self.shared_state['networks'] = remaining
+            print(f"  -> Rede {cidr} removida do monitoramento."
+                  + ("" if remaining else " Voltando ao modo de rede única."))
+        else:
+            self.help_network()
+
+    def help_network(self):
+        print("Gerencia as redes monitoradas em paralelo pela mesma instância.\n")
+        print("Uso: network <subcomando> [argumentos]\n")
+        print("  list                                           - Lista as redes, interfaces, intervalos e próximo scan.")
+        print("  add <CIDR> [interface|auto] [estável] [mudança] - Adiciona (ou redefine) uma rede.")
+        print("  remove <CIDR>                                  - Para de monitorar uma rede.")
+        print("Sem redes na lista, é monitorada uma única rede ('config set network').")
+
+
+    def do_devices(self, arg):
+        """Inventário atual: devices [online|offline] [CIDR] ou devices <IP|MAC> [CIDR]."""
+        parts = (arg or '').strip().split()
+        status = None
+        if parts and parts[0].lower() in ('online', 'offline'):
+            status = parts.pop(0).lower()
+        elif parts and '/' not in parts[0]:
+            # Um dispositivo: consulta direta pelo IP ou MAC
+            device = database.get_current_device(parts[0], network=parts[1] if len(parts) > 1 else None)
+            if device is None:
+                print(f"  -> Dispositivo '{parts[0]}' não encontrado no inventário.")
+                return
+            self._print_device_table([device])
+            print(f"  Rede: {device.get('network') or 'N/A'} | Visto pela primeira vez: {str(device.get('first_seen'))[:19]}")
+            print(f"  Visto por último: {str(device.get('last_seen'))[:19]} | "
+                  f"Última mudança: {str(device['last_changed'])[:19]} | Mudanças: {device['changes']}")
+            return
+        devices = database.get_current_devices(network=parts[0] if parts else None, status=status)
+        if not devices:
+            print("  -> Nenhum dispositivo no inventário.")
+            return
+        print(f"{'REDE':<19} {'IP':<18} {'MAC':<20} {'STATUS':<9} {'PAPEL':<10} {'VISTO POR ÚLTIMO':<20} "
+              f"{'ÚLTIMA MUDANÇA':<20} {'MUDANÇAS'}")
+        print(f"{'-'*18:<19} {'-'*17:<18} {'-'*19:<20} {'-'*8:<9} {'-'*9:<10} {'-'*19:<20} {'-'*19:<20} {'-'*8}")
+        for d in devices:
+            print(f"{(d.get('network') or 'N/A'):<19} {(d.get('ip') or 'N/A'):<18} {d['mac']:<20} {d['status']:<9} "
+                  f"{(d.get('role') or 'N/A'):<10} {str(d.get('last_seen') or 'N/A')[:19]:<20} "
+                  f"{str(d['last_changed'])[:19]:<20} {d['changes']}")
+        online = sum(1 for d in devices if d['status'] == 'online')
+        print(f"  -> {len(devices)} dispositivo(s), {online} online.")
+
+    def help_devices(self):
+        print("Sintaxe: devices [online|offline] [CIDR] | devices <IP|MAC> [CIDR]\n"
+              "  -> Estado atual de cada dispositivo já visto em cada rede (tabela current_devices, mantida\n"
+              "     a cada scan): última vez visto online, última mudança de estado e número de mudanças.")
+
+
+    def do_events(self, arg):
+        """Feed de mudanças do inventário: events [N] (novos desde a última leitura) ou events last [N]."""
+        parts = (arg or '').strip().split()
+        last = bool(parts) and parts[0].lower() == 'last'
+        if last:
+            parts = parts[1:]
+        try:
+            limit = int(parts[0]) if parts else (20 if last else config.EVENTS_BATCH_SIZE)
+        except ValueError:
+            print("Erro: O limite deve ser um número inteiro.")
+            return
+        # A CLI é um consumidor como os outros: lê a partir do próprio cursor
+        events = database.get_last_events(limit) if last else database.read_events('cli', limit)
+        if not events:
+            print("  -> Nenhum evento novo." if not last else "  -> Nenhum evento registrado.")
+            return
+        print(f"{'ID':<8} {'DATA/HORA':<20} {'MAC':<20} {'EVENTO':<15} {'MUDANÇA'}")
+        print(f"{'-'*7:<8} {'-'*19:<20} {'-'*19:<20} {'-'*14:<15} {'-'*20}")
+        for e in events:
+            if e['type'] == 'appeared':
+                change = e['new_value'] or ''
+            elif e['type'] == 'disappeared':
+                change = e['old_value'] or ''
+            else:
+                change = f"{e['old_value'] or '-'} -> {e['new_value'] or '-'}"
+            print(f"{e['event_id']:<8} {str(e['timestamp'])[:19]:<20} {e['mac']:<20} {e['type']:<15} {change}")
+        if not last:
+            database.ack_events('cli', events[-1]['event_id'])
+            if len(events) == limit:
+                print("  -> Há mais eventos: execute 'events' novamente.")
+
+    def help_events(self):
+        print("Sintaxe: events [N] | events last [N]\n"
+              "  -> Mudanças do inventário (appeared, disappeared, ip/ports/role/vendor_changed).\n"
+              f"     'events' mostra os eventos ainda não lidos pela CLI (até {config.EVENTS_BATCH_SIZE} por vez)\n"
+              "     e avança o cursor; 'events last' mostra os N mais recentes sem mexer no cursor.")
+
+
+    def do_metrics(self, arg):
+        """Série de latência/perda/TTL de um dispositivo: metrics <IP|MAC> [latency|loss|ttl] [janela] [resolução]."""
+        parts = (arg or '').strip().split()
+        if not parts:
+            self.help_metrics()
+            return
+        metric = parts[1].lower() if len(parts) > 1 else 'latency'
+        if metric not in metrics.METRICS:
+            print("Erro: Métrica deve ser 'latency', 'loss' ou 'ttl'.")
+            return
+        try:
+            window = self._parse_window(parts[2] if len(parts) > 2 else '1h')
+        except ValueError:
+            print("Erro: Janela inválida. Use segundos ou um sufixo m/h/d (ex: 90m, 24h, 7d).")
+            return
+        resolution = parts[3].lower() if len(parts) > 3 else None
+        if resolution is not None and resolution != 'raw' and resolution not in metrics.TIERS:
+            print(f"Erro: Resolução deve ser 'raw' ou uma de {', '.join(metrics.TIERS)}.")
+            return
+
+        mac = self._resolve_mac(parts[0])
+        if mac is None:
+            print(f"  -> Dispositivo '{parts[0]}' não encontrado no último resultado de nenhuma rede.")
+            return
+        tier, points = metrics.query(mac, metric, time.time() - window, resolution=resolution)
+        print(f"  {metric} de {parts[0]} ({mac}) | janela {parts[2] if len(parts) > 2 else '1h'} | "
+              f"resolução {tier} | {len(points)} ponto(s)")
+        if not points:
+            print("  -> Sem medições nesta janela (agregados aparecem quando o intervalo fecha).")
+            return
+        print(f"{'INÍCIO':<20} {'MIN':>9} {'MÉDIA':>9} {'MAX':>9} {'P95':>9} {'AMOSTRAS':>9}")
+        print(f"{'-'*19:<20} {'-'*9:>9} {'-'*9:>9} {'-'*9:>9} {'-'*9:>9} {'-'*9:>9}")
+        for p in points:
+            when = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(p['ts']))
+            print(f"{when:<20} {p['min']:>9.2f} {p['avg']:>9.2f} {p['max']:>9.2f} {p['p95']:>9.2f} {p['count']:>9}")
+
+    def help_metrics(self):
+        print("Sintaxe: metrics <IP|MAC> [latency|loss|ttl] [janela] [raw|1m|1h|1d]\n"
+              "  -> Série da métrica na janela (padrão: latency, 1h). Sem resolução, usa a mais fina\n"
+              f"     com até {config.METRICS_MAX_POINTS} pontos (1m, 1h ou 1d: min/média/max/p95/amostras).")
+
+    @staticmethod
+    def _parse_window(text):
+        units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+        if text[-1].lower() in units:
+            seconds = float(text[:-1]) * units[text[-1].lower()]
+        else:
+            seconds = float(text)
+        if seconds <= 0:
+            raise ValueError(text)
+        return seconds
+
+    def _resolve_mac(self, target):
+        """MAC do dispositivo (aceita o próprio MAC ou o IP atual)."""
+        if ':' in target:
+            return target.lower()
+        device = database.get_current_device(target)
+        return device['mac'].lower() if device else None
+
+
+    def do_archive(self, arg):
+        """Histórico podado pela retenção: archive [list [N]|view <ID>|import <AAAA-MM-DD>|run]."""
+        parts = (arg or '').strip().split()
+        subcommand = parts[0].lower() if parts else 'list'
+        if subcommand == 'list':
+            try:
+                limit = int(parts[1]) if len(parts) > 1 else 10
+            except ValueError:
+                print("Erro: O limite deve ser um número inteiro.")
+                return
+            scans = retention.list_archived(limit)
+            if not scans:
+                print("  -> Nenhum scan arquivado.")
+                return
+            print(f"{'ID':<8} {'DATA/HORA':<22} {'REDE':<19} {'TOTAL':>6} {'ONLINE':>7}")
+            print(f"{'-'*7:<8} {'-'*21:<22} {'-'*18:<19} {'-'*6:>6} {'-'*7:>7}")
+            for s in scans:
+                print(f"{s['scan_id']:<8} {s['timestamp'][:19]:<22} {(s['network'] or 'N/A'):<19} "
+                      f"{s['total']:>6} {s['online_count']:>7}")
+        elif subcommand == 'view' and len(parts) > 1:
+            self._scan_view(parts[1:])
+        elif subcommand == 'import' and len(parts) > 1:
+            restored = retention.reimport_day(parts[1])
+            print(f"  -> {restored} scan(s) de {parts[1]} reimportado(s) (mantidos pela retenção).")
+        elif subcommand == 'run':
+            worker = self.shared_state.get('retention')
+            result = worker.run_now() if worker is not None else retention.run_once()
+            if result is not None:
+                print(f"  -> {result['archived']} scan(s) arquivado(s), {result['vacuumed']} passo(s) de vacuum.")
+        else:
+            self.help_archive()
+
+    def help_archive(self):
+        print("Sintaxe: archive [list [N] | view <ID> | import <AAAA-MM-DD> | run]\n"
+              "  -> Scans podados pela retenção (arquivos diários em ARCHIVE_DIR): lista, mostra,\n"
+              "     devolve ao banco os scans de um dia, ou executa uma passada de retenção agora.")
+
+
+    def do_collectors(self, arg):
+        """Mostra os coletores remotos conhecidos pela central."""
+        server = self.shared_state.get('ingest_server')
+        if server is None:
+            print("  -> Recepção de coletores desativada (INGEST_ENABLED em config.py).")
+            return
+        collectors = server.stats()
+        print(f"  Central aguardando coletores em {server.address}")
+        if not collectors:
+            print("  -> Nenhum coletor conectou ainda.")
+            return
+        now = time.time()
+        print(f"{'COLETOR':<20} {'REDE':<19} {'CONECTADO':<10} {'LOTES':>7} {'SCANS':>6} {'REENVIOS':>9} {'VISTO HÁ'}")
+        print(f"{'-'*19:<20} {'-'*18:<19} {'-'*9:<10} {'-'*7:>7} {'-'*6:>6} {'-'*9:>9} {'-'*8}")
+        for collector_id, c in sorted(collectors.items()):
+            age = f"{now - c['last_seen']:.0f}s" if c['last_seen'] else 'N/A'
+            print(f"{collector_id:<20} {(c['network'] or 'N/A'):<19} {'sim' if c['connected'] else 'não':<10} "
+                  f"{c['batches']:>7} {c['scans']:>6} {c['resent']:>9} {age}")
+
+    def help_collectors(self):
+        print("Sintaxe: collectors\n  -> Lista os coletores remotos (rede, conexão, lotes e scans recebidos, reenvios após reconexão).")
+
+
     def do_config(self, arg):
         """Gerencia configurações em tempo de execução: config [show|set <chave> <valor>]."""
         parts = (arg or '').strip().split()
@@ -237,6 +641,19 @@ class ControlShell(cmd.Cmd):
         print("  set snmp timeout <segundos>")
         print("  set snmp retries <numero>")
         print("  set snmp port <numero>")
+        print("  set workers <ping|ports|snmp> <numero>")
+        print("  set arp mode <sharded|single|process>")
+        print("  set arp engine <scapy|afpacket>")
+        print("  set arp pps <numero>")
+        print("  set arp shard <prefixo>")
+        print("  set arp processes <numero> (0 = um por núcleo)")
+        print("  set cache ttl <segundos>")
+        print("  set passive <on|off>")
+        print("  set neighbors <on|off>")
+        print("  set storage <full|delta>")
+        print("  set schedule <flapping|recent|stable> <segundos>")
+        print("  set budget <total|arp|icmp|tcp|snmp> <pps>")
+        print("  set deadline <cycle|discovery|ping|ports|snmp> <segundos>")
 
     def _config_show(self):
         st = self.shared_state
@@ -244,13 +661,36 @@ class ControlShell(cmd.Cmd):
         print(f"  Intervalo (rede estável): {st.get('interval_stable')}s")
         print(f"  Intervalo (rede mudou):   {st.get('interval_change')}s")
         print(f"  Timeout do Scan:          {st.get('scan_timeout')}s")
-        print(f"  Rede Alvo:                {st.get('network_cidr') or 'auto'}")
+        networks = [target['cidr'] for target in st.get('networks') or []]
+        print(f"  Rede Alvo:                {', '.join(networks) or st.get('network_cidr') or 'auto'}")
+        print(f"  Validade do Cache:        {st.get('cache_ttl', config.ENRICHMENT_CACHE_TTL)}s")
+        print(f"  Descoberta Passiva:       {'on' if st.get('passive_discovery', config.PASSIVE_DISCOVERY) else 'off'}")
+        print(f"  Tabela de Vizinhos:       {'on' if st.get('neighbor_seed', config.NEIGHBOR_SEED) else 'off'}")
+        print(f"  Armazenamento:            {st.get('db_storage', config.DB_STORAGE_MODE)}")
+        stages = st.get('stage_deadlines', config.STAGE_DEADLINES)
+        print(f"  Prazos (s):               ciclo={st.get('cycle_deadline', config.CYCLE_DEADLINE)} "
+              + ' '.join(f"{name}={seconds}" for name, seconds in stages.items()))
+        budget_classes = st.get('budget_class_pps', config.PACKET_BUDGET_CLASS_PPS)
+        print(f"  Orçamento (pps):          total={st.get('budget_pps', config.PACKET_BUDGET_PPS)} "
+              + ' '.join(f"{name}={budget_classes[name]}" for name in ratelimit.CLASSES))
+        intervals = st.get('scheduler_intervals', config.SCHEDULER_INTERVALS)
+        print(f"  Agendador (s):            flapping={intervals['flapping']} recent={intervals['recent']} stable={intervals['stable']}")
         print("  SNMP:")
         print(f"    Versão:    {st.get('snmp_version', '2c')}")
         print(f"    Community: {st.get('snmp_community', 'public')}")
         print(f"    Timeout:   {st.get('snmp_timeout', 1)}s")
         print(f"    Retries:   {st.get('snmp_retries', 0)}")
         print(f"    Porta:     {st.get('snmp_port', 161)}")
+        print("  Concorrência da Sondagem:")
+        print(f"    Ping:      {st.get('ping_workers', config.PING_WORKERS)}")
+        print(f"    Portas:    {st.get('port_workers', config.PORT_SCAN_WORKERS)}")
+        print(f"    SNMP:      {st.get('snmp_workers', config.SNMP_WORKERS)}")
+        print("  Varredura ARP:")
+        print(f"    Modo:      {st.get('arp_mode', config.ARP_SWEEP_MODE)}")
+        print(f"    Motor:     {st.get('arp_engine', config.ARP_ENGINE)}")
+        print(f"    Taxa:      {st.get('arp_pps', config.ARP_PPS)} pps")
+        print(f"    Shard:     /{st.get('arp_shard_prefix', config.ARP_SHARD_PREFIX)}")
+        print(f"    Processos: {st.get('arp_processes', config.ARP_PROCESSES) or 'um por núcleo'}")
 
     def _config_set(self, key, value):
         st = self.shared_state
@@ -284,6 +724,8 @@ class ControlShell(cmd.Cmd):
                         return
                     st['network_cidr'] = val
                     print(f"  -> Rede alvo atualizada para '{val}'.")
+                if st.get('networks'):
+                    print("     (Vale apenas no modo de rede única; use 'network add/remove' para a lista de redes.)")
             
             elif key == 'snmp':
                 parts = value.split()
@@ -310,6 +752,125 @@ class ControlShell(cmd.Cmd):
                     print(f"  -> SNMP {k} atualizado para {ival}.")
                 else:
                     print(f"  -> Parâmetro SNMP '{k}' desconhecido.")
+
+            elif key == 'workers':
+                parts = value.split()
+                stage_keys = {'ping': 'ping_workers', 'ports': 'port_workers', 'snmp': 'snmp_workers'}
+                if len(parts) != 2 or parts[0] not in stage_keys:
+                    print("  -> Uso: config set workers [ping|ports|snmp] <numero>")
+                    return
+                ival = int(parts[1])
+                if ival <= 0: raise ValueError("O número de workers deve ser positivo.")
+                st[stage_keys[parts[0]]] = ival
+                print(f"  -> Workers do estágio '{parts[0]}' atualizados para {ival}.")
+
+            elif key == 'arp':
+                parts = value.split()
+                if len(parts) != 2 or parts[0] not in ('mode', 'engine', 'pps', 'shard', 'processes'):
+                    print("  -> Uso: config set arp [mode|engine|pps|shard|processes] <valor>")
+                    return
+                k, v = parts
+                if k == 'engine':
+                    if v not in ('scapy', 'afpacket'):
+                        print("  -> Motor ARP inválido. Use 'scapy' ou 'afpacket'.")
+                        return
+                    st['arp_engine'] = v
+                    print(f"  -> Motor ARP atualizado para '{v}'.")
+                elif k == 'mode':
+                    if v not in ('sharded', 'single', 'process'):
+                        print("  -> Modo ARP inválido. Use 'sharded', 'single' ou 'process'.")
+                        return
+                    st['arp_mode'] = v
+                    print(f"  -> Modo da varredura ARP atualizado para '{v}'.")
+                elif k == 'pps':
+                    ival = int(v)
+                    if ival <= 0: raise ValueError("A taxa deve ser positiva.")
+                    st['arp_pps'] = ival
+                    print(f"  -> Taxa ARP atualizada para {ival} pps.")
+                elif k == 'processes':
+                    ival = int(v)
+                    if ival < 0: raise ValueError("O número de processos deve ser não-negativo.")
+                    st['arp_processes'] = ival
+                    print(f"  -> Processos da varredura ARP atualizados para {ival or 'um por núcleo'}.")
+                else:
+                    ival = int(v)
+                    if not 8 <= ival <= 32: raise ValueError("O prefixo do shard deve estar entre 8 e 32.")
+                    st['arp_shard_prefix'] = ival
+                    print(f"  -> Tamanho do shard ARP atualizado para /{ival}.")
+
+            elif key == 'cache':
+                parts = value.split()
+                if len(parts) != 2 or parts[0] != 'ttl':
+                    print("  -> Uso: config set cache ttl <segundos>")
+                    return
+                ival = int(parts[1])
+                if ival < 0: raise ValueError("A validade deve ser não-negativa.")
+                st['cache_ttl'] = ival
+                print(f"  -> Validade do cache de enriquecimento atualizada para {ival}s.")
+
+            elif key == 'passive':
+                val = value.strip().lower()
+                if val not in ('on', 'off'):
+                    print("  -> Uso: config set passive <on|off>")
+                    return
+                st['passive_discovery'] = val == 'on'
+                print(f"  -> Descoberta passiva {'ativada' if val == 'on' else 'desativada'} (aplicada no próximo ciclo).")
+
+            elif key == 'deadline':
+                parts = value.split()
+                stages = st.setdefault('stage_deadlines', dict(config.STAGE_DEADLINES))
+                if len(parts) != 2 or (parts[0] != 'cycle' and parts[0] not in stages):
+                    print("  -> Uso: config set deadline <cycle|discovery|ping|ports|snmp> <segundos>")
+                    return
+                ival = int(parts[1])
+                if ival < 0: raise ValueError("O prazo deve ser não-negativo.")
+                if parts[0] == 'cycle':
+                    st['cycle_deadline'] = ival
+                else:
+                    stages[parts[0]] = ival
+                print(f"  -> Prazo '{parts[0]}' atualizado para {ival}s{' (sem prazo)' if ival == 0 else ''} (aplicado no próximo ciclo).")
+
+            elif key == 'budget':
+                parts = value.split()
+                if len(parts) != 2 or parts[0] not in ('total',) + ratelimit.CLASSES:
+                    print("  -> Uso: config set budget <total|arp|icmp|tcp|snmp> <pps>")
+                    return
+                ival = int(parts[1])
+                if ival < 0: raise ValueError("A taxa deve ser não-negativa.")
+                if parts[0] == 'total':
+                    st['budget_pps'] = ival
+                    ratelimit.get_budget().configure(total_pps=ival)
+                else:
+                    st.setdefault('budget_class_pps', dict(config.PACKET_BUDGET_CLASS_PPS))[parts[0]] = ival
+                    ratelimit.get_budget().configure(class_pps={parts[0]: ival})
+                print(f"  -> Orçamento '{parts[0]}' atualizado para {ival} pps{' (sem limite)' if ival == 0 else ''}.")
+
+            elif key == 'schedule':
+                parts = value.split()
+                intervals = st.setdefault('scheduler_intervals', dict(config.SCHEDULER_INTERVALS))
+                if len(parts) != 2 or parts[0] not in intervals:
+                    print("  -> Uso: config set schedule <flapping|recent|stable> <segundos>")
+                    return
+                ival = int(parts[1])
+                if ival <= 0: raise ValueError("O intervalo deve ser positivo.")
+                intervals[parts[0]] = ival
+                print(f"  -> Intervalo da classe '{parts[0]}' atualizado para {ival}s (aplicado nos próximos agendamentos).")
+
+            elif key == 'neighbors':
+                val = value.strip().lower()
+                if val not in ('on', 'off'):
+                    print("  -> Uso: config set neighbors <on|off>")
+                    return
+                st['neighbor_seed'] = val == 'on'
+                print(f"  -> Importação da tabela de vizinhos {'ativada' if val == 'on' else 'desativada'}.")
+
+            elif key == 'storage':
+                val = value.strip().lower()
+                if val not in ('full', 'delta'):
+                    print("  -> Uso: config set storage <full|delta>")
+                    return
+                st['db_storage'] = val
+                print(f"  -> Armazenamento do histórico definido para '{val}' (vale a partir do próximo scan).")
             else:
                 print(f"  -> Chave de configuração '{key}' desconhecida.")
 
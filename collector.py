@@ -0,0 +1,260 @@
+# collector.py
+"""
+Coletor remoto: roda a descoberta e a sondagem em outra máquina e envia os
+resultados para a central (ingest.IngestServer), que grava no banco.
+
+Usado em segmentos que a central não alcança por ARP (roteadores no meio).
+Cada ciclo do coletor (ARP + sondagem concorrente, como no orquestrador) vira
+um scan na central, enviado em lotes compactos e comprimidos:
+- Os lotes ficam em uma fila local até a confirmação da central
+- No máximo COLLECTOR_WINDOW lotes em trânsito sem confirmação
+- Com COLLECTOR_OUTBOX lotes pendentes, o ciclo seguinte espera (backpressure)
+- Conexão perdida: reconecta com espera exponencial e retoma do último lote
+  confirmado (ver o protocolo em ingest.py)
+
+Uso:
+    sudo venv/bin/python collector.py --central 10.0.0.5:9750 --network 10.20.0.0/24
+    sudo venv/bin/python collector.py --central unix:/tmp/discovery-ingest.sock --network 192.168.1.0/24
+"""
+
+import argparse
+import socket
+import threading
+import time
+import uuid
+from collections import deque
+
+import config
+import discovery
+import ingest
+import utils
+from deadline import ScanDeadline
+from probe_engine import ProbeEngine
+
+
+class Collector:
+    """
+    Fila de lotes e conexão com a central. 'submit_scan' enfileira um scan
+    (chamado pelo laço de coleta); uma thread própria envia e reenvia os lotes.
+    """
+
+    def __init__(self, address, network, collector_id=None, token=None,
+                 batch_size=None, window=None, outbox=None):
+        self.address = address
+        self.network = network
+        self.collector_id = collector_id or socket.gethostname()
+        self.token = token if token is not None else config.INGEST_TOKEN
+        self.batch_size = batch_size or config.COLLECTOR_BATCH_SIZE
+        self.window = window or config.COLLECTOR_WINDOW
+        self.outbox_max = outbox or config.COLLECTOR_OUTBOX
+        # Numeração dos lotes recomeça a cada processo: a sessão diferencia para a central
+        self.session = uuid.uuid4().hex
+        self._outbox = deque()   # {'seq', 'scan', 'final', 'devices'} ainda não descartados
+        self._acked = 0          # Maior seq confirmado pela central
+        self._next_seq = 1
+        self._scan = 0
+        self._sent = 0           # Maior seq enviado na conexão atual
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+        self.connected = False
+        self.reconnects = 0
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run_sender, name='collector-sender', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+
+    def _unacked(self):
+        return sum(1 for batch in self._outbox if batch['seq'] > self._acked)
+
+    def submit_scan(self, devices):
+        """Divide o scan em lotes e os enfileira; espera se a fila de pendentes estiver cheia."""
+        with self._cond:
+            self._scan += 1
+            scan = self._scan
+        batch = []
+        for device in devices:
+            batch.append(ingest.pack_device(device))
+            if len(batch) >= self.batch_size:
+                self._enqueue(scan, batch, final=False)
+                batch = []
+        self._enqueue(scan, batch, final=True)
+
+    def _enqueue(self, scan, devices, final):
+        with self._cond:
+            while self._running and self._unacked() >= self.outbox_max:
+                self._cond.wait(1)
+            self._outbox.append({'type': 'batch', 'seq': self._next_seq, 'scan': scan,
+                                 'final': final, 'devices': devices})
+            self._next_seq += 1
+            self._cond.notify_all()
+
+    def wait_idle(self, timeout=None):
+        """Espera até a central confirmar todos os lotes enfileirados."""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._cond:
+            while self._outbox:
+                remaining = deadline - time.monotonic() if deadline is not None else 1
+                if remaining <= 0:
+                    return False
+                self._cond.wait(min(remaining, 1))
+            return True
+
+    def _on_ack(self, seq):
+        with self._cond:
+            self._acked = max(self._acked, seq)
+            self._discard_committed()
+            self._cond.notify_all()
+
+    def _discard_committed(self):
+        # Um scan só sai da fila quando o lote final foi confirmado (a central já gravou)
+        last_final = max((b['seq'] for b in self._outbox if b['final'] and b['seq'] <= self._acked), default=0)
+        while self._outbox and self._outbox[0]['seq'] <= last_final:
+            self._outbox.popleft()
+
+    def _connect(self):
+        family, addr = ingest.parse_address(self.address)
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.settimeout(config.COLLECTOR_CONNECT_TIMEOUT)
+        sock.connect(addr)
+        ingest.send_frame(sock, {'type': 'hello', 'collector': self.collector_id, 'session': self.session,
+                                 'network': self.network, 'token': self.token})
+        welcome = ingest.recv_frame(sock)
+        if not welcome or welcome.get('type') != 'welcome':
+            sock.close()
+            raise ConnectionError((welcome or {}).get('reason', 'central recusou a conexão'))
+        sock.settimeout(None)
+        with self._cond:
+            # Retoma do último lote que a central recebeu nesta sessão
+            self._acked = max(self._acked, welcome['last_seq'])
+            self._discard_committed()
+            self._sent = welcome['last_seq']
+        return sock
+
+    def _run_sender(self):
+        backoff = 1
+        while self._running:
+            try:
+                sock = self._connect()
+            except (OSError, ConnectionError, ValueError) as e:
+                print(f"(Coletor: Central indisponível em {self.address} ({e}); nova tentativa em {backoff}s.)")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, config.COLLECTOR_RECONNECT_MAX)
+                self.reconnects += 1
+                continue
+            backoff = 1
+            self.connected = True
+            print(f"(Coletor: Conectado à central {self.address}.)")
+            reader = threading.Thread(target=self._read_acks, args=(sock,), name='collector-acks', daemon=True)
+            reader.start()
+            try:
+                self._send_loop(sock, reader)
+            except OSError as e:
+                print(f"(Coletor: Conexão perdida ({e}).)")
+            finally:
+                self.connected = False
+                try:
+                    sock.close()
+                except OSError:
+                    pass
+                reader.join(timeout=1)
+
+    def _send_loop(self, sock, reader):
+        while self._running and reader.is_alive():
+            with self._cond:
+                pending = [b for b in self._outbox if b['seq'] > self._sent]
+                in_flight = self._sent - self._acked
+                if not pending or in_flight >= self.window:
+                    self._cond.wait(0.5)
+                    continue
+                batch = pending[0]
+                self._sent = batch['seq']
+            ingest.send_frame(sock, batch)
+
+    def _read_acks(self, sock):
+        try:
+            while True:
+                message = ingest.recv_frame(sock)
+                if message is None:
+                    break
+                if message.get('type') == 'ack':
+                    self._on_ack(message['seq'])
+        except (OSError, ValueError):
+            pass
+        finally:
+            with self._cond:
+                self._cond.notify_all()
+
+
+def _discover(network_cidr, iface, deadline, seeded):
+    """
+    Vizinhos do kernel primeiro, depois a varredura ARP (sem repetir MACs).
+    Os MACs do kernel ficam em 'seeded' até a varredura ARP confirmá-los.
+    """
+    seen = set()
+    seed = discovery.discovery_neighbors(network_cidr, iface) if config.NEIGHBOR_SEED else []
+    for device in seed:
+        seen.add(device['mac'].lower())
+        seeded.add(device['mac'].lower())
+        yield device
+    for device in discovery.discovery_arp_stream(network_cidr, deadline=deadline, iface=iface):
+        mac = device['mac'].lower()
+        seeded.discard(mac)
+        if mac not in seen:
+            seen.add(mac)
+            yield device
+
+
+def collect_network(network_cidr, iface, engine):
+    """Um ciclo de descoberta + sondagem (os mesmos estágios do orquestrador), em streaming."""
+    deadline = ScanDeadline()
+    seeded = set()
+    held = []
+    for device in engine.probe_stream(_discover(network_cidr, iface, deadline, seeded),
+                                      utils.get_default_gateway_ip(), deadline):
+        # Vizinho do kernel sem resposta ao ping: só entra se a varredura ARP o confirmar
+        if device['mac'].lower() in seeded and device.get('status') != 'online':
+            held.append(device)
+            continue
+        yield device
+    for device in held:
+        if device['mac'].lower() not in seeded:
+            yield device
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--central', required=True, help="endereço da central: host:porta ou unix:/caminho")
+    parser.add_argument('--network', required=True, help='CIDR varrido por este coletor')
+    parser.add_argument('--iface', help='interface de saída (padrão: a da rota para a rede)')
+    parser.add_argument('--id', help='identificação do coletor (padrão: hostname)')
+    parser.add_argument('--interval', type=int, default=config.POLLING_INTERVAL_CHANGE,
+                        help='segundos entre ciclos')
+    parser.add_argument('--token', help='token compartilhado com a central (INGEST_TOKEN)')
+    args = parser.parse_args()
+
+    collector = Collector(args.central, args.network, args.id, args.token)
+    collector.start()
+    engine = ProbeEngine()
+    try:
+        while True:
+            started = time.monotonic()
+            collector.submit_scan(collect_network(args.network, args.iface, engine))
+            print(f"(Coletor: Scan de {args.network} enfileirado; próximo em {args.interval}s.)")
+            time.sleep(max(0, args.interval - (time.monotonic() - started)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        collector.wait_idle(timeout=10)
+        collector.stop()
+        engine.shutdown()
+
+
+if __name__ == '__main__':
+    main()
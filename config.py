@@ -50,10 +50,195 @@ SNMP_TIMEOUT = 3
 SNMP_RETRIES = 0
 # Porta SNMP padrão
 SNMP_PORT = 161
+# Máximo de consultas SNMP em andamento no motor compartilhado
+SNMP_MAX_CONCURRENT = 256
+# Communities alternativas, tentadas depois de SNMP_COMMUNITY em hosts ainda sem credencial conhecida.
+SNMP_COMMUNITIES = []
+# Cache negativo: hosts sem resposta SNMP só são consultados de novo após
+# BASE, 2*BASE, 4*BASE... ciclos de scan (limitado a MAX), ou quando portas/TTL mudam.
+SNMP_NEGATIVE_BACKOFF_BASE = 2
+SNMP_NEGATIVE_BACKOFF_MAX = 32
 
 # --- Configurações do Scan de Portas ---
 # Lista de portas TCP comuns para uma verificação rápida de serviços.
 PORTS_TO_SCAN = [21, 22, 23, 80, 443, 3389, 5900, 8080]
 
 # Timeout em segundos para cada tentativa de conexão de porta.
-PORT_SCAN_TIMEOUT = 0.5
\ No newline at end of file
+PORT_SCAN_TIMEOUT = 0.5
+
+# Limite global de sockets abertos simultaneamente pelo scanner de portas
+# (mantenha abaixo do 'ulimit -n' do processo).
+PORT_SCAN_MAX_SOCKETS = 512
+# Os hosts que chegam ao estágio de portas dentro desta janela (s) são
+# escaneados juntos, em uma única chamada ao scanner (um selector por lote).
+PORT_BATCH_WINDOW = 0.05
+
+# --- Configurações do Motor de Sondagem Concorrente ---
+# Número máximo de hosts processados simultaneamente em cada estágio de sondagem.
+PING_WORKERS = 64
+PORT_SCAN_WORKERS = 32
+SNMP_WORKERS = 128
+
+# --- Configurações do Ping ---
+# Usa o motor ICMP nativo (raw socket, requer root). Se False ou indisponível, usa o ping do sistema.
+ICMP_RAW_SOCKET = True
+# Número de Echo Requests por host, intervalo entre rodadas e espera final (segundos).
+PING_COUNT = 10
+PING_INTERVAL = 0.2
+PING_TIMEOUT = 1
+# Com o motor nativo, os pings dos workers que chegam dentro desta janela (s) saem
+# juntos em uma única rodada de ping_many (uma rodada por lote de hosts).
+PING_BATCH_WINDOW = 0.05
+
+# --- Configurações da Varredura ARP ---
+# Modo da varredura: 'sharded' (shards com taxa limitada, resultados em streaming),
+# 'single' (um único arping sobre todo o CIDR) ou 'process' (CIDR dividido entre
+# processos, para segmentos grandes em que o scapy satura um núcleo).
+ARP_SWEEP_MODE = "sharded"
+# Tamanho de cada shard (prefixo CIDR) e taxa máxima de requisições ARP por segundo.
+ARP_SHARD_PREFIX = 24
+ARP_PPS = 500
+# Processos do modo 'process' (0 = um por núcleo de CPU).
+ARP_PROCESSES = 0
+# Motor de pacotes ARP: 'scapy' (portável) ou 'afpacket' (Linux, socket AF_PACKET
+# com frame pré-montado e filtro BPF; bem mais leve em CPU para segmentos grandes).
+ARP_ENGINE = "scapy"
+
+# --- Configurações do Cache de Enriquecimento ---
+# Tempo (segundos) em que o resultado de portas/SNMP/fabricante de um MAC é reaproveitado.
+ENRICHMENT_CACHE_TTL = 600
+# Número máximo de dispositivos no cache (descarte LRU).
+ENRICHMENT_CACHE_MAX_ENTRIES = 4096
+
+# --- Gravação em Micro-lotes ---
+# Durante uma varredura, os dispositivos prontos são gravados em lotes de até
+# DB_BATCH_SIZE, ou a cada DB_BATCH_INTERVAL segundos.
+DB_BATCH_SIZE = 64
+DB_BATCH_INTERVAL = 0.5
+
+# --- Armazenamento do Histórico ---
+# 'full': cada scan grava uma linha por dispositivo (tabela devices).
+# 'delta': grava intervalos de validade (tabela device_states); uma linha nova só
+# quando algum campo do dispositivo muda, e o banco cresce com as mudanças da
+# rede, não com a frequência dos scans. As leituras reconstroem qualquer scan nos
+# dois modos (o histórico pode misturar os dois). Em 'delta', latência e perda
+# não abrem intervalo novo: o intervalo guarda a última medição.
+DB_STORAGE_MODE = "full"
+
+# --- Métricas de QoS (Séries Temporais) ---
+# Latência, perda e TTL de cada sondagem, agregados em 1 minuto, 1 hora e 1 dia
+# (min/média/max/p95/contagem) para consultas por janela (comando 'metrics').
+METRICS_ENABLED = True
+# Retenção por resolução, em segundos ('raw' = amostras brutas; 0 = sem limite).
+METRICS_RETENTION = {'raw': 2 * 86400, '1m': 14 * 86400, '1h': 180 * 86400, '1d': 5 * 365 * 86400}
+# Sem resolução explícita, a consulta usa a mais fina com até este número de pontos.
+METRICS_MAX_POINTS = 500
+
+# --- Retenção e Arquivamento do Histórico ---
+# Por rede: todos os scans dos últimos RETENTION_FULL_DAYS dias, depois o último
+# de cada hora até RETENTION_HOURLY_DAYS dias, depois o último de cada dia (até
+# RETENTION_DAILY_DAYS dias; 0 = para sempre). Os scans podados vão para arquivos
+# diários comprimidos em ARCHIVE_DIR (comando 'archive').
+RETENTION_ENABLED = True
+RETENTION_FULL_DAYS = 7
+RETENTION_HOURLY_DAYS = 90
+RETENTION_DAILY_DAYS = 0
+ARCHIVE_DIR = "archive"
+# Intervalo entre passadas (s), scans por transação e páginas por passo de vacuum.
+RETENTION_INTERVAL = 3600
+RETENTION_BATCH = 200
+VACUUM_STEP_PAGES = 256
+
+# --- Feed de Eventos ---
+# Mudanças do inventário (appeared, disappeared, ip/ports/role/vendor_changed)
+# gravadas em device_events na mesma transação do scan. Cada consumidor lê a
+# partir do seu cursor, em lotes de até EVENTS_BATCH_SIZE eventos (comando 'events').
+EVENTS_BATCH_SIZE = 100
+# Eventos mais antigos que isto (dias) são apagados pela retenção (0 = nunca),
+# desde que todos os consumidores já os tenham lido.
+EVENTS_RETENTION_DAYS = 90
+
+# --- Conexões com o Banco ---
+# Uma conexão de escrita (em thread própria, alimentada por uma fila) e um pool
+# de conexões de leitura, todas persistentes. Com WAL, as leituras da CLI não
+# esperam pelos commits do orquestrador.
+DB_JOURNAL_MODE = "WAL"
+# NORMAL: em WAL, sem fsync a cada commit (um commit recente pode se perder numa
+# queda de energia, mas o banco não corrompe). FULL para durabilidade total.
+DB_SYNCHRONOUS = "NORMAL"
+# Cache de páginas por conexão (KiB).
+DB_CACHE_SIZE_KB = 16384
+# Conexões de leitura simultâneas (CLI, warm start, central de coletores).
+DB_READ_CONNECTIONS = 4
+# Comandos SQL preparados mantidos por conexão (reaproveitados entre chamadas).
+DB_STATEMENT_CACHE = 128
+
+# --- Prazos do Ciclo de Scan ---
+# Duração máxima de um ciclo (s, 0 = sem prazo). Ao esgotar, sondagens pendentes
+# são canceladas e o scan é salvo com os resultados parciais.
+CYCLE_DEADLINE = 120
+# Segundos (desde o início do ciclo) após os quais cada estágio deixa de ser iniciado.
+# Uma varredura ARP interrompida é retomada de onde parou no ciclo seguinte.
+STAGE_DEADLINES = {'discovery': 60, 'ping': 90, 'ports': 105, 'snmp': 115}
+
+# --- Orçamento Global de Pacotes ---
+# Teto de pacotes por segundo somando ARP, ICMP, TCP e SNMP (0 = sem limite).
+PACKET_BUDGET_PPS = 2000
+# Sub-orçamento de cada classe de sondagem (0 = limitado apenas pelo teto global).
+PACKET_BUDGET_CLASS_PPS = {'arp': 1000, 'icmp': 1000, 'tcp': 1000, 'snmp': 500}
+# Rajada máxima permitida, em segundos de taxa acumulada.
+PACKET_BUDGET_BURST = 0.1
+
+# --- Agendador de Sondagens por Dispositivo ---
+# Entre as varreduras da sub-rede, cada dispositivo é sondado de novo conforme sua classe:
+# 'flapping' (mudou SCHEDULER_FLAP_CHANGES vezes em SCHEDULER_FLAP_WINDOW s),
+# 'recent' (mudou nos últimos SCHEDULER_RECENT_WINDOW s) ou 'stable'. Intervalos em segundos.
+SCHEDULER_INTERVALS = {'flapping': 5, 'recent': 30, 'stable': 300}
+SCHEDULER_FLAP_CHANGES = 3
+SCHEDULER_FLAP_WINDOW = 300
+SCHEDULER_RECENT_WINDOW = 600
+
+# --- Warm Start ---
+# Ao iniciar, carrega o último scan do banco: o detector de mudanças e os caches
+# partem do inventário anterior e os hosts conhecidos são sondados primeiro.
+WARM_START = True
+
+# --- Tabela de Vizinhos do Kernel ---
+# Antes da varredura ARP, importa os vizinhos já resolvidos (/proc/net/arp) da
+# interface ativa; eles entram na sondagem imediatamente e o ARP completa o resto.
+NEIGHBOR_SEED = True
+
+# --- Configurações da Descoberta Passiva ---
+# Escuta ARP/DHCP na interface ativa e mantém um inventário sem enviar pacotes.
+PASSIVE_DISCOVERY = False
+# Hosts vistos passivamente há até N segundos são considerados online sem ping.
+PASSIVE_FRESHNESS = 120
+# Com a escuta passiva ativa, os intervalos entre varreduras ativas são multiplicados por este fator.
+PASSIVE_INTERVAL_FACTOR = 3
+
+# --- Múltiplas Redes ---
+# Redes monitoradas em paralelo pela mesma instância (mesmo banco e mesmos pools
+# de sondagem), cada uma com seu próprio ciclo. Cada item tem 'cidr' e,
+# opcionalmente, 'iface', 'gateway', 'interval_stable' e 'interval_change':
+#   NETWORKS = [{'cidr': '10.0.10.0/24', 'iface': 'eth0.10'},
+#               {'cidr': '10.0.20.0/24', 'iface': 'eth0.20', 'interval_stable': 300}]
+# Lista vazia: uma única rede (a ativa ou a definida com 'config set network').
+NETWORKS = []
+
+# --- Coletores Remotos ---
+# Central: recebe os scans de coletores remotos (collector.py) e grava no banco.
+INGEST_ENABLED = False
+INGEST_ADDRESS = "127.0.0.1:9750"  # ou "0.0.0.0:9750", "unix:/tmp/discovery-ingest.sock"
+# Token compartilhado entre central e coletores (vazio = sem verificação, e então
+# a central só escuta em loopback ou em socket Unix).
+INGEST_TOKEN = ""
+# Nível de compressão zlib dos lotes (1-9).
+INGEST_COMPRESSION = 6
+# Coletor: dispositivos por lote, lotes em trânsito sem confirmação e lotes
+# pendentes antes de o ciclo seguinte esperar (backpressure).
+COLLECTOR_BATCH_SIZE = 256
+COLLECTOR_WINDOW = 8
+COLLECTOR_OUTBOX = 1024
+# Timeout de conexão e espera máxima entre tentativas de reconexão (segundos).
+COLLECTOR_CONNECT_TIMEOUT = 5
+COLLECTOR_RECONNECT_MAX = 30
@@ -2,31 +2,167 @@
 """
 Módulo de gerenciamento do banco de dados SQLite.
 Corrigido para suportar métricas de QoS (TTL, Latência, Perda) e Links.
+
+Conexões: uma única conexão de escrita, persistente, usada só pela thread
+'db-writer', que executa as gravações em ordem a partir de uma fila (quem grava
+recebe um Future e não espera o commit), e um pool de conexões de leitura
+persistentes. Com WAL, as leituras não esperam pelas gravações em andamento.
 """
 
+import json
+import os
+import queue
 import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
 from datetime import datetime
 
+import config
+from deadline import ip_na_varredura, sondagem_completa
+
 DB_FILE = 'network_discovery.db'
 
-def _get_db_connection():
-    """Cria e retorna uma conexão com o banco de dados."""
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
-    return conn
+class _Database:
+    """Conexão de escrita em thread própria + pool de conexões de leitura de um arquivo."""
+
+    def __init__(self, path):
+        self.path = path
+        self.pid = os.getpid()
+        self._jobs = queue.Queue()
+        self._readers = queue.LifoQueue()
+        self._reader_count = 0
+        self._reader_lock = threading.Lock()
+        self._writer = threading.Thread(target=self._run_writer, name='db-writer', daemon=True)
+        self._writer.start()
+
+    def _connect(self, readonly=False):
+        # check_same_thread=False: as conexões de leitura passam de uma thread para outra pelo pool
+        conn = sqlite3.connect(self.path, check_same_thread=False,
+                               cached_statements=config.DB_STATEMENT_CACHE)
+        conn.row_factory = sqlite3.Row
+        conn.execute(f'PRAGMA cache_size = -{int(config.DB_CACHE_SIZE_KB)}')
+        conn.execute('PRAGMA busy_timeout = 5000')
+        if readonly:
+            conn.execute('PRAGMA query_only = ON')
+        else:
+            # Só vale em bancos novos; os antigos são convertidos offline com 'retention.py compact'
+            conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            conn.execute(f'PRAGMA journal_mode = {config.DB_JOURNAL_MODE}')
+            conn.execute(f'PRAGMA synchronous = {config.DB_SYNCHRONOUS}')
+        return conn
+
+    def _run_writer(self):
+        conn = self._connect()
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+            func, args, future = job
+            try:
+                result = func(conn.cursor(), *args)
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                print(f"(Database: Erro na gravação ({func.__name__}): {e})")
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+        conn.close()
+
+    def write(self, func, *args):
+        """Enfileira func(cursor, *args) para a thread de escrita (uma transação). Retorna um Future."""
+        future = Future()
+        self._jobs.put((func, args, future))
+        return future
+
+    @contextmanager
+    def reader(self):
+        """Empresta uma conexão de leitura do pool (abre uma nova até DB_READ_CONNECTIONS)."""
+        try:
+            conn = self._readers.get_nowait()
+        except queue.Empty:
+            with self._reader_lock:
+                create = self._reader_count < config.DB_READ_CONNECTIONS
+                self._reader_count += create
+            conn = self._connect(readonly=True) if create else self._readers.get()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._readers.put(conn)
+
+    def close(self):
+        """Espera as gravações enfileiradas e fecha todas as conexões."""
+        self._jobs.put(None)
+        self._writer.join()
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
+
+_db = None
+_db_lock = threading.Lock()
+
+def _get_db():
+    """Gerenciador de conexões do DB_FILE atual (recriado se DB_FILE mudar ou após um fork)."""
+    global _db
+    with _db_lock:
+        if _db is not None and (_db.path != DB_FILE or _db.pid != os.getpid()):
+            if _db.pid == os.getpid():
+                _db.close()
+            _db = None
+        if _db is None:
+            _db = _Database(DB_FILE)
+        return _db
+
+def _reader():
+    return _get_db().reader()
+
+def _write(func, *args):
+    return _get_db().write(func, *args)
+
+def fechar_db():
+    """Grava o que ainda está na fila e fecha as conexões (na saída do programa)."""
+    global _db
+    with _db_lock:
+        if _db is not None:
+            _db.close()
+            _db = None
 
 def inicializar_db():
     """Cria as tabelas do banco de dados se elas não existirem."""
-    conn = _get_db_connection()
-    cursor = conn.cursor()
-    
+    _write(_create_tables).result()
+    print("(Database: Banco de dados inicializado com sucesso.)")
+
+def _create_tables(cursor):
     # 1. Tabela de Scans
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS scans (
             scan_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp DATETIME NOT NULL
+            timestamp DATETIME NOT NULL,
+            complete INTEGER NOT NULL DEFAULT 1,  -- 0 enquanto o ScanWriter ainda grava
+            network TEXT,                         -- CIDR da rede varrida
+            total INTEGER NOT NULL DEFAULT 0,     -- Dispositivos no scan (mantido na gravação)
+            online_count INTEGER NOT NULL DEFAULT 0,
+            pinned INTEGER NOT NULL DEFAULT 0     -- 1 = reimportado do arquivo; a retenção não poda
         )
     ''')
+    columns = {row['name'] for row in cursor.execute('PRAGMA table_info(scans)')}
+    if 'complete' not in columns:
+        cursor.execute('ALTER TABLE scans ADD COLUMN complete INTEGER NOT NULL DEFAULT 1')
+    if 'network' not in columns:
+        cursor.execute('ALTER TABLE scans ADD COLUMN network TEXT')
+    # Bancos criados antes das contagens: preenchidas uma vez, depois dos índices
+    backfill_counts = 'total' not in columns
+    if backfill_counts:
+        cursor.execute('ALTER TABLE scans ADD COLUMN total INTEGER NOT NULL DEFAULT 0')
+        cursor.execute('ALTER TABLE scans ADD COLUMN online_count INTEGER NOT NULL DEFAULT 0')
+    if 'pinned' not in columns:
+        cursor.execute('ALTER TABLE scans ADD COLUMN pinned INTEGER NOT NULL DEFAULT 0')
     
     # 2. Tabela de Dispositivos (Definição Única e Completa)
     cursor.execute('''
@@ -43,9 +179,17 @@ def inicializar_db():
             ttl INTEGER,           -- NOVO
             avg_latency REAL,      -- NOVO
             packet_loss REAL,      -- NOVO
+            stages TEXT,           -- Estágios concluídos (NULL = sondagem completa)
+            network TEXT,          -- CIDR da rede em que o dispositivo foi visto
             FOREIGN KEY (scan_id) REFERENCES scans (scan_id)
         )
     ''')
+    # Bancos criados antes da coluna 'stages'
+    columns = {row['name'] for row in cursor.execute('PRAGMA table_info(devices)')}
+    if 'stages' not in columns:
+        cursor.execute('ALTER TABLE devices ADD COLUMN stages TEXT')
+    if 'network' not in columns:
+        cursor.execute('ALTER TABLE devices ADD COLUMN network TEXT')
 
     # 3. Tabela de Links (Grafo)
     cursor.execute('''
@@ -66,32 +210,227 @@ def inicializar_db():
             first_seen DATETIME NOT NULL
         )
     ''')
-    
-    # Commit e Close apenas no final de TUDO
-    conn.commit()
-    conn.close()
-    print("(Database: Banco de dados inicializado com sucesso.)")
 
-def salvar_resultado_scan(devices, links=None):
+    # 5. Último lote gravado de cada coletor remoto (retomada após reinício da central)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ingest_progress (
+            collector TEXT PRIMARY KEY,
+            session TEXT NOT NULL,
+            last_seq INTEGER NOT NULL
+        )
+    ''')
+
+    # 6. Histórico em intervalos de validade (DB_STORAGE_MODE = 'delta'): o estado
+    # valeu em todos os scans da rede de first_scan a last_scan
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS device_states (
+            state_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            network TEXT,
+            mac TEXT NOT NULL,
+            ip TEXT,
+            status TEXT NOT NULL,
+            snmp_name TEXT,
+            producer TEXT,
+            role TEXT,
+            open_ports TEXT,
+            ttl INTEGER,
+            avg_latency REAL,      -- Última medição do intervalo
+            packet_loss REAL,
+            stages TEXT,
+            first_scan INTEGER NOT NULL,
+            last_scan INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_states_network_last ON device_states (network, last_scan)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_states_mac_last ON device_states (mac, last_scan)')
+
+    # 7. Métricas de QoS (metrics.py): amostras brutas e agregados por resolução
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS metric_samples (
+            device TEXT NOT NULL,      -- MAC
+            metric INTEGER NOT NULL,   -- metrics.METRICS
+            ts INTEGER NOT NULL,       -- epoch (s)
+            value REAL NOT NULL,
+            PRIMARY KEY (device, metric, ts)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_metric_samples_ts ON metric_samples (ts)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS metric_rollups (
+            tier INTEGER NOT NULL,     -- Resolução em segundos (60, 3600, 86400)
+            device TEXT NOT NULL,
+            metric INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,   -- Início do intervalo (epoch)
+            min REAL, avg REAL, max REAL, p95 REAL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (tier, device, metric, bucket)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_metric_rollups_bucket ON metric_rollups (tier, bucket)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS metric_watermarks (
+            tier INTEGER PRIMARY KEY,
+            done_until INTEGER NOT NULL  -- Intervalos anteriores já agregados
+        )
+    ''')
+
+    # 8. Índice dos scans podados pela retenção (retention.py) e do arquivo de cada um
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS archived_scans (
+            scan_id INTEGER PRIMARY KEY,
+            timestamp DATETIME NOT NULL,
+            network TEXT,
+            day TEXT NOT NULL,         -- AAAA-MM-DD: ARCHIVE_DIR/scans-<day>.jsonl.gz
+            total INTEGER,
+            online_count INTEGER
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_archived_scans_timestamp ON archived_scans (timestamp)')
+
+    # 9. Inventário atual: uma linha por (rede, MAC), reescrita só quando o estado muda
+    backfill_current = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'current_devices'").fetchone() is None
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS current_devices (
+            mac TEXT NOT NULL,
+            ip TEXT,
+            status TEXT NOT NULL,
+            snmp_name TEXT,
+            producer TEXT,
+            role TEXT,
+            open_ports TEXT,
+            ttl INTEGER,
+            avg_latency REAL,      -- Medições da última mudança (séries em metrics.py)
+            packet_loss REAL,
+            stages TEXT,
+            network TEXT,
+            present INTEGER NOT NULL DEFAULT 1,  -- 0: fora do último scan completo da rede
+            scan_id INTEGER,       -- Scan da última mudança
+            last_seen DATETIME,    -- Online: até o último scan completo da rede (ver get_current_devices)
+            last_changed DATETIME NOT NULL,
+            changes INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    # O mesmo MAC pode estar em várias redes monitoradas (rede NULL: scans sem CIDR)
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_current_network_mac ON current_devices (ifnull(network, ''), mac)")
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_current_ip ON current_devices (ip)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_current_network_status ON current_devices (network, status)')
+
+    # 10. Feed de mudanças do inventário (só acrescentado) e o cursor de cada consumidor
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS device_events (
+            event_id INTEGER PRIMARY KEY AUTOINCREMENT,  -- Cursor: cresce sempre, nunca é reusado
+            timestamp DATETIME NOT NULL,
+            scan_id INTEGER,
+            network TEXT,
+            mac TEXT NOT NULL,
+            type TEXT NOT NULL,    -- appeared, disappeared, ip/ports/role/vendor_changed
+            old_value TEXT,
+            new_value TEXT
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_events_mac ON device_events (mac, event_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_events_timestamp ON device_events (timestamp)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS event_consumers (
+            consumer TEXT PRIMARY KEY,
+            last_event INTEGER NOT NULL  -- Último evento processado
+        )
+    ''')
+
+    # 11. Índices: dispositivos de um scan (e anti-joins por MAC entre dois scans)
+    # direto do índice, histórico por MAC, e último scan (por rede) sem ordenar a tabela
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_devices_scan_mac ON devices (scan_id, mac, status)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_devices_mac ON devices (mac)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_scans_timestamp ON scans (timestamp)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_scans_network_timestamp ON scans (network, timestamp)')
+
+    if backfill_counts:
+        cursor.execute('''
+            UPDATE scans SET
+                total = (SELECT COUNT(*) FROM devices d WHERE d.scan_id = scans.scan_id),
+                online_count = (SELECT COUNT(*) FROM devices d WHERE d.scan_id = scans.scan_id AND d.status = 'online')
+        ''')
+    if backfill_current:
+        # Bancos anteriores ao inventário: parte do último scan completo de cada rede
+        latest = cursor.execute('''
+            SELECT scan_id, timestamp FROM scans s
+            WHERE complete = 1 AND scan_id = (SELECT scan_id FROM scans WHERE network IS s.network AND complete = 1
+                                              ORDER BY timestamp DESC LIMIT 1)
+            ORDER BY timestamp
+        ''').fetchall()
+        for scan_id, timestamp in latest:
+            params = _scan_params(cursor, scan_id)
+            cursor.execute(f'''
+                INSERT OR REPLACE INTO current_devices (
+                    {_DEVICE_COLUMNS}, scan_id, last_seen, last_changed, changes
+                ) SELECT {_DEVICE_COLUMNS}, :scan_id, CASE WHEN status = 'online' THEN :timestamp END, :timestamp, 0
+                FROM ({_SCAN_ROWS.format(columns=_DEVICE_COLUMNS)}) WHERE mac IS NOT NULL
+            ''', dict(params, timestamp=timestamp))
+
+def salvar_resultado_scan(devices, links=None, network=None, progress=None):
     """
     Salva o resultado completo de um novo scan no banco de dados.
+    'network' é o CIDR da rede varrida (gravado no scan e em cada dispositivo).
+    'progress' = (coletor, sessão, lote) registra, na mesma transação, o último
+    lote gravado de um coletor remoto (ingest.py).
+
+    A gravação é feita pela thread de escrita: retorna um Future com o scan_id
+    (quem precisa do commit, como a central de coletores, chama .result()).
     """
-    conn = _get_db_connection()
-    cursor = conn.cursor()
-    
-    now = datetime.now()
-    cursor.execute('INSERT INTO scans (timestamp) VALUES (?)', (now,))
+    # As linhas são montadas aqui: os dicionários podem mudar depois que a chamada retornar
+    rows = _device_rows(devices, network)
+    link_rows = [(link['src'], link['dst'], link.get('type', 'ethernet')) for link in links or []]
+    return _write(_save_scan, datetime.now(), network, rows, link_rows, progress, config.DB_STORAGE_MODE)
+
+def _save_scan(cursor, now, network, rows, link_rows, progress, storage):
+    cursor.execute('INSERT INTO scans (timestamp, network) VALUES (?, ?)', (now, network))
     scan_id = cursor.lastrowid
     
+    _insert_device_rows(cursor, scan_id, rows, now, storage)
+    _count_devices(cursor, scan_id, rows)
+    _update_current(cursor, scan_id, now, rows)
+    _mark_absent(cursor, scan_id, now, network, {row[1] for row in rows})
+    
+    if link_rows:
+        cursor.executemany(
+            'INSERT INTO links (scan_id, src_mac, dst_mac, type) VALUES (?, ?, ?, ?)',
+            [(scan_id,) + link for link in link_rows]
+        )
+
+    if progress:
+        cursor.execute('INSERT OR REPLACE INTO ingest_progress (collector, session, last_seq) VALUES (?, ?, ?)',
+                       progress)
+    return scan_id
+
+def salvar_sondagens(devices, network=None):
+    """
+    Grava as sondagens individuais que mudaram entre duas varreduras da rede:
+    só o inventário atual (current_devices) e o feed de eventos, sem criar um
+    scan (os scans completos continuam no intervalo das varreduras).
+    Retorna um Future (resolvido no commit).
+    """
+    rows = _device_rows(devices, network)
+    return _write(_save_probes, datetime.now(), network, rows)
+
+def _save_probes(cursor, now, network, rows):
+    # As mudanças ficam associadas ao último scan completo da rede (um rollback
+    # para antes dele também as desfaz); os online foram vistos nele
+    latest = cursor.execute('''SELECT scan_id, timestamp FROM scans WHERE network IS ? AND complete = 1
+                               ORDER BY timestamp DESC LIMIT 1''', (network,)).fetchone()
+    _update_current(cursor, latest and latest['scan_id'], now, rows, seen=latest and latest['timestamp'])
+
+def _device_rows(devices, network=None):
+    """Linhas da tabela devices (sem o scan_id, conhecido só na thread de escrita)."""
     devices_to_insert = []
-    known_devices_to_check = []
     
     for dev in devices:
         ports_str = ",".join(map(str, dev.get('open_ports', [])))
+        # Sondagem interrompida pelo prazo do ciclo: guarda os estágios concluídos
+        stages_str = None if sondagem_completa(dev) else ",".join(dev['stages'])
         
         # Correção da Tupla: Fechamento de parênteses ajustado
         devices_to_insert.append((
-            scan_id, 
             dev.get('ip'), 
             dev.get('mac'), 
             dev.get('status'), 
@@ -101,163 +440,548 @@ def salvar_resultado_scan(devices, links=None):
             ports_str, 
             dev.get('ttl'),          
             dev.get('avg_latency'),  
-            dev.get('packet_loss')
+            dev.get('packet_loss'),
+            stages_str,
+            network
         ))
-        
-        if dev.get('mac'):
-            known_devices_to_check.append((dev.get('mac'), now))
+    return devices_to_insert
 
-    if devices_to_insert:
+def _insert_device_rows(cursor, scan_id, rows, now, storage='full'):
+    """Insere os dispositivos de um scan e registra os MACs ainda desconhecidos."""
+    if rows and storage == 'delta':
+        _extend_states(cursor, scan_id, rows)
+    elif rows:
         cursor.executemany(
             '''INSERT INTO devices (
                 scan_id, ip, mac, status, snmp_name, producer, role, open_ports, 
-                ttl, avg_latency, packet_loss
-               ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-            devices_to_insert
+                ttl, avg_latency, packet_loss, stages, network
+               ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+            [(scan_id,) + row for row in rows]
         )
-
-    if known_devices_to_check:
+    if rows:
         cursor.executemany(
             'INSERT OR IGNORE INTO known_devices (mac, first_seen) VALUES (?, ?)',
-            known_devices_to_check
-        )
-    
-    if links:
-        links_to_insert = []
-        for link in links:
-            links_to_insert.append((
-                scan_id, 
-                link['src'], 
-                link['dst'], 
-                link.get('type', 'ethernet')
-            ))
-        
-        cursor.executemany(
-            'INSERT INTO links (scan_id, src_mac, dst_mac, type) VALUES (?, ?, ?, ?)',
-            links_to_insert
+            [(row[1], now) for row in rows if row[1]]
         )
-        
-    conn.commit()
-    conn.close()
+
+# Posições, na linha de _device_rows, dos campos que definem o estado de um
+# intervalo (latência e perda variam a cada scan e não abrem intervalo novo)
+_STATE_FIELDS = (0, 2, 3, 4, 5, 6, 7, 10)
+
+def _extend_states(cursor, scan_id, rows):
+    """
+    Modo 'delta': o intervalo de cada dispositivo que terminava no scan anterior
+    da rede e tem o mesmo estado passa a terminar em scan_id; dispositivos novos
+    ou com algum campo alterado abrem um intervalo [scan_id, scan_id].
+    """
+    network = rows[0][11]
+    # Na mesma rede, a ordem dos scans por horário é a dos ids (uma thread por rede)
+    row = cursor.execute('SELECT scan_id FROM scans WHERE network IS ? AND scan_id < ? ORDER BY timestamp DESC LIMIT 1',
+                         (network, scan_id)).fetchone()
+    prev_scan_id = row[0] if row else None
+    extend = []
+    insert = []
+    for device in rows:
+        state = None
+        if prev_scan_id is not None:
+            state = cursor.execute('''
+                SELECT state_id, ip, status, snmp_name, producer, role, open_ports, ttl, stages
+                FROM device_states WHERE mac = ? AND last_scan = ? AND network IS ?
+            ''', (device[1], prev_scan_id, network)).fetchone()
+        if state is not None and tuple(state)[1:] == tuple(device[i] for i in _STATE_FIELDS):
+            extend.append((scan_id, device[8], device[9], state[0]))
+        else:
+            insert.append(device + (scan_id, scan_id))
+    cursor.executemany('UPDATE device_states SET last_scan = ?, avg_latency = ?, packet_loss = ? WHERE state_id = ?',
+                       extend)
+    cursor.executemany(
+        '''INSERT INTO device_states (
+            ip, mac, status, snmp_name, producer, role, open_ports,
+            ttl, avg_latency, packet_loss, stages, network, first_scan, last_scan
+           ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+        insert
+    )
+
+def _count_devices(cursor, scan_id, rows):
+    """Soma as linhas gravadas às contagens do scan (scans.total / online_count)."""
+    if rows:
+        online = sum(1 for row in rows if row[2] == 'online')
+        cursor.execute('UPDATE scans SET total = total + ?, online_count = online_count + ? WHERE scan_id = ?',
+                       (len(rows), online, scan_id))
+
+def _previous_seen(cursor, network, scan_id):
+    """Horário do último scan completo da rede antes de scan_id (quando os online foram vistos)."""
+    row = cursor.execute('''SELECT timestamp FROM scans WHERE network IS ? AND complete = 1 AND scan_id < ?
+                            ORDER BY timestamp DESC LIMIT 1''', (network, scan_id)).fetchone()
+    return row[0] if row else None
+
+def _update_current(cursor, scan_id, now, rows, seen=None):
+    """
+    Atualiza o inventário atual da rede do scan com as suas linhas: MACs novos
+    na rede entram, e só as linhas com algum campo de estado diferente (os de
+    _STATE_FIELDS, ou que estavam fora da rede) são reescritas, com last_changed
+    e changes. Um dispositivo online sem mudança não é tocado: o seu last_seen é
+    o último scan completo da rede ('seen': quando os online foram vistos, se não
+    for o scan completo anterior a scan_id).
+    """
+    rows = [row for row in rows if row[1]]
+    if not rows:
+        return
+    network = rows[0][11]
+    old = {row['mac']: dict(row) for row in cursor.execute(
+        f'''SELECT {_EVENT_COLUMNS} FROM current_devices
+            WHERE ifnull(network, '') = ifnull(?, '') AND mac IN (SELECT value FROM json_each(?))''',
+        (network, json.dumps([row[1] for row in rows])))}
+    # Quem estava online e deixou de estar foi visto pela última vez no scan anterior
+    if seen is None:
+        seen = _previous_seen(cursor, network, scan_id)
+    cursor.executemany('''
+        INSERT INTO current_devices (
+            ip, mac, status, snmp_name, producer, role, open_ports, ttl, avg_latency, packet_loss, stages, network,
+            scan_id, last_changed, last_seen, present, changes
+        ) VALUES (?1, ?2, ?3, ?4, ?5, ?6, ?7, ?8, ?9, ?10, ?11, ?12, ?13, ?14,
+                  CASE WHEN ?3 = 'online' THEN ?14 END, 1, 0)
+        ON CONFLICT (ifnull(network, ''), mac) DO UPDATE SET
+            ip = excluded.ip, status = excluded.status, snmp_name = excluded.snmp_name,
+            producer = excluded.producer, role = excluded.role, open_ports = excluded.open_ports,
+            ttl = excluded.ttl, avg_latency = excluded.avg_latency, packet_loss = excluded.packet_loss,
+            stages = excluded.stages, present = 1, scan_id = excluded.scan_id,
+            last_seen = CASE
+                WHEN excluded.status = 'online' THEN excluded.last_changed
+                WHEN current_devices.status = 'online' THEN MAX(COALESCE(current_devices.last_seen, ?15),
+                                                                 COALESCE(?15, current_devices.last_seen))
+                ELSE current_devices.last_seen END,
+            last_changed = excluded.last_changed, changes = current_devices.changes + 1
+        WHERE (current_devices.ip, current_devices.status, current_devices.snmp_name, current_devices.producer,
+               current_devices.role, current_devices.open_ports, current_devices.ttl, current_devices.stages,
+               current_devices.present)
+              IS NOT (excluded.ip, excluded.status, excluded.snmp_name, excluded.producer, excluded.role,
+                      excluded.open_ports, excluded.ttl, excluded.stages, 1)
+    ''', [row + (scan_id, now, seen) for row in rows])
+    _log_events(cursor, scan_id, now, [
+        (row[1], network, old.get(row[1]), dict(zip(('mac', 'ip', 'status', 'present', 'producer', 'role', 'open_ports'),
+                                                   (row[1], row[0], row[2], 1, row[4], row[5], row[6]))))
+        for row in rows])
+
+def _mark_absent(cursor, scan_id, now, network, macs, covered=None):
+    """
+    Scan completo: os dispositivos da rede que não estão nele (MACs fora de 'macs')
+    saíram da rede (present = 0, status offline). Com 'covered' (faixas
+    [(primeiro, último)] de IPs varridos, quando a descoberta foi interrompida),
+    só os que têm o IP dentro delas.
+    """
+    rows = cursor.execute(f'SELECT {_EVENT_COLUMNS} FROM current_devices WHERE network IS ? AND present = 1',
+                          (network,)).fetchall()
+    missing = [row for row in rows
+               if row['mac'] not in macs and (covered is None or ip_na_varredura(row['ip'], covered))]
+    if not missing:
+        return
+    _log_events(cursor, scan_id, now, [(row['mac'], network, dict(row), dict(row, status='offline', present=0))
+                                       for row in missing])
+    seen = _previous_seen(cursor, network, scan_id)
+    cursor.executemany('''
+        UPDATE current_devices SET status = 'offline', present = 0, scan_id = ?1, last_changed = ?2,
+            changes = changes + 1,
+            last_seen = CASE WHEN status = 'online' THEN MAX(COALESCE(last_seen, ?3), COALESCE(?3, last_seen))
+                             ELSE last_seen END
+        WHERE ifnull(network, '') = ifnull(?4, '') AND mac = ?5
+    ''', [(scan_id, now, seen, network, row['mac']) for row in missing])
+
+# Campos de current_devices comparados para gerar eventos, e o evento de cada um
+_EVENT_COLUMNS = 'mac, ip, status, present, producer, role, open_ports'
+_EVENT_FIELDS = (('ip', 'ip_changed'), ('open_ports', 'ports_changed'),
+                 ('role', 'role_changed'), ('producer', 'vendor_changed'))
+
+def _device_events(old, new):
+    """
+    Eventos da passagem de 'old' para 'new' (dicionários com os campos de
+    _EVENT_COLUMNS; None = MAC fora do inventário): (tipo, valor antigo, valor novo).
+    Entrar e sair seguem a presença no scan (present), não a resposta ao ping: um
+    dispositivo que está no scan sem responder ao ping continua na rede, e os
+    seus atributos também são comparados.
+    """
+    was_present = old is not None and bool(old['present'])
+    is_present = new is not None and bool(new['present'])
+    events = []
+    if is_present and not was_present:
+        events.append(('appeared', None, new['ip']))
+    if is_present and old is not None:
+        events.extend((event, old[field], new[field]) for field, event in _EVENT_FIELDS if old[field] != new[field])
+    if was_present and not is_present:
+        events.append(('disappeared', old['ip'], None))
+    return events
+
+def _log_events(cursor, scan_id, now, changes):
+    """
+    Acrescenta a device_events os eventos de cada (mac, rede, antigo, novo). Com
+    uma única thread de escrita, os event_id ficam visíveis em ordem: um cursor
+    nunca pula um evento gravado depois.
+    """
+    cursor.executemany(
+        '''INSERT INTO device_events (timestamp, scan_id, network, mac, type, old_value, new_value)
+           VALUES (?, ?, ?, ?, ?, ?, ?)''',
+        [(now, scan_id, network, mac, event, old_value, new_value)
+         for mac, network, old, new in changes
+         for event, old_value, new_value in _device_events(old, new)])
+
+class ScanWriter:
+    """
+    Grava um scan em micro-lotes, à medida que os dispositivos ficam prontos.
+
+    O scan é criado como incompleto (complete = 0) e só passa a ser visto como
+    "último scan" pelas leituras depois de finish(). Cada lote (DB_BATCH_SIZE
+    dispositivos ou DB_BATCH_INTERVAL segundos, o que vier primeiro) é gravado
+    em uma transação própria, pela thread de escrita: add() e finish() nunca
+    esperam pelo banco. Deve ser usado por uma única thread.
+    """
+
+    def __init__(self, batch_size=None, batch_interval=None, network=None):
+        self.batch_size = batch_size or config.DB_BATCH_SIZE
+        self.batch_interval = batch_interval if batch_interval is not None else config.DB_BATCH_INTERVAL
+        self.network = network
+        self.storage = config.DB_STORAGE_MODE
+        self._now = datetime.now()
+        # A thread de escrita executa em ordem: os lotes já encontram o scan criado
+        self._created = _write(_create_scan, self._now, network)
+        self._pending = []
+        self._last_flush = time.monotonic()
+        self.written = 0
+
+    @property
+    def scan_id(self):
+        return self._created.result()
+
+    def add(self, device):
+        self._pending.append(device)
+        if len(self._pending) >= self.batch_size or time.monotonic() - self._last_flush >= self.batch_interval:
+            self.flush()
+
+    def flush(self):
+        if self._pending:
+            _write(_insert_batch, self._created, _device_rows(self._pending, self.network), self._now, self.storage)
+            self.written += len(self._pending)
+            self._pending = []
+        self._last_flush = time.monotonic()
+
+    def finish(self, covered=None):
+        """
+        Grava o restante e marca o scan como completo. Retorna um Future com o scan_id.
+        'covered': faixas de IPs que a descoberta varreu, se ela foi interrompida
+        (só os ausentes nelas saem do inventário; ver _mark_absent).
+        """
+        self.flush()
+        return _write(_complete_scan, self._created, covered)
+
+def _create_scan(cursor, now, network):
+    cursor.execute('INSERT INTO scans (timestamp, complete, network) VALUES (?, 0, ?)', (now, network))
+    return cursor.lastrowid
+
+def _insert_batch(cursor, created, rows, now, storage):
+    _insert_device_rows(cursor, created.result(), rows, now, storage)
+    _count_devices(cursor, created.result(), rows)
+    _update_current(cursor, created.result(), now, rows)
+
+def _complete_scan(cursor, created, covered=None):
+    scan_id = created.result()
+    scan = cursor.execute('SELECT timestamp, network FROM scans WHERE scan_id = ?', (scan_id,)).fetchone()
+    _mark_absent(cursor, scan_id, scan['timestamp'], scan['network'], _scan_status(cursor, scan_id).keys(), covered)
+    cursor.execute('UPDATE scans SET complete = 1 WHERE scan_id = ?', (scan_id,))
     return scan_id
 
+def get_ingest_progress(collector):
+    """(sessão, último lote gravado) de um coletor remoto, ou None."""
+    with _reader() as conn:
+        row = conn.execute('SELECT session, last_seq FROM ingest_progress WHERE collector = ?',
+                           (collector,)).fetchone()
+    return (row['session'], row['last_seq']) if row else None
+
 # --- Mantenha as outras funções de leitura (get_scan_history, etc) iguais ---
-def _get_latest_scan_id():
-    conn = _get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT scan_id FROM scans ORDER BY timestamp DESC LIMIT 1')
-    result = cursor.fetchone()
-    conn.close()
+def _get_latest_scan_id(network=None):
+    """Último scan completo (da rede informada, ou de qualquer rede)."""
+    with _reader() as conn:
+        cursor = conn.cursor()
+        if network is None:
+            cursor.execute('SELECT scan_id FROM scans WHERE complete = 1 ORDER BY timestamp DESC LIMIT 1')
+        else:
+            cursor.execute('SELECT scan_id FROM scans WHERE complete = 1 AND network = ? ORDER BY timestamp DESC LIMIT 1',
+                           (network,))
+        result = cursor.fetchone()
     return result['scan_id'] if result else None
 
 def get_scan_history(limit=10):
-    conn = _get_db_connection()
-    cursor = conn.cursor()
+    # Contagens mantidas em 'scans' na gravação: não toca na tabela de dispositivos
     query = """
-        SELECT
-            s.scan_id,
-            s.timestamp,
-            COUNT(d.device_id) AS total,
-            SUM(CASE WHEN d.status = 'online' THEN 1 ELSE 0 END) AS online_count
-        FROM scans s
-        LEFT JOIN devices d ON s.scan_id = d.scan_id
-        GROUP BY s.scan_id
-        ORDER BY s.timestamp DESC
+        SELECT scan_id, timestamp, complete, network, total, online_count
+        FROM scans
+        ORDER BY timestamp DESC
         LIMIT ?
     """
-    cursor.execute(query, (limit,))
-    rows = cursor.fetchall()
-    conn.close()
+    with _reader() as conn:
+        rows = conn.execute(query, (limit,)).fetchall()
     return [dict(row) for row in rows]
 
-def get_devices_for_scan_with_first_seen(scan_id=None):
+def get_devices_for_scan_with_first_seen(scan_id=None, network=None):
     if scan_id is None:
-        scan_id = _get_latest_scan_id()
+        scan_id = _get_latest_scan_id(network)
         if scan_id is None:
             return []
-            
-    conn = _get_db_connection()
-    cursor = conn.cursor()
     
+    with _reader() as conn:
+        return _scan_devices(conn, scan_id)
+
+# Linhas de um scan: as cópias gravadas em 'devices' (modo 'full') mais os
+# intervalos de 'device_states' (modo 'delta') da rede do scan que o contêm
+_SCAN_ROWS = """
+    SELECT {columns} FROM devices WHERE scan_id = :scan_id
+    UNION ALL
+    SELECT {columns} FROM device_states
+    WHERE network IS :network AND last_scan >= :scan_id AND first_scan <= :scan_id
+"""
+_DEVICE_COLUMNS = 'ip, mac, status, snmp_name, producer, role, open_ports, ttl, avg_latency, packet_loss, stages, network'
+
+def _scan_params(conn, scan_id):
+    """Parâmetros de _SCAN_ROWS, ou None se o scan não existe."""
+    scan = conn.execute('SELECT network FROM scans WHERE scan_id = ?', (scan_id,)).fetchone()
+    return {'scan_id': scan_id, 'network': scan['network']} if scan else None
+
+def _scan_status(conn, scan_id):
+    """{mac: status} de um scan (só o índice, sem montar os dispositivos)."""
+    params = _scan_params(conn, scan_id)
+    if params is None:
+        return {}
+    query = _SCAN_ROWS.format(columns='mac, status')
+    return {row['mac']: row['status'] for row in conn.execute(query, params)}
+
+def _scan_devices(conn, scan_id, macs=None):
+    """Dispositivos de um scan (todos, ou só os MACs em 'macs'), ordenados por IP."""
     # Atenção: Se você quiser ler o TTL na CLI, adicione d.ttl aqui no SELECT
-    query = """
+    query = f"""
         SELECT d.ip, d.mac, d.status, d.snmp_name, d.producer, d.role, d.open_ports, kd.first_seen,
-               d.ttl, d.avg_latency, d.packet_loss
-        FROM devices d
+               d.ttl, d.avg_latency, d.packet_loss, d.stages, d.network
+        FROM ({_SCAN_ROWS.format(columns=_DEVICE_COLUMNS)}) d
         LEFT JOIN known_devices kd ON d.mac = kd.mac
-        WHERE d.scan_id = ?
+        {'' if macs is None else 'WHERE d.mac IN (SELECT value FROM json_each(:macs))'}
         ORDER BY d.ip
     """
-    cursor.execute(query, (scan_id,))
-    rows = cursor.fetchall()
-    conn.close()
-    
+    params = _scan_params(conn, scan_id)
+    if params is None:
+        return []
+    if macs is not None:
+        params['macs'] = json.dumps(sorted(macs))
+    rows = conn.execute(query, params).fetchall()
+    return [_device_from_row(row) for row in rows]
+
+def _device_from_row(row):
+    device = dict(row)
+    if device.get('open_ports'):
+        device['open_ports'] = [int(p) for p in device['open_ports'].split(',') if p]
+    else:
+        device['open_ports'] = []
+    # 'stages' só existe em dispositivos com sondagem incompleta
+    stages = device.pop('stages')
+    if stages is not None:
+        device['stages'] = [s for s in stages.split(',') if s]
+    return device
+
+_CURRENT_QUERY = """
+    SELECT cd.ip, cd.mac, cd.status, cd.snmp_name, cd.producer, cd.role, cd.open_ports, kd.first_seen,
+           cd.ttl, cd.avg_latency, cd.packet_loss, cd.stages, cd.network, cd.present,
+           cd.last_seen, cd.last_changed, cd.changes
+    FROM current_devices cd
+    LEFT JOIN known_devices kd ON cd.mac = kd.mac
+"""
+
+def _current_devices(conn, rows):
+    """Linhas de current_devices -> dispositivos; o last_seen dos online é o último scan completo da rede."""
+    latest = {}
     devices = []
     for row in rows:
-        device = dict(row)
-        if device.get('open_ports'):
-            device['open_ports'] = [int(p) for p in device['open_ports'].split(',') if p]
-        else:
-            device['open_ports'] = []
+        device = _device_from_row(row)
+        if device['status'] == 'online':
+            network = device['network']
+            if network not in latest:
+                scan = conn.execute('''SELECT timestamp FROM scans WHERE network IS ? AND complete = 1
+                                       ORDER BY timestamp DESC LIMIT 1''', (network,)).fetchone()
+                latest[network] = scan['timestamp'] if scan else None
+            device['last_seen'] = max(filter(None, (device['last_seen'], latest[network])), default=None)
         devices.append(device)
-    
     return devices
 
-def get_changes_for_last_scan():
-    conn = _get_db_connection()
-    cursor = conn.cursor()
+def get_current_devices(network=None, status=None):
+    """
+    Estado atual de cada dispositivo já visto em cada rede (tabela current_devices),
+    ordenado por rede e IP: os campos de get_devices_for_scan_with_first_seen mais
+    present (0: fora do último scan completo da rede), last_seen, last_changed e
+    changes. Filtros opcionais por rede e por status. Não depende
+    do tamanho do histórico.
+    """
+    query = _CURRENT_QUERY + """
+        WHERE (:network IS NULL OR cd.network = :network) AND (:status IS NULL OR cd.status = :status)
+        ORDER BY cd.network, cd.ip
+    """
+    with _reader() as conn:
+        rows = conn.execute(query, {'network': network, 'status': status}).fetchall()
+        return _current_devices(conn, rows)
 
-    cursor.execute('SELECT scan_id FROM scans ORDER BY timestamp DESC LIMIT 2')
-    scan_ids = [row['scan_id'] for row in cursor.fetchall()]
-    
-    if len(scan_ids) < 2:
-        return {'new': get_devices_for_scan_with_first_seen(), 'offline': []}
+def get_current_device(key, network=None):
+    """
+    Dispositivo atual pelo MAC ou pelo IP, em 'network' ou em qualquer rede (se
+    estiver em mais de uma, o online mais recente), ou None.
+    """
+    where, params = ('WHERE cd.mac = ?', [key.lower()]) if ':' in key else ('WHERE cd.ip = ?', [key])
+    if network is not None:
+        where += ' AND cd.network = ?'
+        params.append(network)
+    where += " ORDER BY cd.status = 'online' DESC, cd.last_changed DESC LIMIT 1"
+    with _reader() as conn:
+        rows = conn.execute(_CURRENT_QUERY + where, params).fetchall()
+        devices = _current_devices(conn, rows)
+    return devices[0] if devices else None
 
-    last_scan_id, prev_scan_id = scan_ids
-    
-    query_new = """
-        SELECT d.ip, d.mac, d.status, d.snmp_name, d.producer, d.role, d.open_ports, kd.first_seen
-        FROM devices d
-        LEFT JOIN known_devices kd ON d.mac = kd.mac
-        WHERE d.scan_id = ? AND d.mac NOT IN (SELECT mac FROM devices WHERE scan_id = ?)
+def get_device_events(after=0, limit=None, mac=None):
+    """Eventos com event_id > after, do mais antigo ao mais novo (até 'limit', padrão EVENTS_BATCH_SIZE)."""
+    query = '''
+        SELECT event_id, timestamp, scan_id, network, mac, type, old_value, new_value FROM device_events
+        WHERE event_id > :after AND (:mac IS NULL OR mac = :mac)
+        ORDER BY event_id LIMIT :limit
+    '''
+    params = {'after': after, 'mac': mac.lower() if mac else None, 'limit': limit or config.EVENTS_BATCH_SIZE}
+    with _reader() as conn:
+        return [dict(row) for row in conn.execute(query, params)]
+
+def get_last_events(limit=10):
+    """Os 'limit' eventos mais recentes, do mais antigo ao mais novo."""
+    with _reader() as conn:
+        rows = conn.execute('''SELECT event_id, timestamp, scan_id, network, mac, type, old_value, new_value
+                               FROM device_events ORDER BY event_id DESC LIMIT ?''', (limit,)).fetchall()
+    return [dict(row) for row in reversed(rows)]
+
+def read_events(consumer, limit=None):
     """
-    cursor.execute(query_new, (last_scan_id, prev_scan_id))
-    new_devices = []
-    for row in cursor.fetchall():
-        device = dict(row)
-        if device.get('open_ports'):
-            device['open_ports'] = [int(p) for p in device['open_ports'].split(',') if p]
-        else:
-            device['open_ports'] = []
-        new_devices.append(device)
-    
-    query_offline = """
-        SELECT d.ip, d.mac, d.status, d.snmp_name, d.producer, d.role, d.open_ports, kd.first_seen
-        FROM devices d
-        LEFT JOIN known_devices kd ON d.mac = kd.mac
-        WHERE d.scan_id = ? AND d.status = 'online' AND d.mac NOT IN 
-              (SELECT mac FROM devices WHERE scan_id = ? AND status = 'online')
+    Próximo lote de eventos de um consumidor (CLI, agente SNMP, exportadores):
+    os posteriores ao seu cursor. Não avança o cursor; depois de processar o
+    lote, o consumidor chama ack_events (entrega ao menos uma vez).
     """
-    cursor.execute(query_offline, (prev_scan_id, last_scan_id))
-    offline_devices = []
-    for row in cursor.fetchall():
-        device = dict(row)
-        if device.get('open_ports'):
-            device['open_ports'] = [int(p) for p in device['open_ports'].split(',') if p]
-        else:
-            device['open_ports'] = []
-        offline_devices.append(device)
-    
-    conn.close()
+    with _reader() as conn:
+        row = conn.execute('SELECT last_event FROM event_consumers WHERE consumer = ?', (consumer,)).fetchone()
+    return get_device_events(row['last_event'] if row else 0, limit)
+
+def ack_events(consumer, event_id):
+    """Avança o cursor do consumidor até event_id (inclusive; nunca volta). Espera a gravação."""
+    _write(_save_event_cursor, consumer, event_id).result()
+
+def _save_event_cursor(cursor, consumer, event_id):
+    cursor.execute('''INSERT INTO event_consumers (consumer, last_event) VALUES (?, ?)
+                      ON CONFLICT (consumer) DO UPDATE SET last_event = MAX(last_event, excluded.last_event)''',
+                   (consumer, event_id))
+
+def get_last_scan_snapshot(network=None):
+    """
+    Retorna o último scan persistido como {'scan_id', 'timestamp', 'devices'}
+    (dispositivos no mesmo formato de get_devices_for_scan_with_first_seen),
+    ou None se o banco ainda não tiver scans. Usado no warm start do orquestrador
+    (com 'network', considera apenas os scans daquela rede).
+    """
+    scan_id = _get_latest_scan_id(network)
+    if scan_id is None:
+        return None
+    with _reader() as conn:
+        row = conn.execute('SELECT scan_id, timestamp FROM scans WHERE scan_id = ?', (scan_id,)).fetchone()
+
+    try:
+        timestamp = datetime.fromisoformat(str(row['timestamp']))
+    except ValueError:
+        timestamp = None
+    return {
+        'scan_id': row['scan_id'],
+        'timestamp': timestamp,
+        'devices': get_devices_for_scan_with_first_seen(row['scan_id'])
+    }
+
+def get_changes_for_last_scan(network=None):
+    """
+    Compara o último scan completo com o anterior da mesma rede (com 'network',
+    o último scan daquela rede). Retorna {'new': [...], 'offline': [...]}.
+    """
+    last_scan_id = _get_latest_scan_id(network)
+    if last_scan_id is None:
+        return {'new': [], 'offline': []}
+
+    with _reader() as conn:
+        # Com várias redes, o scan anterior de outra rede não serve de comparação
+        network = conn.execute('SELECT network FROM scans WHERE scan_id = ?', (last_scan_id,)).fetchone()['network']
+        row = conn.execute('''
+            SELECT scan_id FROM scans
+            WHERE network IS ? AND complete = 1 AND scan_id != ?
+            ORDER BY timestamp DESC LIMIT 1
+        ''', (network, last_scan_id)).fetchone()
+        if row is None:
+            return {'new': _scan_devices(conn, last_scan_id), 'offline': []}
+
+        # Diferença pelos pares (mac, status) dos dois scans (cópias ou intervalos);
+        # só os dispositivos que mudaram são montados por inteiro
+        current = _scan_status(conn, last_scan_id)
+        previous = _scan_status(conn, row['scan_id'])
+        new_macs = current.keys() - previous.keys()
+        offline_macs = {mac for mac, status in previous.items()
+                        if status == 'online' and current.get(mac) != 'online'}
+        new_devices = _scan_devices(conn, last_scan_id, new_macs) if new_macs else []
+        offline_devices = _scan_devices(conn, row['scan_id'], offline_macs) if offline_macs else []
     return {'new': new_devices, 'offline': offline_devices}
 
 def rollback_to_scan(scan_id):
-    conn = _get_db_connection()
-    cursor = conn.cursor()
+    """Apaga os scans mais novos que scan_id. Espera a gravação e retorna quantos foram apagados."""
+    return _write(_rollback, scan_id).result()
+
+def _rollback(cursor, scan_id):
+    # Intervalos: os abertos depois do scan somem; os que o atravessam voltam a
+    # terminar no último scan mantido da sua rede
+    cursor.execute('DELETE FROM device_states WHERE first_scan > ?', (scan_id,))
+    cursor.execute('''
+        UPDATE device_states SET last_scan = (
+            SELECT MAX(s.scan_id) FROM scans s WHERE s.network IS device_states.network AND s.scan_id <= ?
+        ) WHERE last_scan > ?
+    ''', (scan_id, scan_id))
     cursor.execute('DELETE FROM devices WHERE scan_id > ?', (scan_id,))
     cursor.execute('DELETE FROM links WHERE scan_id > ?', (scan_id,)) # Limpar links também
     cursor.execute('DELETE FROM scans WHERE scan_id > ?', (scan_id,))
-    deleted_count = cursor.rowcount
-    conn.commit()
-    conn.close()
-    return deleted_count
\ No newline at end of file
+    deleted = cursor.rowcount
+    _rollback_current(cursor, scan_id)
+    return deleted
+
+def _rollback_current(cursor, scan_id):
+    """
+    Inventário atual após um rollback: as linhas alteradas por scans apagados voltam
+    ao estado do último scan completo mantido da sua rede (ou saem, se o MAC não
+    estava nele; a linha do mesmo MAC em outra rede não é tocada). O contador de mudanças não é desfeito; as voltas entram no feed de eventos.
+    """
+    stale = cursor.execute(f'SELECT {_EVENT_COLUMNS}, network FROM current_devices WHERE scan_id > ?',
+                           (scan_id,)).fetchall()
+    by_network = {}
+    for row in stale:
+        by_network.setdefault(row['network'], []).append(row)
+    changes = []
+    for network, old_rows in by_network.items():
+        kept = cursor.execute('''SELECT scan_id, timestamp FROM scans WHERE network IS ? AND complete = 1
+                                 ORDER BY timestamp DESC LIMIT 1''', (network,)).fetchone()
+        rows = {}
+        if kept is not None:
+            params = _scan_params(cursor, kept['scan_id'])
+            rows = {row['mac']: row for row in cursor.execute(
+                _SCAN_ROWS.format(columns=_DEVICE_COLUMNS), params)}
+        for old in old_rows:
+            mac = old['mac']
+            row = rows.get(mac)
+            changes.append((mac, network, {k: old[k] for k in old.keys() if k != 'network'},
+                            row and dict({k: row[k] for k in _EVENT_COLUMNS.split(', ') if k != 'present'},
+                                         present=1)))
+            if row is None:
+                cursor.execute("DELETE FROM current_devices WHERE ifnull(network, '') = ifnull(?, '') AND mac = ?",
+                               (network, mac))
+                continue
+            cursor.execute(f'''
+                UPDATE current_devices SET ({_DEVICE_COLUMNS}, scan_id, last_changed) = ({', '.join('?' * 14)}),
+                    present = 1, last_seen = CASE WHEN ? = 'online' THEN ? ELSE last_seen END
+                WHERE ifnull(network, '') = ifnull(?, '') AND mac = ?
+            ''', tuple(row) + (kept['scan_id'], kept['timestamp'], row['status'], kept['timestamp'], network, mac))
+    _log_events(cursor, scan_id, datetime.now(), changes)
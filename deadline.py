@@ -0,0 +1,90 @@
+# deadline.py
+"""
+Prazos de um ciclo de scan.
+
+Um ciclo tem um prazo total (CYCLE_DEADLINE) e prazos por estágio
+(STAGE_DEADLINES), todos contados a partir do início do ciclo. Depois do prazo
+de um estágio, nenhum host começa aquele estágio; depois do prazo do ciclo,
+as sondagens que ainda não começaram são canceladas e o scan é salvo com o que
+já foi coletado. Cada dispositivo registra em 'stages' os estágios concluídos.
+"""
+
+import ipaddress
+import time
+
+import config
+
+# Estágios registrados em device['stages'] (os que não se aplicam ao host contam como concluídos)
+STAGES = ('ping', 'ports', 'snmp')
+
+
+# Campos do dispositivo produzidos por cada estágio
+STAGE_FIELDS = {
+    'ping': ('status', 'ttl', 'avg_latency', 'packet_loss'),
+    'ports': ('open_ports',),
+    'snmp': ('snmp_name', 'snmp_description', 'role'),
+}
+
+
+def sondagem_completa(device):
+    """Indica se todos os estágios do dispositivo foram concluídos (resultados sem 'stages' são completos)."""
+    stages = device.get('stages')
+    return stages is None or all(stage in stages for stage in STAGES)
+
+
+def mesclar_parcial(previous, partial):
+    """
+    Combina um resultado parcial com o último resultado conhecido do mesmo
+    dispositivo: os campos dos estágios concluídos vêm do parcial, os demais do
+    anterior. O resultado mantém 'stages' do parcial (continua marcado como incompleto).
+    """
+    merged = dict(previous)
+    merged['ip'] = partial['ip']
+    for stage in partial.get('stages', []):
+        for field in STAGE_FIELDS[stage]:
+            if field in partial:
+                merged[field] = partial[field]
+    merged['stages'] = list(partial.get('stages', []))
+    return merged
+
+
+def ip_na_varredura(ip, covered):
+    """
+    Indica se o IP está em uma das faixas [(primeiro, último)] (inteiros) que uma
+    descoberta interrompida chegou a varrer (ver discovery.discovery_arp_stream).
+    """
+    try:
+        addr = int(ipaddress.ip_address(ip))
+    except ValueError:
+        return False
+    return any(first <= addr <= last for first, last in covered)
+
+
+class ScanDeadline:
+    """Prazos absolutos (time.monotonic) do ciclo e de cada estágio. Valor 0/None = sem prazo."""
+
+    def __init__(self, cycle=None, stages=None):
+        self.started = time.monotonic()
+        cycle = config.CYCLE_DEADLINE if cycle is None else cycle
+        stages = config.STAGE_DEADLINES if stages is None else stages
+        self.cycle_at = self.started + cycle if cycle else None
+        self.stage_at = {name: self.started + seconds for name, seconds in stages.items() if seconds}
+
+    def expired(self, stage=None):
+        """Indica se o prazo do ciclo (ou do estágio informado) já passou."""
+        now = time.monotonic()
+        if self.cycle_at is not None and now >= self.cycle_at:
+            return True
+        at = self.stage_at.get(stage)
+        return at is not None and now >= at
+
+    def remaining(self, stage=None):
+        """Segundos até o prazo do ciclo (ou do estágio, se anterior); None se não houver prazo."""
+        limits = [at for at in (self.cycle_at, self.stage_at.get(stage)) if at is not None]
+        if not limits:
+            return None
+        return max(0.0, min(limits) - time.monotonic())
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
@@ -27,21 +27,18 @@ def create_digital_twin():
     # 1. Ler dados do Banco de Dados Real
     print("--- Consultando Banco de Dados de Autodescoberta ---")
     
-    # Pega o ID do último scan realizado
-    last_scan_id = database._get_latest_scan_id()
+    # Inventário atual (todas as redes): só os dispositivos que estão na rede agora
+    devices = database.get_current_devices(status='online')
     
-    if not last_scan_id:
-        print("Erro: Nenhum scan encontrado no banco de dados.")
+    if not devices:
+        print("Erro: Nenhum dispositivo online encontrado no banco de dados.")
         print("Rode o 'main.py' primeiro para popular o banco.")
         return
 
-    # Pega os dispositivos desse scan
-    devices = database.get_devices_for_scan_with_first_seen(last_scan_id)
-    
     # (Opcional) Pega os links se existirem, senão assume topologia estrela
     # links = database.get_links(last_scan_id) 
     
-    print(f"Scan ID: {last_scan_id} | Dispositivos encontrados: {len(devices)}")
+    print(f"Dispositivos online: {len(devices)}")
 
     # 2. Inicializar Mininet
     setLogLevel('info')
@@ -3,8 +3,10 @@
 Módulo de descoberta e identificação de dispositivos de rede.
 
 Implementa funções de varredura e análise usando múltiplos protocolos:
-- ARP scanning (scapy.arping) para descoberta de hosts ativos
-- ICMP ping para teste de conectividade
+- ARP scanning (scapy.arping) para descoberta de hosts ativos, opcionalmente
+  dividido entre vários processos
+- Tabela de vizinhos do kernel como pré-estágio (resultados imediatos)
+- ICMP ping para teste de conectividade (raw socket via icmp_engine, com fallback para o ping do SO)
 - SNMPv2c/v3 para identificação de papel (roteador/host) e informações de sistema
 
 Retorna estruturas padronizadas para integração com database.py
@@ -13,6 +15,7 @@ Retorna estruturas padronizadas para integração com database.py
 import subprocess  # Execução comandos de ping do sistema operacional
 import platform  # Detecção o sistema operacional (Windows, Linux, macOS)
 from scapy.all import arping  # Realização scan ARP na rede e descobrir dispositivos
+from scapy.all import ARP, Ether, AsyncSniffer, conf, sendp, srp  # Varredura ARP em shards (streaming)
 from pysnmp.hlapi import (
     getCmd, 
     SnmpEngine, 
@@ -23,20 +26,46 @@ from pysnmp.hlapi import (
     ObjectIdentity
 )
 import re  # Para extração de TTL da saída do ping
-import socket  # Para scan de portas TCP
+import ipaddress  # Divisão do CIDR em shards
+import itertools  # Envio dos shards em blocos
+import multiprocessing  # Varredura ARP em vários processos (modo 'process')
+import os
+import queue  # Respostas ARP entregues pelo sniffer
+import threading  # Envio dos shards em segundo plano
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 
 import config  # Importa para usar as configurações de SNMP
+import arp_engine  # Varredura ARP via AF_PACKET (frames pré-montados + BPF)
+import icmp_engine  # Ping nativo em lote (raw socket)
+import port_scanner  # Scan de portas TCP não bloqueante
+import ratelimit  # Orçamento global de pacotes por segundo
+import snmp_engine  # Motor SNMP compartilhado (asyncore, thread própria)
+import utils  # Interface padrão e tabela de vizinhos do kernel
 
-def discovery_arp(network_cidr):
+def discovery_arp(network_cidr, iface=None):
     """
     Executa um scan ARP na rede para descobrir hosts ativos.
     Retorna uma lista de dicionários, cada um com 'ip' e 'mac'.
+    'iface' força a interface de saída (padrão: a da rota para a rede).
     """
     
+    if config.ARP_ENGINE == 'afpacket':
+        devices = _discovery_arp_afpacket(network_cidr, config.ARP_PPS, iface)
+        if devices is not None:
+            return list(devices)
+
     print(f"(Discovery: Executando ARP scan em {network_cidr}...)")
     try:
+        # O arping envia tudo de uma vez: reserva o orçamento da rede inteira
+        # antes e espaça os envios na taxa efetiva da classe 'arp'.
+        budget = ratelimit.get_budget()
+        budget.acquire('arp', ipaddress.ip_network(network_cidr, strict=False).num_addresses)
+        rate = budget.rate_for('arp')
         # O timeout é herdado do config, que é ajustado em runtime pelo main.py
-        ans, unans = arping(network_cidr, timeout=config.SCAN_TIMEOUT, verbose=False)
+        extra = {'iface': iface} if iface else {}
+        ans, unans = arping(network_cidr, timeout=config.SCAN_TIMEOUT, verbose=False,
+                            inter=1.0 / rate if rate else 0, **extra)
         devices = []
         for sent, received in ans:
             devices.append({
@@ -49,13 +78,352 @@ def discovery_arp(network_cidr):
         print(f"Erro no scan ARP: {e}")
         return []
 
-def discovery_ping(ip, count=10):
+def discovery_neighbors(network_cidr, iface=None):
+    """
+    Pré-estágio sem custo de rede: importa da tabela de vizinhos do kernel os
+    hosts já resolvidos na interface ativa que pertencem ao CIDR alvo.
+    Retorna uma lista de {'ip', 'mac'} (vazia se a tabela não estiver disponível).
+    """
+    iface = iface or utils.get_default_interface()
+    try:
+        network = ipaddress.ip_network(network_cidr, strict=False)
+    except ValueError:
+        return []
+    devices = [n for n in utils.read_neighbor_table(iface) if ipaddress.ip_address(n['ip']) in network]
+    if devices:
+        print(f"(Discovery: {len(devices)} dispositivo(s) importado(s) da tabela de vizinhos do kernel.)")
+    return devices
+
+def _covered_ranges(network, start, count):
+    """Faixas [(primeiro, último)] (inteiros) dos 'count' endereços varridos a partir do deslocamento 'start'."""
+    first = int(network.network_address)
+    total = network.num_addresses
+    count = min(count, total)
+    if count <= 0:
+        return []
+    end = start + count
+    if end <= total:
+        return [(first + start, first + end - 1)]
+    return [(first + start, first + total - 1), (first, first + end - total - 1)]
+
+def _record_progress(progress, network, covered, start, complete):
+    """Atualiza o progresso de uma varredura (ver discovery_arp_stream)."""
+    if progress is None:
+        return
+    progress['complete'] = complete
+    progress['covered'] = [(int(network.network_address), int(network.broadcast_address))] if complete else covered
+    progress['start'] = 0 if complete else start
+
+def discovery_arp_stream(network_cidr, shard_prefix=None, pps=None, deadline=None, iface=None, progress=None):
+    """
+    Varredura ARP em shards, com taxa limitada e resultados em streaming.
+
+    Divide o CIDR em sub-redes de tamanho /shard_prefix (padrão config.ARP_SHARD_PREFIX)
+    e envia as requisições a no máximo 'pps' pacotes por segundo (padrão config.ARP_PPS),
+    enquanto um sniffer coleta as respostas. Cada dispositivo é gerado ({'ip', 'mac'})
+    assim que responde, sem esperar o fim da varredura.
+
+    Com um 'deadline' (deadline.ScanDeadline), a varredura é interrompida quando o
+    prazo do estágio 'discovery' se esgota, mantendo os hosts já encontrados.
+    'iface' força a interface de envio e escuta (padrão: a da rota para a rede).
+
+    'progress' (dicionário opcional, mantido pelo chamador entre os ciclos) faz
+    uma varredura interrompida ser retomada de onde parou: a próxima começa no
+    deslocamento 'start'. Ao terminar, ficam nele 'complete' (a rede inteira foi
+    varrida) e 'covered', as faixas [(primeiro, último)] de endereços (inteiros)
+    cujas respostas tiveram tempo de chegar: só nelas a falta de resposta indica
+    que um host saiu da rede.
+    """
+    shard_prefix = shard_prefix or config.ARP_SHARD_PREFIX
+    pps = pps or config.ARP_PPS
+
+    try:
+        network = ipaddress.ip_network(network_cidr, strict=False)
+        shards = list(network.subnets(new_prefix=max(shard_prefix, network.prefixlen)))
+        iface = iface or conf.route.route(str(network.network_address + 1))[0]
+    except Exception as e:
+        print(f"Erro no scan ARP: {e}")
+        return
+    start = (progress or {}).get('start', 0) % network.num_addresses
+    _record_progress(progress, network, [], start, False)
+
+    stop = (lambda: deadline.expired('discovery')) if deadline is not None else None
+
+    if config.ARP_ENGINE == 'afpacket':
+        devices = _discovery_arp_afpacket(network, pps, iface, stop, start, progress)
+        if devices is not None:
+            yield from devices
+            return
+
+    # Começa pelo shard em que a varredura anterior parou
+    shard_size = shards[0].num_addresses
+    first_shard = start // shard_size
+    shards = shards[first_shard:] + shards[:first_shard]
+    start = first_shard * shard_size
+    if first_shard:
+        print(f"(Discovery: Retomando a varredura de {network_cidr} a partir de {shards[0]}.)")
+
+    print(f"(Discovery: Executando ARP scan em {network_cidr} [{len(shards)} shard(s), {pps} pps]...)")
+
+    replies = queue.Queue()
+    sniffer = AsyncSniffer(
+        iface=iface,
+        store=False,
+        lfilter=lambda pkt: ARP in pkt and pkt[ARP].op == 2,  # is-at
+        prn=lambda pkt: replies.put((pkt[ARP].psrc, pkt[ARP].hwsrc))
+    )
+    sent_all = threading.Event()
+    cancelled = threading.Event()
+
+    budget = ratelimit.get_budget()
+    # Blocos de ~100 ms de envio: cada bloco reserva suas fichas no orçamento global
+    chunk_size = max(1, pps // 10)
+
+    # Instante em que terminou o envio de cada shard (na ordem da varredura)
+    sent_at = []
+
+    def _send_shards():
+        try:
+            for shard in shards:
+                packets = iter(Ether(dst='ff:ff:ff:ff:ff:ff') / ARP(pdst=str(shard)))
+                while not cancelled.is_set():
+                    chunk = list(itertools.islice(packets, chunk_size))
+                    if not chunk:
+                        sent_at.append(time.monotonic())
+                        break
+                    budget.acquire('arp', len(chunk))
+                    sendp(chunk, iface=iface, inter=1.0 / pps, verbose=False)
+        except Exception as e:
+            print(f"Erro no envio ARP: {e}")
+        finally:
+            sent_all.set()
+
+    try:
+        sniffer.start()
+    except Exception as e:
+        print(f"Erro no scan ARP: {e}")
+        return
+
+    sender = threading.Thread(target=_send_shards, name='arp-sender', daemon=True)
+    sender.start()
+
+    seen = set()
+    finish_at = None
+    complete = False
+    try:
+        while True:
+            if stop is not None and stop():
+                print("(Discovery: Prazo da descoberta esgotado; varredura ARP interrompida.)")
+                break
+            # Após o último shard, espera mais SCAN_TIMEOUT segundos por respostas atrasadas
+            if finish_at is None and sent_all.is_set():
+                finish_at = time.monotonic() + config.SCAN_TIMEOUT
+            if finish_at is not None and time.monotonic() >= finish_at and replies.empty():
+                complete = len(sent_at) == len(shards)
+                break
+            try:
+                ip, mac = replies.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if ip in seen or ipaddress.ip_address(ip) not in network:
+                continue
+            seen.add(ip)
+            yield {'ip': ip, 'mac': mac}
+    finally:
+        cancelled.set()
+        try:
+            sniffer.stop()
+        except Exception:
+            pass
+        # Shards enviados há menos de SCAN_TIMEOUT ainda podiam ter respostas a caminho
+        cutoff = time.monotonic() - config.SCAN_TIMEOUT
+        done = sum(1 for at in sent_at if at <= cutoff)
+        _record_progress(progress, network, _covered_ranges(network, start, done * shard_size),
+                         (start + done * shard_size) % network.num_addresses, complete)
+        print(f"(Discovery: ARP encontrou {len(seen)} dispositivo(s).)")
+
+def _discovery_arp_afpacket(network, pps, iface, stop=None, start=0, progress=None):
+    """
+    Varredura pelo motor AF_PACKET (arp_engine). Retorna um gerador de {'ip', 'mac'},
+    ou None se o socket não puder ser aberto (sem root, SO não-Linux), para o
+    chamador recorrer ao scapy.
+    """
+    try:
+        scanner = arp_engine.AfPacketArpScanner(iface)
+    except (OSError, AttributeError, KeyError, ValueError) as e:
+        print(f"(Discovery: Motor ARP AF_PACKET indisponível ({e}). Usando scapy.)")
+        return None
+
+    def _sweep():
+        print(f"(Discovery: Executando ARP scan em {network} via AF_PACKET [{iface}, {pps} pps]...)")
+        found = 0
+        state = {}
+        try:
+            for device in scanner.sweep(str(network), pps=pps, timeout=config.SCAN_TIMEOUT,
+                                        budget=ratelimit.get_budget(), stop=stop, start=start, progress=state):
+                found += 1
+                yield device
+        finally:
+            scanner.close()
+            # Os endereços enviados no último SCAN_TIMEOUT ainda podiam ter respostas a caminho
+            done = max(0, state.get('sent', 0) - int(pps * config.SCAN_TIMEOUT))
+            _record_progress(progress, network, _covered_ranges(network, start, done),
+                             (start + done) % network.num_addresses, state.get('complete', False))
+            print(f"(Discovery: ARP encontrou {found} dispositivo(s).)")
+
+    return _sweep()
+
+def discovery_arp_processes(network_cidr, processes=None, pps=None, deadline=None, iface=None, progress=None):
+    """
+    Varredura ARP dividida entre processos (modo 'process').
+
+    A montagem e a dissecação de pacotes do scapy consomem CPU sob o GIL do
+    orquestrador; aqui o CIDR é dividido em uma faixa por processo e cada
+    processo varre a sua com srp, devolvendo tuplas compactas (ip, mac) como
+    inteiros. Os dispositivos ({'ip', 'mac'}) são gerados à medida que cada
+    faixa termina.
+
+    A taxa 'pps' (limitada pelo orçamento da classe 'arp') é dividida entre os
+    processos, e os pacotes enviados por eles são debitados do orçamento global
+    deste processo. Com um 'deadline', as faixas que ainda não começaram são
+    canceladas quando o prazo da descoberta se esgota. 'progress' funciona como
+    em discovery_arp_stream: a próxima varredura começa pela primeira faixa não concluída.
+    """
+    processes = processes or config.ARP_PROCESSES or os.cpu_count() or 1
+    pps = pps or config.ARP_PPS
+
+    try:
+        network = ipaddress.ip_network(network_cidr, strict=False)
+        iface = iface or conf.route.route(str(network.network_address + 1))[0]
+    except Exception as e:
+        print(f"Erro no scan ARP: {e}")
+        return
+
+    ranges = _split_range(int(network.network_address), int(network.broadcast_address), processes)
+    # Começa pela faixa em que a varredura anterior parou
+    start = int(network.network_address) + (progress or {}).get('start', 0) % network.num_addresses
+    resume = next(i for i, (low, high) in enumerate(ranges) if low <= start <= high)
+    ranges = ranges[resume:] + ranges[:resume]
+    _record_progress(progress, network, [], ranges[0][0] - int(network.network_address), False)
+    budget = ratelimit.get_budget()
+    budget_rate = budget.rate_for('arp')
+    rate = min(pps, budget_rate) if budget_rate else pps
+    budget.charge('arp', network.num_addresses)
+
+    print(f"(Discovery: Executando ARP scan em {network_cidr} [{len(ranges)} processo(s), {rate} pps]...)")
+    pool = _get_process_pool(processes)
+    futures = [pool.submit(_arp_range_worker, first, last, iface, rate / len(ranges), config.SCAN_TIMEOUT)
+               for first, last in ranges]
+
+    found = 0
+    covered = set()
+    pending = set(futures)
+    try:
+        while pending:
+            if deadline is not None and deadline.expired('discovery'):
+                print("(Discovery: Prazo da descoberta esgotado; varredura ARP interrompida.)")
+                break
+            timeout = deadline.remaining('discovery') if deadline is not None else None
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    results = future.result()
+                except Exception as e:
+                    print(f"Erro no scan ARP: {e}")
+                    continue
+                covered.add(futures.index(future))
+                for ip, mac in results:
+                    found += 1
+                    yield {'ip': str(ipaddress.IPv4Address(ip)), 'mac': _mac_str(mac)}
+    finally:
+        for future in pending:
+            future.cancel()
+        unfinished = [i for i in range(len(ranges)) if i not in covered]
+        _record_progress(progress, network, [ranges[i] for i in sorted(covered)],
+                         ranges[unfinished[0]][0] - int(network.network_address) if unfinished else 0,
+                         not unfinished)
+        print(f"(Discovery: ARP encontrou {found} dispositivo(s).)")
+
+def _split_range(first, last, parts):
+    """Divide [first, last] em até 'parts' faixas contíguas de tamanho parecido."""
+    total = last - first + 1
+    parts = max(1, min(parts, total))
+    size, extra = divmod(total, parts)
+    ranges = []
+    for i in range(parts):
+        end = first + size + (1 if i < extra else 0) - 1
+        ranges.append((first, end))
+        first = end + 1
+    return ranges
+
+def _mac_str(mac):
+    return ':'.join(f'{b:02x}' for b in mac.to_bytes(6, 'big'))
+
+def _arp_range_worker(first, last, iface, pps, timeout):
+    """
+    Executado em um processo do pool: varre os IPs de [first, last] e devolve
+    [(ip, mac), ...] como inteiros (menos dados para serializar de volta).
+    """
+    ips = [str(ipaddress.IPv4Address(n)) for n in range(first, last + 1)]
+    ans, _ = srp(Ether(dst='ff:ff:ff:ff:ff:ff') / ARP(pdst=ips), iface=iface, timeout=timeout,
+                 inter=1.0 / pps if pps else 0, verbose=False)
+    return [(int(ipaddress.IPv4Address(r.psrc)), int(r.hwsrc.replace(':', ''), 16)) for _, r in ans]
+
+_process_pool = None
+_process_pool_size = 0
+_process_pool_lock = threading.Lock()
+
+def _get_process_pool(processes):
+    """
+    Pool de processos compartilhado (recriado se o número de processos mudar).
+    Usa 'spawn': o orquestrador tem muitas threads, e fork copiaria locks presos.
+    """
+    global _process_pool, _process_pool_size
+    with _process_pool_lock:
+        if _process_pool is None or _process_pool_size != processes:
+            if _process_pool is not None:
+                _process_pool.shutdown(wait=False)
+            _process_pool = ProcessPoolExecutor(max_workers=processes,
+                                                mp_context=multiprocessing.get_context('spawn'))
+            _process_pool_size = processes
+        return _process_pool
+
+def discovery_ping(ip, count=None):
     """
     Verifica se um IP está respondendo, calcula TTL, Latência Média e Perda de Pacotes.
-    Envia 'count' pacotes (padrão 10).
+    Envia 'count' pacotes (padrão config.PING_COUNT).
     
     Retorna dicionário com: 'status', 'ttl', 'avg_latency' (ms), 'packet_loss' (%)
     """
+    return discovery_ping_batch([ip], count)[ip]
+
+def ping_nativo_disponivel():
+    """Indica se o ping usa o motor ICMP nativo (em lote) em vez do ping do sistema."""
+    return bool(config.ICMP_RAW_SOCKET) and icmp_engine.get_prober() is not None
+
+def discovery_ping_batch(ips, count=None):
+    """
+    Executa o ping de vários IPs de uma só vez.
+    Usa o motor ICMP nativo (um único socket raw para todos os alvos) quando
+    disponível; caso contrário, recorre ao ping do sistema operacional, host a host.
+    
+    Retorna {ip: resultado no formato de discovery_ping}.
+    """
+    if count is None:
+        count = config.PING_COUNT
+
+    prober = icmp_engine.get_prober() if config.ICMP_RAW_SOCKET else None
+    if prober is not None:
+        try:
+            return prober.ping_many(ips, count=count, interval=config.PING_INTERVAL, timeout=config.PING_TIMEOUT)
+        except Exception as e:
+            print(f"Erro no ping nativo, usando o ping do sistema: {e}")
+
+    return {ip: _discovery_ping_subprocess(ip, count) for ip in ips}
+
+def _discovery_ping_subprocess(ip, count):
+    """Fallback: executa o comando ping do sistema e interpreta a saída textual."""
+    ratelimit.get_budget().acquire('icmp', count)
     try:
         system_os = platform.system().lower()
         command = ['ping']
@@ -122,19 +490,33 @@ def discovery_ping(ip, count=10):
         print(f"Erro inesperado no ping: {e}")
         return {'status': 'offline', 'ttl': None, 'avg_latency': None, 'packet_loss': 100.0}
     
-def discovery_snmp_basic(ip):
+def discovery_snmp_basic(ip, community=None):
     """
     Tenta obter informações básicas de um dispositivo via SNMP,
     incluindo nome, descrição e se é um roteador (ipForwarding).
+    Usa o motor SNMP compartilhado (snmp_engine) quando disponível.
+    'community' padrão: config.SNMP_COMMUNITY.
     """
+    engine = snmp_engine.get_engine()
+    if engine is not None:
+        try:
+            return engine.query(ip, community)
+        except Exception:
+            return {}
+    return _discovery_snmp_sync(ip, community)
+
+def _discovery_snmp_sync(ip, community=None):
+    """Fallback síncrono (um SnmpEngine por chamada), usado sem a hlapi asyncore."""
+    ratelimit.get_budget().acquire('snmp')
     iterator = getCmd(
         SnmpEngine(),
-        CommunityData(config.SNMP_COMMUNITY, mpModel=1),
+        CommunityData(community or config.SNMP_COMMUNITY, mpModel=1),
         UdpTransportTarget((ip, config.SNMP_PORT), timeout=config.SNMP_TIMEOUT, retries=config.SNMP_RETRIES),
         ContextData(),
-        ObjectType(ObjectIdentity('SNMPv2-MIB', 'sysName', 0)),
-        ObjectType(ObjectIdentity('SNMPv2-MIB', 'sysDescr', 0)),
-        ObjectType(ObjectIdentity('IP-MIB', 'ipForwarding', 0)) 
+        ObjectType(ObjectIdentity(snmp_engine.OID_SYS_NAME)),
+        ObjectType(ObjectIdentity(snmp_engine.OID_SYS_DESCR)),
+        ObjectType(ObjectIdentity(snmp_engine.OID_IP_FORWARDING)),
+        lookupMib=False
     )
 
     try:
@@ -143,28 +525,7 @@ def discovery_snmp_basic(ip):
         if errorIndication or errorStatus:
             return {}
 
-        snmp_data = {}
-        for varBind in varBinds:
-            key = varBind[0].getMibSymbol()[0]
-            value = varBind[1]
-
-            if key == 'sysName':
-                snmp_data['snmp_name'] = str(value)
-            elif key == 'sysDescr':
-                snmp_data['snmp_description'] = str(value)
-            elif key == 'ipForwarding':
-                # O valor 1 significa 'forwarding' (é um roteador)
-                # O valor 2 significa 'not-forwarding' (é um host)
-                if int(value) == 1:
-                    snmp_data['role'] = 'Roteador'
-                else:
-                    snmp_data['role'] = 'Host'
-        
-        # Se a role não foi descoberta via ipForwarding, deixa em branco
-        if 'role' not in snmp_data:
-            snmp_data['role'] = 'N/A'
-
-        return snmp_data
+        return snmp_engine.parse_basic_varbinds(varBinds)
 
     except Exception:
         return {}
@@ -175,13 +536,11 @@ def discovery_tcp_ports(ip):
     Executa um scan rápido em portas TCP predefinidas para um IP.
     Retorna um dicionário com uma lista de portas abertas.
     """
-    open_ports = []
-    for port in config.PORTS_TO_SCAN:
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(config.PORT_SCAN_TIMEOUT)
-        # result == 0 indica sucesso (porta aberta), result > 0 indica erro
-        result = sock.connect_ex((ip, port))
-        if result == 0:
-            open_ports.append(port)
-        sock.close()
-    return {'open_ports': open_ports}
\ No newline at end of file
+    return port_scanner.scan_ports([ip])[ip]
+
+def discovery_tcp_ports_batch(ips):
+    """
+    Escaneia as portas de config.PORTS_TO_SCAN em vários IPs ao mesmo tempo.
+    Retorna {ip: {'open_ports': [...]}}.
+    """
+    return port_scanner.scan_ports(ips)
@@ -0,0 +1,205 @@
+# icmp_engine.py
+"""
+Motor ICMP nativo (raw socket) para medição de TTL, latência e perda.
+
+Substitui o fork de /bin/ping por host:
+- Um único socket raw envia Echo Requests para todos os alvos
+- Uma thread receptora casa as respostas por identificador e sequência
+- TTL, RTT médio e perda são calculados diretamente dos pacotes
+
+Requer root (CAP_NET_RAW). Quando o socket raw não pode ser criado,
+get_prober() retorna None e discovery.py usa o ping do sistema como fallback.
+"""
+
+import os
+import socket
+import struct
+import threading
+import time
+
+import ratelimit
+
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+
+# Carga útil fixa (mesmo tamanho padrão do ping do Linux: 56 bytes)
+_PAYLOAD = bytes(range(56))
+
+
+def _checksum(data):
+    """Checksum da Internet (RFC 1071) usado no cabeçalho ICMP."""
+    if len(data) % 2:
+        data += b'\x00'
+    total = sum(struct.unpack(f'!{len(data) // 2}H', data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+def _build_echo_request(ident, seq):
+    header = struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, 0, ident, seq)
+    checksum = _checksum(header + _PAYLOAD)
+    return struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, checksum, ident, seq) + _PAYLOAD
+
+
+class _Batch:
+    """Estado de uma rodada de pings (um conjunto de alvos)."""
+
+    def __init__(self, ips):
+        self.stats = {ip: {'sent': 0, 'rtts': [], 'ttl': None} for ip in ips}
+        self.outstanding = 0
+        self.done = threading.Condition()
+
+
+class IcmpProber:
+    """
+    Envia Echo Requests em lote por um único socket raw e coleta as respostas.
+    Pode ser usado por várias threads ao mesmo tempo.
+    """
+
+    def __init__(self):
+        # Lança PermissionError sem privilégios de root
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+        self._ident = os.getpid() & 0xFFFF
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._next_seq = 0
+        # seq -> (batch, ip, instante de envio)
+        self._pending = {}
+
+        receiver = threading.Thread(target=self._receive_loop, name='icmp-receiver', daemon=True)
+        receiver.start()
+
+    def _allocate_seq(self):
+        """Reserva um número de sequência livre (16 bits, com wrap-around)."""
+        for _ in range(0x10000):
+            seq = self._next_seq
+            self._next_seq = (self._next_seq + 1) & 0xFFFF
+            if seq not in self._pending:
+                return seq
+        return None
+
+    def ping_many(self, ips, count=10, interval=0.2, timeout=1.0):
+        """
+        Envia 'count' Echo Requests para cada IP, espaçados por 'interval' segundos,
+        e aguarda até 'timeout' segundos após o último envio.
+
+        Retorna {ip: {'status', 'ttl', 'avg_latency', 'packet_loss'}}.
+        """
+        ips = list(dict.fromkeys(ips))
+        batch = _Batch(ips)
+        budget = ratelimit.get_budget()
+
+        for round_index in range(count):
+            round_start = time.monotonic()
+            for ip in ips:
+                # A espera do orçamento de pacotes não pode entrar no RTT: o instante
+                # de envio só é anotado logo antes do sendto
+                budget.acquire('icmp')
+                with self._send_lock:
+                    with self._lock:
+                        seq = self._allocate_seq()
+                        if seq is None:
+                            continue
+                        self._pending[seq] = (batch, ip, time.monotonic())
+                    with batch.done:
+                        batch.outstanding += 1
+                    try:
+                        self._sock.sendto(_build_echo_request(self._ident, seq), (ip, 0))
+                    except OSError:
+                        # Destino inválido ou sem rota: conta como perda
+                        with self._lock:
+                            self._pending.pop(seq, None)
+                        with batch.done:
+                            batch.outstanding -= 1
+                batch.stats[ip]['sent'] += 1
+
+            if round_index < count - 1:
+                remaining = interval - (time.monotonic() - round_start)
+                if remaining > 0:
+                    time.sleep(remaining)
+
+        # Aguarda as respostas restantes (ou o timeout)
+        deadline = time.monotonic() + timeout
+        with batch.done:
+            while batch.outstanding > 0:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                batch.done.wait(remaining)
+
+        # Descarta as sequências que não foram respondidas a tempo
+        with self._lock:
+            for seq in [s for s, entry in self._pending.items() if entry[0] is batch]:
+                del self._pending[seq]
+
+        return {ip: _summarize(stats) for ip, stats in batch.stats.items()}
+
+    def _receive_loop(self):
+        buf = bytearray(2048)
+        while True:
+            try:
+                nbytes, addr = self._sock.recvfrom_into(buf)
+            except OSError:
+                time.sleep(0.1)
+                continue
+            received_at = time.monotonic()
+
+            # O socket raw entrega o cabeçalho IP junto: TTL no byte 8
+            ihl = (buf[0] & 0x0F) * 4
+            if nbytes < ihl + 8 or buf[ihl] != ICMP_ECHO_REPLY:
+                continue
+            ident, seq = struct.unpack_from('!HH', buf, ihl + 4)
+            if ident != self._ident:
+                continue
+
+            with self._lock:
+                entry = self._pending.get(seq)
+                if entry is None or entry[1] != addr[0]:
+                    continue
+                del self._pending[seq]
+
+            batch, ip, sent_at = entry
+            stats = batch.stats[ip]
+            stats['rtts'].append((received_at - sent_at) * 1000.0)
+            if stats['ttl'] is None:
+                stats['ttl'] = buf[8]
+            with batch.done:
+                batch.outstanding -= 1
+                if batch.outstanding <= 0:
+                    batch.done.notify_all()
+
+
+def _summarize(stats):
+    """Converte as estatísticas brutas no mesmo formato de discovery.discovery_ping."""
+    sent = stats['sent']
+    received = len(stats['rtts'])
+    if sent == 0 or received == 0:
+        return {'status': 'offline', 'ttl': None, 'avg_latency': None, 'packet_loss': 100.0}
+    return {
+        'status': 'online',
+        'ttl': stats['ttl'],
+        'avg_latency': round(sum(stats['rtts']) / received, 3),
+        'packet_loss': float((sent - received) * 100 // sent)
+    }
+
+
+_prober = None
+_prober_failed = False
+_prober_lock = threading.Lock()
+
+
+def get_prober():
+    """
+    Retorna a instância compartilhada do IcmpProber, ou None se o socket raw
+    não estiver disponível (sem root, SO sem suporte, etc.).
+    """
+    global _prober, _prober_failed
+    with _prober_lock:
+        if _prober is None and not _prober_failed:
+            try:
+                _prober = IcmpProber()
+            except (OSError, AttributeError) as e:
+                print(f"(ICMP: Socket raw indisponível ({e}). Usando o ping do sistema.)")
+                _prober_failed = True
+        return _prober
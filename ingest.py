@@ -0,0 +1,267 @@
+# ingest.py
+"""
+Recepção central dos resultados enviados por coletores remotos (collector.py).
+
+Protocolo (TCP ou socket Unix): quadros com 4 bytes de tamanho (big-endian)
+seguidos de JSON comprimido com zlib.
+- coletor -> central: hello {'collector', 'session', 'network', 'token'}
+- central -> coletor: welcome {'last_seq'} (último lote recebido desta sessão)
+- coletor -> central: batch {'seq', 'scan', 'final', 'devices'}, com cada
+  dispositivo como uma lista compacta na ordem de FIELDS
+- central -> coletor: ack {'seq'}
+
+Cada scan do coletor chega em um ou mais lotes; no lote final a central grava
+o scan inteiro com database.salvar_resultado_scan, na rede do coletor.
+
+Reconexão: o coletor reenvia apenas os lotes posteriores a 'last_seq'. Se a
+central reiniciou, 'last_seq' é o último lote final gravado no banco (tabela
+ingest_progress, atualizada na mesma transação do scan), e o coletor reenvia o
+scan em andamento inteiro, que ele retém até a confirmação do lote final.
+Backpressure: o coletor mantém no máximo COLLECTOR_WINDOW lotes sem
+confirmação, e a central só lê o próximo lote depois de processar o anterior.
+"""
+
+import ipaddress
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+import zlib
+
+import config
+import database
+import metrics
+
+# Ordem dos campos de um dispositivo nos lotes (listas em vez de dicionários)
+FIELDS = ('ip', 'mac', 'status', 'ttl', 'avg_latency', 'packet_loss', 'open_ports',
+          'role', 'snmp_name', 'producer', 'stages')
+
+_HEADER = struct.Struct('!I')
+MAX_FRAME = 64 * 1024 * 1024
+# Limite do JSON descomprimido (um quadro pequeno pode expandir para vários GB)
+MAX_DECOMPRESSED = 64 * 1024 * 1024
+
+
+def parse_address(address):
+    """'unix:/caminho' ou 'host:porta' -> (família, endereço)."""
+    if address.startswith('unix:'):
+        return socket.AF_UNIX, address[5:]
+    host, _, port = address.rpartition(':')
+    return socket.AF_INET, (host or '0.0.0.0', int(port))
+
+
+def pack_device(device):
+    return [device.get(field) for field in FIELDS]
+
+
+def unpack_device(values):
+    device = dict(zip(FIELDS, values))
+    device['open_ports'] = device.get('open_ports') or []
+    if device.get('stages') is None:
+        device.pop('stages', None)  # Sondagem completa
+    return device
+
+
+def send_frame(sock, message):
+    payload = zlib.compress(json.dumps(message, separators=(',', ':')).encode(), config.INGEST_COMPRESSION)
+    sock.sendall(_HEADER.pack(len(payload)) + payload)
+
+
+def _recv_exact(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def recv_frame(sock):
+    """Lê um quadro; retorna None se a conexão foi fechada."""
+    header = _recv_exact(sock, _HEADER.size)
+    if header is None:
+        return None
+    (size,) = _HEADER.unpack(header)
+    if size > MAX_FRAME:
+        raise ValueError(f"Quadro grande demais ({size} bytes)")
+    payload = _recv_exact(sock, size)
+    if payload is None:
+        return None
+    decompressor = zlib.decompressobj()
+    data = decompressor.decompress(payload, MAX_DECOMPRESSED)
+    if decompressor.unconsumed_tail:
+        raise ValueError(f"Quadro descomprimido grande demais (mais de {MAX_DECOMPRESSED} bytes)")
+    if not decompressor.eof:
+        raise ValueError("Quadro comprimido incompleto")
+    return json.loads(data)
+
+
+def is_loopback(address):
+    """Indica se o endereço ('unix:...' conta como local) só aceita conexões da própria máquina."""
+    family, addr = parse_address(address)
+    if family == socket.AF_UNIX:
+        return True
+    try:
+        return ipaddress.ip_address(addr[0]).is_loopback
+    except ValueError:
+        return addr[0] == 'localhost'
+
+
+class _IngestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        self.server.ingest.serve_connection(self.request)
+
+
+class _TcpServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _UnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+class IngestServer:
+    """Servidor de ingestão: uma thread por coletor conectado, estado de retomada por coletor."""
+
+    def __init__(self, address=None, token=None):
+        self.address = address or config.INGEST_ADDRESS
+        self.token = token if token is not None else config.INGEST_TOKEN
+        self._collectors = {}  # id -> {'session', 'network', 'last_seq', 'scan', 'devices', contadores}
+        self._lock = threading.Lock()
+        self._connections = set()
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        """
+        Começa a aceitar coletores. Sem INGEST_TOKEN, só escuta em loopback ou em
+        socket Unix: retorna False (sem iniciar) para um endereço TCP externo.
+        """
+        if not self.token and not is_loopback(self.address):
+            print(f"(Ingest: Recepção não iniciada: {self.address} aceita conexões externas e "
+                  f"INGEST_TOKEN está vazio. Defina um token ou use um endereço local.)")
+            return False
+        family, addr = parse_address(self.address)
+        if family == socket.AF_UNIX:
+            if os.path.exists(addr):
+                os.unlink(addr)
+            self._server = _UnixServer(addr, _IngestHandler)
+        else:
+            self._server = _TcpServer(addr, _IngestHandler)
+        self._server.ingest = self
+        self._thread = threading.Thread(target=self._server.serve_forever, name='ingest', daemon=True)
+        self._thread.start()
+        print(f"(Ingest: Aguardando coletores em {self.address}...)")
+        return True
+
+    def stop(self):
+        """Para de aceitar conexões e derruba as conexões ativas (os coletores reconectam)."""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        with self._lock:
+            connections = list(self._connections)
+        for sock in connections:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def serve_connection(self, sock):
+        collector = None
+        with self._lock:
+            self._connections.add(sock)
+        try:
+            hello = recv_frame(sock)
+            if not hello or hello.get('type') != 'hello':
+                return
+            if self.token and hello.get('token') != self.token:
+                send_frame(sock, {'type': 'error', 'reason': 'token inválido'})
+                return
+            state = self._open_session(hello)
+            collector = hello['collector']
+            send_frame(sock, {'type': 'welcome', 'last_seq': state['last_seq']})
+            while True:
+                message = recv_frame(sock)
+                if message is None:
+                    break
+                if message.get('type') == 'batch':
+                    self._ingest_batch(state, message)
+                    send_frame(sock, {'type': 'ack', 'seq': message['seq']})
+        except (OSError, ValueError, zlib.error) as e:
+            print(f"(Ingest: Conexão com coletor encerrada: {e})")
+        except (KeyError, TypeError, AttributeError) as e:
+            # Mensagem fora do protocolo (campo ausente ou de tipo errado)
+            print(f"(Ingest: Mensagem inválida do coletor; conexão encerrada: {e!r})")
+        finally:
+            with self._lock:
+                self._connections.discard(sock)
+                if collector in self._collectors:
+                    self._collectors[collector]['connected'] = False
+
+    def _open_session(self, hello):
+        with self._lock:
+            state = self._collectors.get(hello['collector'])
+            # Sessão nova (coletor reiniciou): a numeração dos lotes recomeça
+            if state is None or state['session'] != hello.get('session'):
+                previous = state or {}
+                # Central reiniciada: retoma do último scan deste coletor gravado no banco
+                stored = database.get_ingest_progress(hello['collector']) if state is None else None
+                last_seq = stored[1] if stored and stored[0] == hello.get('session') else 0
+                state = {
+                    'session': hello.get('session'), 'last_seq': last_seq, 'scan': None, 'devices': [],
+                    'batches': previous.get('batches', 0), 'scans': previous.get('scans', 0),
+                    'resent': previous.get('resent', 0)
+                }
+                self._collectors[hello['collector']] = state
+            state['collector'] = hello['collector']
+            state['network'] = hello.get('network')
+            state['connected'] = True
+            state['last_seen'] = time.time()
+            return state
+
+    def _ingest_batch(self, state, message):
+        with self._lock:
+            state['last_seen'] = time.time()
+            if message['seq'] <= state['last_seq']:
+                state['resent'] += 1  # Reenvio após reconexão: já recebido
+                return
+            if message['scan'] != state['scan']:
+                # Começo de outro scan; um scan anterior sem lote final é descartado
+                state['scan'] = message['scan']
+                state['devices'] = []
+            state['devices'].extend(unpack_device(values) for values in message['devices'])
+            devices = state['devices'] if message.get('final') else None
+            network = state['network']
+            progress = (state['collector'], state['session'], message['seq'])
+
+        if devices is not None:
+            # O ack só sai depois do commit: o lote final confirmado está no banco
+            database.salvar_resultado_scan(devices, network=network, progress=progress).result()
+            metrics.record(devices)
+
+        with self._lock:
+            if devices is not None:
+                state['devices'] = []
+                state['scans'] += 1
+            state['last_seq'] = message['seq']
+            state['batches'] += 1
+
+    def stats(self):
+        """Estado de cada coletor conhecido (para a CLI)."""
+        with self._lock:
+            return {
+                collector_id: {
+                    'network': s.get('network'), 'connected': s.get('connected', False),
+                    'last_seen': s.get('last_seen'), 'last_seq': s['last_seq'], 'batches': s['batches'],
+                    'scans': s['scans'], 'resent': s['resent'], 'buffered': len(s['devices'])
+                }
+                for collector_id, s in self._collectors.items()
+            }
@@ -3,11 +3,13 @@
 Módulo principal do sistema de autodescoberta de rede.
 
 Responsável pela orquestração dos componentes do sistema, incluindo:
-- Thread de monitoramento contínuo (polling adaptativo)
+- Thread de monitoramento contínuo (polling adaptativo), uma por rede alvo
+- Agendamento de sondagens por dispositivo (scheduler.py)
 - Gerenciamento de estado compartilhado entre componentes
 - Interface CLI para controle interativo
 """
 
+import ipaddress
 import json
 import threading
 import time
@@ -16,14 +18,25 @@ import cli
 import config
 import database
 import discovery
+import metrics
 import utils
-from oui_db import OUI_DATABASE
+from cache import EnrichmentCache, SnmpCredentialCache
+from deadline import ScanDeadline, ip_na_varredura, sondagem_completa
+from ingest import IngestServer
+from passive import PassiveListener
+from probe_engine import ProbeEngine
+from retention import RetentionWorker
+from scheduler import ProbeScheduler
 from utils import get_default_gateway_ip  # Importação necessária para detecção de gateway
 
 
-def _write_status_file(shared_state, devices):
+_status_file_lock = threading.Lock()
+
+
+def _write_status_file(shared_state):
     """
-    Escreve o estado atual e a lista de dispositivos em um arquivo JSON.
+    Escreve o estado atual e a lista de dispositivos (inventário atual do banco,
+    de todas as redes) em um arquivo JSON.
     
     Este arquivo é consumido pelo agent_script.py (subagente SNMP pass_persist)
     para responder a queries SNMP baseadas na AUTO-DISCOVERY-MIB.
@@ -33,217 +46,563 @@ def _write_status_file(shared_state, devices):
     - status: Contadores e status atual (nextScanInSeconds, scansPerformedTotal, lastScanDeviceCount)
     - devices: Array de dispositivos descobertos com todos os campos da MIB
     """
+    # Com várias redes monitoradas, targetNetwork lista os CIDRs separados por vírgula
+    networks = [target['cidr'] for target in shared_state.get('networks') or []]
     status_data = {
         "control": {
-            "targetNetwork": shared_state.get('network_cidr') or 'auto'
+            "targetNetwork": ','.join(networks) or shared_state.get('network_cidr') or 'auto'
         },
         "status": {
             "nextScanInSeconds": int(shared_state.get('next_scan_in', 0)),
             "scansPerformedTotal": int(shared_state.get('scans_performed', 0)),
             "lastScanDeviceCount": int(shared_state.get('device_count', 0))
         },
-        "devices": devices
+        "devices": database.get_current_devices()
     }
     try:
-        with open('status.json', 'w') as f:
+        # As threads de cada rede escrevem o mesmo arquivo
+        with _status_file_lock, open('status.json', 'w') as f:
             json.dump(status_data, f, indent=4, default=str)
     except Exception as e:
         print(f"(Erro ao escrever arquivo de status: {e})")
 
 
+def _update_passive_listener(listener, enabled, silent_mode, ifaces=None):
+    """
+    Liga ou desliga a escuta passiva conforme a configuração atual. 'ifaces' são
+    as interfaces das redes alvo; se mudarem, a escuta é reiniciada nas novas.
+    """
+    if enabled and listener is not None and listener.iface != ifaces:
+        listener.stop()
+        listener = None
+    if enabled and listener is None:
+        listener = PassiveListener(ifaces)
+        try:
+            listener.start()
+        except Exception as e:
+            if not silent_mode:
+                print(f"(Orquestrador: Não foi possível iniciar a escuta passiva: {e})")
+            return None
+    elif not enabled and listener is not None:
+        listener.stop()
+        listener = None
+    return listener
+
+
+def _warm_start(enrichment_cache, snmp_cache, silent_mode, network=None):
+    """
+    Carrega o último scan persistido (da rede informada, se houver) para evitar
+    uma redescoberta a frio após um reinício: preenche os caches por MAC e
+    devolve (hosts_conhecidos, contagem). Retorna ([], -1) se não houver scan anterior.
+    """
+    try:
+        snapshot = database.get_last_scan_snapshot(network)
+    except Exception as e:
+        if not silent_mode:
+            print(f"(Orquestrador: Warm start indisponível: {e})")
+        return [], -1
+    if snapshot is None:
+        return [], -1
+
+    stored_at = snapshot['timestamp'].timestamp() if snapshot['timestamp'] else None
+    default_gateway = get_default_gateway_ip()  # O gateway nunca é consultado via SNMP
+    known = []
+    for dev in snapshot['devices']:
+        mac = (dev.get('mac') or '').lower()
+        if not mac or dev.get('status') != 'online':
+            continue
+        known.append({'ip': dev['ip'], 'mac': mac})
+        if not sondagem_completa(dev):
+            continue  # Resultado parcial: não serve para os caches
+
+        # O papel persistido só veio do SNMP quando o host respondeu (snmp_name presente)
+        snmp_info = {'snmp_name': dev['snmp_name'], 'role': dev.get('role')} if dev.get('snmp_name') else {}
+        if enrichment_cache is not None and stored_at is not None:
+            enrichment_cache.put(mac, dev['ip'], dev.get('ttl'), dev.get('open_ports', []),
+                                 snmp_info, dev.get('producer'), stored_at=stored_at)
+        if snmp_cache is not None and not snmp_info and dev['ip'] != default_gateway:
+            snmp_cache.record_failure(mac, dev.get('open_ports', []), dev.get('ttl'))
+
+    if not silent_mode:
+        print(f"(Orquestrador: Warm start a partir do scan #{snapshot['scan_id']} "
+              f"({len(snapshot['devices'])} dispositivo(s), {len(known)} online).)")
+    return known, len(snapshot['devices'])
+
+
+def _known_hosts_first(known, devices, network_cidr, confirmed):
+    """
+    Gera primeiro os hosts online do último scan (na rede alvo) e depois os da
+    descoberta atual ainda não gerados. Os MACs vistos pela descoberta atual são
+    anotados em 'confirmed'.
+    """
+    network = ipaddress.ip_network(network_cidr, strict=False)
+    seen = set()
+    for device in known:
+        if ipaddress.ip_address(device['ip']) in network:
+            seen.add(device['mac'])
+            yield dict(device)
+    for device in devices:
+        mac = device['mac'].lower()
+        confirmed.add(mac)
+        if mac in seen:
+            continue
+        seen.add(mac)
+        yield device
+
+
+def _seed_from_neighbors(seed, devices, candidates):
+    """
+    Gera primeiro os vizinhos já conhecidos pelo kernel e depois os dispositivos
+    da varredura ativa que ainda não apareceram (mesmo MAC). Os MACs da tabela do
+    kernel ficam em 'candidates' até a varredura ativa confirmá-los.
+    """
+    seen = set()
+    for device in seed:
+        seen.add(device['mac'].lower())
+        candidates.add(device['mac'].lower())
+        yield device
+    for device in devices:
+        candidates.discard(device['mac'].lower())
+        if device['mac'].lower() in seen:
+            continue
+        seen.add(device['mac'].lower())
+        yield device
+
+
+def _merge_passive_devices(devices, listener, network_cidr):
+    """
+    Gera os dispositivos da varredura ativa e, ao final, os que só foram vistos
+    pela escuta passiva (dentro da janela PASSIVE_FRESHNESS) na rede alvo.
+    """
+    seen = set()
+    for device in devices:
+        seen.add(device['mac'].lower())
+        yield device
+
+    if listener is None:
+        return
+    network = ipaddress.ip_network(network_cidr, strict=False)
+    for entry in listener.snapshot(config.PASSIVE_FRESHNESS):
+        if entry['mac'] in seen or ipaddress.ip_address(entry['ip']) not in network:
+            continue
+        seen.add(entry['mac'])
+        yield {'ip': entry['ip'], 'mac': entry['mac']}
+
+
+def _new_or_moved(devices, scheduler, unchanged):
+    """
+    Gera só os dispositivos da varredura que o agendador não conhece ou que
+    mudaram de IP; os demais (MACs anotados em 'unchanged') seguem o próprio horário.
+    """
+    for device in devices:
+        mac = device['mac'].lower()
+        if scheduler.known_ip(mac) == device['ip']:
+            unchanged.add(mac)
+            continue
+        yield device
+
+
+def _wait_for_next_event(shared_state, lock, net):
+    """
+    Espera até a próxima varredura da rede ou a próxima sondagem agendada,
+    saindo antes se o serviço for pausado, encerrado, a rede for removida ou
+    um scan for forçado.
+    """
+    scheduler = net['scheduler']
+    while True:
+        now = time.time()
+        with lock:
+            if (not shared_state.get('running', True) or shared_state.get('status') == 'pausado'
+                    or not net['active'] or net['force']):
+                return
+            net['next_scan_in'] = max(0, net['next_sweep_at'] - now)
+        next_due = scheduler.next_due()
+        wake_at = net['next_sweep_at'] if next_due is None else min(net['next_sweep_at'], next_due)
+        if now >= wake_at:
+            return
+        time.sleep(min(1, wake_at - now))
+
+
+def _network_targets(shared_state):
+    """
+    Redes alvo atuais como {chave: alvo}. Com a lista 'networks' (config.NETWORKS)
+    vazia, há uma única rede ('default'), cujo CIDR vem de 'network_cidr' ou da
+    detecção da rede ativa a cada ciclo.
+    """
+    networks = shared_state.get('networks') or []
+    if not networks:
+        return {'default': {'cidr': None}}
+    return {target['cidr']: dict(target) for target in networks}
+
+
+class _SharedEngine:
+    """
+    ProbeEngine compartilhado por todas as redes. Quando os limites de workers
+    mudam, os próximos ciclos usam um motor novo e o antigo só é encerrado
+    depois que os ciclos em andamento o devolvem.
+    """
+
+    def __init__(self, cache=None, snmp_cache=None):
+        self._cache = cache
+        self._snmp_cache = snmp_cache
+        self._engine = None
+        self._users = {}
+        self._lock = threading.Lock()
+        self.passive = None
+
+    def configure(self, ping_workers, port_workers, snmp_workers, passive=None):
+        with self._lock:
+            self.passive = passive
+            if self._engine is None or not self._engine.matches(ping_workers, port_workers, snmp_workers):
+                old = self._engine
+                self._engine = ProbeEngine(ping_workers, port_workers, snmp_workers,
+                                           cache=self._cache, snmp_cache=self._snmp_cache)
+                if old is not None and not self._users.get(old):
+                    old.shutdown()
+            self._engine.passive = passive
+
+    def acquire(self):
+        with self._lock:
+            engine = self._engine
+            self._users[engine] = self._users.get(engine, 0) + 1
+            return engine
+
+    def release(self, engine):
+        with self._lock:
+            self._users[engine] -= 1
+            if not self._users[engine]:
+                del self._users[engine]
+                if engine is not self._engine:
+                    engine.shutdown()
+
+    def shutdown(self):
+        with self._lock:
+            if self._engine is not None:
+                self._engine.shutdown()
+
+
 def run_orchestrator(shared_state, lock):
     """
     Contém a lógica principal que roda em segundo plano (thread).
     Usa SNMP para identificar o papel e o dicionário local para o fabricante.
+
+    Cada rede alvo (config.NETWORKS, ou a rede ativa) tem sua própria thread de
+    varredura (_run_network), com agendador e intervalos próprios; todas usam o
+    mesmo motor de sondagem, a mesma escuta passiva e o mesmo banco. Esta
+    função cria e encerra essas threads conforme a lista de redes muda e
+    mantém os totais exibidos pela CLI e pelo agente SNMP.
     """
     time.sleep(config.INITIAL_DELAY)
+    engine = _SharedEngine(shared_state.get('enrichment_cache'), shared_state.get('snmp_cache'))
+    snmp_cache = shared_state.get('snmp_cache')
+    passive_listener = None
+    threads = {}
+    cycles = 0
+    with lock:
+        nets = shared_state.setdefault('network_states', {})
+
+    while shared_state.get('running', True):
+        with lock:
+            silent_mode = shared_state.get('silent_mode', False)
+            ping_workers = shared_state.get('ping_workers', config.PING_WORKERS)
+            port_workers = shared_state.get('port_workers', config.PORT_SCAN_WORKERS)
+            snmp_workers = shared_state.get('snmp_workers', config.SNMP_WORKERS)
+            passive_enabled = shared_state.get('passive_discovery', config.PASSIVE_DISCOVERY)
+            targets = _network_targets(shared_state)
+
+        # Uma escuta passiva para todas as interfaces das redes alvo
+        ifaces = sorted({target.get('iface') or utils.get_default_interface() for target in targets.values()} - {None})
+        passive_listener = _update_passive_listener(passive_listener, passive_enabled, silent_mode, ifaces or None)
+        engine.configure(ping_workers, port_workers, snmp_workers, passive_listener)
+
+        with lock:
+            shared_state['passive_listener'] = passive_listener
+            for key in [key for key in nets if key not in targets]:
+                nets.pop(key)['active'] = False  # A thread da rede termina no próximo passo
+                if not silent_mode:
+                    print(f"(Orquestrador: Rede {key} removida do monitoramento.)")
+            for key, target in targets.items():
+                if key in nets:
+                    nets[key]['target'] = target
+                    continue
+                nets[key] = {
+                    'target': target, 'active': True, 'force': False, 'scheduler': ProbeScheduler(),
+                    'cidr': target['cidr'], 'network_cidr': target['cidr'], 'device_count': 0, 'next_sweep_at': 0, 'next_scan_in': 0,
+                    'sweeps': 0, 'last_sweep': None
+                }
+                threads[key] = threading.Thread(target=_run_network, args=(shared_state, lock, key, engine),
+                                                name=f'scan-{key}', daemon=True)
+                threads[key].start()
+            # 'scan run' vale para todas as redes
+            if shared_state.get('force_scan', False):
+                for net in nets.values():
+                    net['force'] = True
+                shared_state['force_scan'] = False
+            shared_state['device_count'] = sum(net['device_count'] for net in nets.values())
+            shared_state['next_scan_in'] = min((net['next_scan_in'] for net in nets.values()), default=0)
+            # O backoff SNMP conta ciclos: avança quando todas as redes completaram mais uma varredura
+            round_done = min((net['sweeps'] for net in nets.values()), default=0)
+        if snmp_cache is not None and round_done > cycles:
+            cycles = round_done
+            snmp_cache.begin_cycle()
+
+        threads = {key: thread for key, thread in threads.items() if thread.is_alive()}
+        time.sleep(1)
+
+    for thread in threads.values():
+        thread.join(timeout=5)
+    engine.shutdown()
+    if passive_listener is not None:
+        passive_listener.stop()
+
+
+def _run_network(shared_state, lock, key, engine):
+    """
+    Laço de varredura de uma rede alvo.
+
+    Varreduras da sub-rede inteira (ARP) seguem o intervalo estável/de mudança
+    (da rede ou global) e só sondam hosts novos ou que mudaram de IP; entre
+    elas, cada dispositivo é sondado de novo quando vence seu horário no
+    agendador da rede (scheduler.ProbeScheduler).
+    """
+    with lock:
+        net = shared_state['network_states'][key]
+    scheduler = net['scheduler']
+    enrichment_cache = shared_state.get('enrichment_cache')
+    snmp_cache = shared_state.get('snmp_cache')
     last_device_count = -1
+    default_gateway = None
+    devices = []
+    warm_hosts = []
+    # Rede configurada explicitamente: mensagens e warm start identificam a rede
+    label = f"Orquestrador {key}" if net['cidr'] else "Orquestrador"
+    if config.WARM_START:
+        warm_hosts, last_device_count = _warm_start(enrichment_cache, snmp_cache,
+                                                    shared_state.get('silent_mode', False), net['cidr'])
+        if last_device_count >= 0:
+            with lock:
+                net['device_count'] = last_device_count
     
-    while shared_state.get('running', True):
+    while shared_state.get('running', True) and net['active']:
         with lock:
             is_paused = shared_state.get('status') == 'pausado'
-            is_forced = shared_state.get('force_scan', False)
+            is_forced = net['force']
             silent_mode = shared_state.get('silent_mode', False)
 
         if is_paused and not is_forced:
             time.sleep(1)
             continue
         
-        if not silent_mode:
-            print("\n(Orquestrador: Iniciando novo scan de rede...)")
-        
         with lock:
+            target = net['target']
             runtime_timeout = shared_state.get('scan_timeout', config.SCAN_TIMEOUT)
-            override_network = shared_state.get('network_cidr')
+            override_network = target.get('cidr') or shared_state.get('network_cidr')
             config.SNMP_VERSION = shared_state.get('snmp_version', config.SNMP_VERSION)
             config.SNMP_COMMUNITY = shared_state.get('snmp_community', config.SNMP_COMMUNITY)
             config.SNMP_TIMEOUT = shared_state.get('snmp_timeout', config.SNMP_TIMEOUT)
             config.SNMP_RETRIES = shared_state.get('snmp_retries', config.SNMP_RETRIES)
             config.SNMP_PORT = shared_state.get('snmp_port', config.SNMP_PORT)
+            ping_workers = shared_state.get('ping_workers', config.PING_WORKERS)
+            port_workers = shared_state.get('port_workers', config.PORT_SCAN_WORKERS)
+            snmp_workers = shared_state.get('snmp_workers', config.SNMP_WORKERS)
+            arp_mode = shared_state.get('arp_mode', config.ARP_SWEEP_MODE)
+            arp_shard_prefix = shared_state.get('arp_shard_prefix', config.ARP_SHARD_PREFIX)
+            arp_pps = shared_state.get('arp_pps', config.ARP_PPS)
+            arp_processes = shared_state.get('arp_processes', config.ARP_PROCESSES)
+            config.ARP_ENGINE = shared_state.get('arp_engine', config.ARP_ENGINE)
+            config.DB_STORAGE_MODE = shared_state.get('db_storage', config.DB_STORAGE_MODE)
+            if enrichment_cache is not None:
+                enrichment_cache.ttl = shared_state.get('cache_ttl', config.ENRICHMENT_CACHE_TTL)
+            neighbor_seed = shared_state.get('neighbor_seed', config.NEIGHBOR_SEED)
+            scheduler.intervals = dict(shared_state.get('scheduler_intervals', config.SCHEDULER_INTERVALS))
+            cycle_deadline = shared_state.get('cycle_deadline', config.CYCLE_DEADLINE)
+            stage_deadlines = dict(shared_state.get('stage_deadlines', config.STAGE_DEADLINES))
+            passive_listener = shared_state.get('passive_listener')
 
         config.SCAN_TIMEOUT = runtime_timeout
+
+        # Entre as varreduras da sub-rede, sonda apenas os dispositivos com horário vencido
+        if not is_forced and time.time() < net['next_sweep_at']:
+            due = scheduler.pop_due()
+            if due:
+                probe_engine = engine.acquire()
+                try:
+                    probed = probe_engine.probe_devices(due, default_gateway,
+                                                        ScanDeadline(cycle_deadline, stage_deadlines))
+                finally:
+                    engine.release(probe_engine)
+                metrics.record(probed)
+                changed = [device for device in probed if scheduler.observe(device)]
+                if changed:
+                    # Só as linhas que mudaram (inventário atual e eventos); o scan completo
+                    # da sub-rede continua sendo gravado no intervalo das varreduras
+                    saved = database.salvar_sondagens(changed, network=net['network_cidr'])
+                    if not silent_mode:
+                        print(f"({label}: {len(changed)} de {len(probed)} dispositivo(s) sondado(s) "
+                              f"mudaram. Inventário atualizado no banco de dados.)")
+                    saved.exception()  # Espera o commit (erros já são informados pela thread de escrita)
+                    _write_status_file(shared_state)
+            _wait_for_next_event(shared_state, lock, net)
+            continue
+
+        if not silent_mode:
+            print(f"\n({label}: Iniciando novo scan de rede...)")
+        # Prazo do ciclo e de cada estágio, contados a partir daqui
+        deadline = ScanDeadline(cycle_deadline, stage_deadlines)
         network_cidr = override_network or utils.detect_active_network()
         
         if not network_cidr:
             if not silent_mode:
-                print("(Orquestrador: Erro - Não foi possível detectar a rede ativa.)")
+                print(f"({label}: Erro - Não foi possível detectar a rede ativa.)")
             time.sleep(config.POLLING_INTERVAL_STABLE)
             continue
+        net['network_cidr'] = network_cidr
         
         # Obtenha o gateway no início de cada scan
-        default_gateway = get_default_gateway_ip()
+        default_gateway = target.get('gateway') or get_default_gateway_ip()
+        if (target.get('cidr') and default_gateway
+                and ipaddress.ip_address(default_gateway) not in ipaddress.ip_network(network_cidr, strict=False)):
+            default_gateway = None  # O gateway padrão do host não pertence a esta rede
         if not silent_mode:
-            print(f"(Orquestrador: Gateway padrão detectado: {default_gateway})")
-        
+            print(f"({label}: Gateway padrão detectado: {default_gateway})")
+
         # 1. Descoberta ARP
-        devices = discovery.discovery_arp(network_cidr)
-        
-        # 2. Ping e Definição de Status (LÓGICA ATUALIZADA)
-        if not silent_mode:
-            print("(Orquestrador: Verificando status dos dispositivos via Ping...)")
-        for device in devices:
-            ping_result = discovery.discovery_ping(device['ip'])
-            
-            if ping_result.get('status') == 'online':
-                device.update(ping_result)  # Adiciona status e ttl
-            else:
-                # Se o ping falhou, o dispositivo está "não responsivo"
-                device['status'] = 'unresponsive'
-                device['ttl'] = None
-        
-        # 3. Scan de Portas (NOVO BLOCO)
-        if not silent_mode:
-            print("(Orquestrador: Verificando portas abertas em dispositivos online...)")
-        for device in devices:
-            if device.get('status') == 'online':
-                port_results = discovery.discovery_tcp_ports(device['ip'])
-                device.update(port_results)
-            else:
-                # Dispositivos unresponsive não têm portas abertas
-                device['open_ports'] = []
+        # No modo 'sharded' a descoberta é um gerador: cada host entra na
+        # sondagem assim que responde, enquanto os shards seguintes ainda são varridos.
+        # Uma varredura interrompida pelo prazo é retomada de onde parou no ciclo seguinte
+        iface = target.get('iface')
+        sweep = net.setdefault('arp_progress', {})
+        if sweep.get('cidr') != network_cidr:
+            sweep.clear()
+            sweep['cidr'] = network_cidr
+        sweep['complete'] = True
+        sweep.pop('covered', None)
+        if arp_mode == 'sharded':
+            devices = discovery.discovery_arp_stream(network_cidr, arp_shard_prefix, arp_pps, deadline, iface, sweep)
+        elif arp_mode == 'process':
+            # Montagem e dissecação de pacotes em vários processos (fora do GIL do orquestrador)
+            devices = discovery.discovery_arp_processes(network_cidr, arp_processes, arp_pps, deadline, iface, sweep)
+        else:
+            devices = discovery.discovery_arp(network_cidr, iface)
+        # Vizinhos já resolvidos pelo kernel entram na sondagem antes da primeira resposta ARP
+        # (só como candidatos: sem responder ao ping nem ao ARP, não entram no scan)
+        seeded = set()
+        if neighbor_seed:
+            devices = _seed_from_neighbors(discovery.discovery_neighbors(network_cidr, iface), devices, seeded)
+        # Acrescenta os hosts vistos apenas pela escuta passiva
+        devices = _merge_passive_devices(devices, passive_listener, network_cidr)
+        # Primeiro ciclo após um warm start: hosts do último scan são sondados antes dos demais
+        confirmed = set()
+        if warm_hosts:
+            devices = _known_hosts_first(warm_hosts, devices, network_cidr, confirmed)
+        # Hosts já agendados e no mesmo IP ficam com o agendador (scan forçado sonda todos)
+        unchanged = set()
+        if not is_forced:
+            devices = _new_or_moved(devices, scheduler, unchanged)
         
-        # 4. Classificação de Papel (LÓGICA REFINADA)
+        # 2. Sondagem concorrente: ping, portas, classificação, SNMP e fabricante por host
         if not silent_mode:
-            print("(Orquestrador: Classificando papéis com lógica refinada...)")
-        
-        network_vendors = {'cisco', 'ubiquiti', 'palo alto'}
-        
-        for device in devices:
-            ip = device.get('ip')
-            ports = set(device.get('open_ports', []))
-            producer = (device.get('producer') or '').lower()
-            ttl = device.get('ttl')
-            
-            # 1. Regra do Gateway (Prioridade Máxima - sempre Roteador)
-            if ip == default_gateway:
-                device['role'] = 'Roteador'
-                continue
-
-            # 2. Regras baseadas em Portas e Fabricante
-            role_found = False
-            if ports:
-                if (22 in ports or 23 in ports) and any(vendor in producer for vendor in network_vendors):
-                    device['role'] = 'Switch Gerenciável'
-                    role_found = True
-                elif (80 in ports or 443 in ports) and 'ubiquiti' in producer:
-                    device['role'] = 'Access Point'
-                    role_found = True
-                elif 3389 in ports:
-                    device['role'] = 'Servidor Windows'
-                    role_found = True
-                elif 80 in ports or 443 in ports:
-                    device['role'] = 'Servidor Web'
-                    role_found = True
-            
-            if role_found:
+            print(f"({label}: Sondando dispositivos em paralelo "
+                  f"[ping={ping_workers}, portas={port_workers}, snmp={snmp_workers}]...)")
+        # 3. Cada resultado é agendado e gravado (em micro-lotes) assim que fica pronto,
+        # sem esperar pelos hosts mais lentos; o scan só vale como "último" no fim.
+        writer = database.ScanWriter(network=network_cidr)
+        warm_macs = {d['mac'] for d in warm_hosts}
+        held = []
+        probed = set()
+        measured = []  # Resultados de sondagem desta varredura (séries de QoS)
+        partial = 0
+        # O motor é compartilhado pelas redes (hosts vistos pela escuta passiva são confirmados sem ping)
+        probe_engine = engine.acquire()
+        try:
+            for device in probe_engine.probe_stream(devices, default_gateway, deadline):
+                if (device['mac'] in warm_macs or device['mac'].lower() in seeded) and device.get('status') != 'online':
+                    # Só dá para saber se o host conhecido saiu da rede quando a descoberta terminar
+                    held.append(device)
+                    continue
+                partial += not sondagem_completa(device)
+                scheduler.observe(device)
+                writer.add(device)
+                probed.add(device['mac'].lower())
+                measured.append(device)
+        finally:
+            engine.release(probe_engine)
+        # Hosts conhecidos que não responderam ao ping nem apareceram na descoberta saíram da rede;
+        # vizinhos do kernel sem ping nem resposta ARP nunca entram no scan
+        for device in held:
+            if device['mac'].lower() in seeded:
                 continue
+            if device['mac'] not in warm_macs or device['mac'] in confirmed:
+                partial += not sondagem_completa(device)
+                scheduler.observe(device)
+                writer.add(device)
+                probed.add(device['mac'].lower())
+                measured.append(device)
+        warm_hosts = []
+        metrics.record(measured)
+        if partial and not silent_mode:
+            print(f"({label}: Prazo do ciclo esgotado após {deadline.elapsed():.0f}s; "
+                  f"{partial} dispositivo(s) com sondagem incompleta serão retomados primeiro.)")
 
-            # 3. Regras de Fallback baseadas em TTL
-            if ttl is not None:
-                if ttl <= 64:
-                    device['role'] = 'Roteador'
-                else:
-                    device['role'] = 'Host'
-            else:
-                device['role'] = 'Host'
-        
-        # 5. Enriquecimento SNMP (sobrescreve o palpite do TTL, mas não o do gateway)
-        if not silent_mode:
-            print("(Orquestrador: Tentando enriquecer dispositivos online com SNMP...)")
-        for device in devices:
-            if device.get('status') == 'online':
-                # Não rodar SNMP no gateway se já o identificamos
-                if device.get('ip') == default_gateway:
-                    continue
-                
-                snmp_info = discovery.discovery_snmp_basic(device['ip'])
-                if snmp_info and snmp_info.get('role'):  # Se SNMP retornou um papel
-                    device.update(snmp_info)  # Atualiza, sobrescrevendo o TTL
-                elif snmp_info:
-                    # Atualiza outras informações SNMP mas mantém o role detectado
-                    snmp_info_copy = snmp_info.copy()
-                    snmp_info_copy.pop('role', None)
-                    device.update(snmp_info_copy)
-        
-        # 6. Enriquecimento de Fabricante
-        if not silent_mode:
-            print("(Orquestrador: Consultando fabricantes dos endereços MAC localmente...)")
-        from oui_db import OUI_DATABASE
+        # Os hosts que não apareceram na varredura saíram da rede; os que ficaram
+        # com o agendador entram no scan com o último resultado conhecido. Se o prazo
+        # interrompeu a descoberta, só saem os que estavam nas faixas já varridas.
+        covered = None if sweep['complete'] else sweep.get('covered', [])
+        reached = probed | unchanged
+        if covered is not None:
+            reached |= {device['mac'].lower() for device in scheduler.devices()
+                        if not ip_na_varredura(device['ip'], covered)}
+            if not silent_mode:
+                print(f"({label}: Descoberta interrompida pelo prazo; a próxima varredura continua "
+                      f"de onde parou. Hosts fora das faixas varridas mantêm o último resultado.)")
+        gone = scheduler.retain(reached)
+        devices = scheduler.devices()
         for device in devices:
-            if 'mac' in device and device['mac']:
-                try:
-                    oui = device['mac'].replace(':', '').replace('-', '').upper()[:6]
-                    vendor = OUI_DATABASE.get(oui, 'Desconhecido')
-                    # Limita o nome do fabricante a 20 caracteres
-                    if len(vendor) > 20:
-                        vendor = vendor[:20]
-                    device['producer'] = vendor
-                except Exception:
-                    device['producer'] = 'N/A'
-        
-        # 7. Salvar no Banco de Dados
-        database.salvar_resultado_scan(devices)
+            if device['mac'].lower() not in probed:
+                writer.add(device)
+        saved = writer.finish(covered)
         if not silent_mode:
-            print("(Orquestrador: Scan concluído. Resultados salvos no banco de dados.)")
+            print(f"({label}: {len(probed)} sondado(s), {len(unchanged)} sem mudança de IP, "
+                  f"{gone} saíram da rede.)")
+            print(f"({label}: Scan concluído. Resultados salvos no banco de dados.)")
         
-        # 8. Incrementar contador de scans para a MIB SNMP
+        # 4. Incrementar contador de scans para a MIB SNMP
         with lock:
             shared_state['scans_performed'] = shared_state.get('scans_performed', 0) + 1
         
         current_device_count = len(devices)
         with lock:
-            interval_stable = shared_state.get('interval_stable', config.POLLING_INTERVAL_STABLE)
-            interval_change = shared_state.get('interva l_change', config.POLLING_INTERVAL_CHANGE)
+            interval_stable = target.get('interval_stable') or shared_state.get('interval_stable', config.POLLING_INTERVAL_STABLE)
+            interval_change = target.get('interval_change') or shared_state.get('interval_change', config.POLLING_INTERVAL_CHANGE)
+
+        # Com a escuta passiva ativa, as varreduras ativas podem ser mais espaçadas
+        if passive_listener is not None:
+            interval_stable *= config.PASSIVE_INTERVAL_FACTOR
+            interval_change *= config.PASSIVE_INTERVAL_FACTOR
             
         if current_device_count != last_device_count:
             next_interval = interval_change
             if not silent_mode:
-                print(f"(Orquestrador: Mudança detectada na rede. Próximo scan em {next_interval}s.)")
+                print(f"({label}: Mudança detectada na rede. Próximo scan em {next_interval}s.)")
         else:
             next_interval = interval_stable
             if not silent_mode:
-                print(f"(Orquestrador: Rede estável. Próximo scan em {next_interval}s.)")
+                print(f"({label}: Rede estável. Próximo scan em {next_interval}s.)")
         
         last_device_count = current_device_count
 
         with lock:
-            shared_state['force_scan'] = False
-            shared_state['device_count'] = current_device_count
+            net['force'] = False
+            net['device_count'] = current_device_count
+            net['sweeps'] += 1
+            net['last_sweep'] = time.time()
+            net['next_sweep_at'] = time.time() + next_interval
         
-        # Escrever arquivo de status para o agente SNMP (imediatamente após o scan)
-        _write_status_file(shared_state, devices)
-        
-        seconds_remaining = next_interval
-        while seconds_remaining > 0:
-            with lock:
-                if not shared_state.get('running', True) or shared_state.get('status') == 'pausado' or shared_state.get('force_scan', False):
-                    break
-                shared_state['next_scan_in'] = seconds_remaining
-            time.sleep(1)
-            seconds_remaining -= 1
+        # Escrever arquivo de status para o agente SNMP (assim que o scan estiver no banco)
+        saved.exception()  # Espera o commit (erros já são informados pela thread de escrita)
+        _write_status_file(shared_state)
 
-        # Atualizar status.json com o tempo restante atualizado
-        _write_status_file(shared_state, devices)
+        _wait_for_next_event(shared_state, lock, net)
 
 
 if __name__ == "__main__":
@@ -264,7 +623,28 @@ if __name__ == "__main__":
         'snmp_timeout': config.SNMP_TIMEOUT,
         'snmp_retries': config.SNMP_RETRIES,
         'snmp_port': config.SNMP_PORT,
+        'ping_workers': config.PING_WORKERS,
+        'port_workers': config.PORT_SCAN_WORKERS,
+        'snmp_workers': config.SNMP_WORKERS,
+        'arp_mode': config.ARP_SWEEP_MODE,
+        'arp_shard_prefix': config.ARP_SHARD_PREFIX,
+        'arp_pps': config.ARP_PPS,
+        'arp_processes': config.ARP_PROCESSES,
+        'arp_engine': config.ARP_ENGINE,
+        'db_storage': config.DB_STORAGE_MODE,
         'silent_mode': False,
+        'cache_ttl': config.ENRICHMENT_CACHE_TTL,
+        'enrichment_cache': EnrichmentCache(),
+        'snmp_cache': SnmpCredentialCache(),
+        'passive_discovery': config.PASSIVE_DISCOVERY,
+        'neighbor_seed': config.NEIGHBOR_SEED,
+        'scheduler_intervals': dict(config.SCHEDULER_INTERVALS),
+        'cycle_deadline': config.CYCLE_DEADLINE,
+        'stage_deadlines': dict(config.STAGE_DEADLINES),
+        'networks': [dict(target) for target in config.NETWORKS],
+        'network_states': {},  # Uma entrada por rede alvo (agendador, contagem, próximo scan)
+        'budget_pps': config.PACKET_BUDGET_PPS,
+        'budget_class_pps': dict(config.PACKET_BUDGET_CLASS_PPS),
     }
 
     thread_lock = threading.Lock()
@@ -272,6 +652,17 @@ if __name__ == "__main__":
     # A inicialização do DB agora chama a função simplificada
     database.inicializar_db()
 
+    # Retenção, arquivamento e compactação do histórico em segundo plano
+    if config.RETENTION_ENABLED:
+        shared_state['retention'] = RetentionWorker()
+        shared_state['retention'].start()
+
+    # Recepção dos scans de coletores remotos (collector.py)
+    if config.INGEST_ENABLED:
+        ingest_server = IngestServer()
+        if ingest_server.start():
+            shared_state['ingest_server'] = ingest_server
+
     orchestrator_thread = threading.Thread(
         target=run_orchestrator,
         args=(shared_state, thread_lock),
@@ -279,7 +670,11 @@ if __name__ == "__main__":
     )
     orchestrator_thread.start()
 
-    shell = cli.ControlShell(shared_state)
+    shell = cli.ControlShell(shared_state, thread_lock)
     shell.cmdloop()
 
+    if shared_state.get('retention') is not None:
+        shared_state['retention'].stop()
+    # Grava o que ainda estiver na fila da thread de escrita
+    database.fechar_db()
     print("Programa finalizado.")
\ No newline at end of file
@@ -0,0 +1,205 @@
+# metrics.py
+"""
+Séries temporais de QoS por dispositivo: latência média, perda de pacotes e TTL.
+
+Cada sondagem vira amostras compactas (mac, métrica, instante, valor) na
+tabela metric_samples, gravadas pela thread de escrita do banco. À medida que
+os intervalos fecham, as amostras são reduzidas em agregados de 1 minuto, e
+estes em agregados de 1 hora e de 1 dia (metric_rollups), com min, média,
+max, p95 e contagem:
+- min, max, contagem e média são exatos em todas as resoluções
+- o p95 de 1 minuto é exato; o de 1 hora e 1 dia é aproximado (percentil
+  dos p95 de cada intervalo filho, ponderado pela contagem)
+- cada resolução tem sua retenção (METRICS_RETENTION)
+- uma consulta lê uma única resolução: a pedida, ou a mais fina que cabe em
+  METRICS_MAX_POINTS pontos na janela
+
+Os intervalos de 1 dia seguem o horário UTC.
+"""
+
+import math
+import threading
+import time
+
+import config
+import database
+
+# Métricas gravadas (campo do dispositivo -> código na tabela)
+METRICS = {'latency': 0, 'loss': 1, 'ttl': 2}
+_FIELDS = {'latency': 'avg_latency', 'loss': 'packet_loss', 'ttl': 'ttl'}
+
+# Resoluções dos agregados (nome -> segundos) e a resolução de origem de cada uma
+TIERS = {'1m': 60, '1h': 3600, '1d': 86400}
+_SOURCES = (('1m', None), ('1h', '1m'), ('1d', '1h'))
+
+# Espera após o fim de um intervalo antes de agregá-lo (amostras ainda na fila)
+_ROLLUP_DELAY = 5
+
+_last_rollup = 0
+_rollup_lock = threading.Lock()
+
+
+def record(devices, timestamp=None):
+    """
+    Enfileira as métricas medidas em 'devices' (resultados de sondagem, não
+    cópias do último resultado). Não espera pelo banco.
+    """
+    if not config.METRICS_ENABLED:
+        return
+    ts = int(timestamp if timestamp is not None else time.time())
+    rows = []
+    for device in devices:
+        mac = device.get('mac')
+        if not mac:
+            continue
+        for name, code in METRICS.items():
+            value = device.get(_FIELDS[name])
+            if value is not None:
+                rows.append((mac.lower(), code, ts, float(value)))
+    if rows:
+        database._write(_insert_samples, rows)
+    _maybe_rollup(ts)
+
+
+def _insert_samples(cursor, rows):
+    # Duas sondagens do mesmo host no mesmo segundo: fica a última
+    cursor.executemany('INSERT OR REPLACE INTO metric_samples (device, metric, ts, value) VALUES (?, ?, ?, ?)', rows)
+
+
+def _maybe_rollup(now):
+    """Agenda a agregação quando um minuto fecha (uma vez por minuto)."""
+    global _last_rollup
+    minute = int(now) // 60
+    with _rollup_lock:
+        if minute <= _last_rollup:
+            return
+        _last_rollup = minute
+    database._write(_rollup, now)
+
+
+def _p95(values):
+    """Percentil 95 (nearest-rank) de uma lista ordenada."""
+    return values[max(0, math.ceil(0.95 * len(values)) - 1)]
+
+
+def _merged_p95(children):
+    """p95 aproximado a partir de (p95, contagem) dos intervalos filhos."""
+    children = sorted(children)
+    target = 0.95 * sum(count for _, count in children)
+    seen = 0
+    for p95, count in children:
+        seen += count
+        if seen >= target:
+            return p95
+    return children[-1][0]
+
+
+def _watermark(cursor, tier):
+    row = cursor.execute('SELECT done_until FROM metric_watermarks WHERE tier = ?', (tier,)).fetchone()
+    return row[0] if row else None
+
+
+def _rollup(cursor, now=None):
+    """
+    Agrega os intervalos fechados de cada resolução desde a última agregação
+    e aplica a retenção. Roda na thread de escrita.
+    """
+    now = int(now if now is not None else time.time()) - _ROLLUP_DELAY
+    for name, source in _SOURCES:
+        tier = TIERS[name]
+        end = now // tier * tier
+        start = _watermark(cursor, tier)
+        if start is None:
+            # Primeira agregação: começa no dado mais antigo da origem
+            if source is None:
+                first = cursor.execute('SELECT MIN(ts) FROM metric_samples').fetchone()[0]
+            else:
+                first = cursor.execute('SELECT MIN(bucket) FROM metric_rollups WHERE tier = ?',
+                                       (TIERS[source],)).fetchone()[0]
+            if first is None:
+                continue
+            start = first // tier * tier
+        if end <= start:
+            continue
+
+        groups = {}
+        if source is None:
+            for device, metric, ts, value in cursor.execute(
+                    'SELECT device, metric, ts, value FROM metric_samples WHERE ts >= ? AND ts < ?', (start, end)):
+                groups.setdefault((device, metric, ts // tier * tier), []).append(value)
+            rows = []
+            for (device, metric, bucket), values in groups.items():
+                values.sort()
+                rows.append((tier, device, metric, bucket, values[0], sum(values) / len(values),
+                             values[-1], _p95(values), len(values)))
+        else:
+            for device, metric, bucket, low, avg, high, p95, count in cursor.execute(
+                    '''SELECT device, metric, bucket, min, avg, max, p95, count FROM metric_rollups
+                       WHERE tier = ? AND bucket >= ? AND bucket < ?''', (TIERS[source], start, end)):
+                groups.setdefault((device, metric, bucket // tier * tier), []).append((low, avg, high, p95, count))
+            rows = []
+            for (device, metric, bucket), children in groups.items():
+                total = sum(child[4] for child in children)
+                rows.append((tier, device, metric, bucket,
+                             min(child[0] for child in children),
+                             sum(child[1] * child[4] for child in children) / total,
+                             max(child[2] for child in children),
+                             _merged_p95([(child[3], child[4]) for child in children]), total))
+
+        cursor.executemany(
+            '''INSERT OR REPLACE INTO metric_rollups (tier, device, metric, bucket, min, avg, max, p95, count)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''', rows)
+        cursor.execute('INSERT OR REPLACE INTO metric_watermarks (tier, done_until) VALUES (?, ?)', (tier, end))
+
+    _apply_retention(cursor, now)
+
+
+def _apply_retention(cursor, now):
+    retention = config.METRICS_RETENTION
+    if retention.get('raw'):
+        cursor.execute('DELETE FROM metric_samples WHERE ts < ?', (now - retention['raw'],))
+    for name, tier in TIERS.items():
+        if retention.get(name):
+            cursor.execute('DELETE FROM metric_rollups WHERE tier = ? AND bucket < ?', (tier, now - retention[name]))
+
+
+def pick_resolution(start, end, resolution=None):
+    """
+    Resolução lida por uma consulta: 'raw' ou um nome de TIERS. Sem 'resolution',
+    a mais fina que cabe em METRICS_MAX_POINTS pontos na janela; com um número
+    de segundos, a resolução mais grossa que não passa dele.
+    """
+    if resolution in TIERS or resolution == 'raw':
+        return resolution
+    if resolution is not None:
+        fitting = [name for name, tier in TIERS.items() if tier <= resolution]
+        return fitting[-1] if fitting else 'raw'
+    for name, tier in TIERS.items():
+        if (end - start) / tier <= config.METRICS_MAX_POINTS:
+            return name
+    return '1d'
+
+
+def query(mac, metric, start, end=None, resolution=None):
+    """
+    Série de uma métrica ('latency', 'loss' ou 'ttl') de um MAC entre 'start' e
+    'end' (epoch). Retorna (resolução, pontos), cada ponto um dicionário com
+    ts, min, avg, max, p95 e count (nas amostras brutas, todos iguais ao valor).
+    O intervalo ainda aberto de cada resolução só aparece depois de agregado.
+    """
+    end = end if end is not None else time.time()
+    tier_name = pick_resolution(start, end, resolution)
+    params = (mac.lower(), METRICS[metric], int(start), int(end))
+    with database._reader() as conn:
+        if tier_name == 'raw':
+            rows = conn.execute('''SELECT ts, value FROM metric_samples
+                                   WHERE device = ? AND metric = ? AND ts >= ? AND ts < ? ORDER BY ts''',
+                                params).fetchall()
+            points = [{'ts': row['ts'], 'min': row['value'], 'avg': row['value'], 'max': row['value'],
+                       'p95': row['value'], 'count': 1} for row in rows]
+        else:
+            rows = conn.execute('''SELECT bucket AS ts, min, avg, max, p95, count FROM metric_rollups
+                                   WHERE tier = ? AND device = ? AND metric = ? AND bucket >= ? AND bucket < ?
+                                   ORDER BY bucket''', (TIERS[tier_name],) + params).fetchall()
+            points = [dict(row) for row in rows]
+    return tier_name, points
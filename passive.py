@@ -0,0 +1,142 @@
+# passive.py
+"""
+Descoberta passiva a partir do tráfego ARP e DHCP observado na interface.
+
+Um sniffer (scapy, filtro BPF "arp or udp port 67/68") mantém um inventário
+em memória, atualizado continuamente e sem enviar nenhum pacote:
+- ARP request/reply e ARP gratuito: IP/MAC do remetente
+- DHCP REQUEST/ACK: MAC do cliente e IP solicitado/concedido
+
+O orquestrador usa o inventário para confirmar hosts vistos recentemente
+sem pingá-los e para alongar o intervalo entre varreduras ativas.
+"""
+
+import threading
+import time
+
+from scapy.all import ARP, BOOTP, DHCP, AsyncSniffer, get_if_hwaddr
+
+DHCP_REQUEST = 3
+DHCP_ACK = 5
+
+_BPF_FILTER = "arp or (udp and (port 67 or port 68))"
+
+
+def _dhcp_message_type(pkt):
+    for option in pkt[DHCP].options:
+        if isinstance(option, tuple) and option[0] == 'message-type':
+            return option[1]
+    return None
+
+
+def _dhcp_option(pkt, name):
+    for option in pkt[DHCP].options:
+        if isinstance(option, tuple) and option[0] == name:
+            return option[1]
+    return None
+
+
+class PassiveListener:
+    """
+    Escuta ARP/DHCP em segundo plano e mantém o inventário {mac: {'ip', 'last_seen', 'source'}}.
+    'iface' pode ser uma interface ou uma lista delas (uma por rede monitorada).
+    """
+
+    def __init__(self, iface=None):
+        self.iface = iface
+        self._inventory = {}
+        self._lock = threading.Lock()
+        self._sniffer = None
+        self.packets_seen = 0
+        # Requisições ARP do próprio host (inclusive das varreduras ativas) não entram no inventário
+        self._own_macs = set()
+        for name in (iface if isinstance(iface, (list, tuple)) else [iface]):
+            try:
+                if name:
+                    self._own_macs.add(get_if_hwaddr(name).lower())
+            except Exception:
+                pass
+
+    @property
+    def running(self):
+        return self._sniffer is not None and self._sniffer.running
+
+    def start(self):
+        if self.running:
+            return
+        self._sniffer = AsyncSniffer(
+            iface=self.iface,
+            filter=_BPF_FILTER,
+            # Também filtra em Python: sem libpcap o scapy ignora o filtro BPF
+            lfilter=lambda pkt: ARP in pkt or DHCP in pkt,
+            prn=self._handle,
+            store=False
+        )
+        self._sniffer.start()
+        ifaces = ', '.join(self.iface) if isinstance(self.iface, (list, tuple)) else self.iface
+        print(f"(Passivo: Escutando ARP/DHCP em {ifaces or 'interface padrão'}...)")
+
+    def stop(self):
+        if self._sniffer is not None:
+            try:
+                self._sniffer.stop()
+            except Exception:
+                pass
+            self._sniffer = None
+
+    def _record(self, mac, ip, source):
+        if not mac or not ip or ip == '0.0.0.0':
+            return
+        mac = mac.lower()
+        if mac in self._own_macs:
+            return
+        with self._lock:
+            self._inventory[mac] = {'ip': ip, 'last_seen': time.time(), 'source': source}
+
+    def _handle(self, pkt):
+        self.packets_seen += 1
+        try:
+            if ARP in pkt:
+                arp = pkt[ARP]
+                if arp.op == 1 and arp.psrc == arp.pdst:
+                    source = 'arp-gratuito'
+                else:
+                    source = 'arp-request' if arp.op == 1 else 'arp-reply'
+                # ARP probe (RFC 5227) tem psrc 0.0.0.0 e é descartado em _record
+                self._record(arp.hwsrc, arp.psrc, source)
+            elif DHCP in pkt and BOOTP in pkt:
+                msg_type = _dhcp_message_type(pkt)
+                bootp = pkt[BOOTP]
+                client_mac = ':'.join(f'{b:02x}' for b in bytes(bootp.chaddr)[:6])
+                if msg_type == DHCP_ACK:
+                    self._record(client_mac, bootp.yiaddr, 'dhcp-ack')
+                elif msg_type == DHCP_REQUEST:
+                    requested = _dhcp_option(pkt, 'requested_addr') or bootp.ciaddr
+                    self._record(client_mac, requested, 'dhcp-request')
+        except Exception:
+            # Pacote malformado: ignora
+            pass
+
+    def last_seen(self, mac):
+        """Instante (epoch) da última observação passiva do MAC, ou None."""
+        with self._lock:
+            entry = self._inventory.get((mac or '').lower())
+            return entry['last_seen'] if entry else None
+
+    def seen_recently(self, mac, max_age):
+        seen = self.last_seen(mac)
+        return seen is not None and time.time() - seen <= max_age
+
+    def snapshot(self, max_age=None):
+        """Lista de {'ip', 'mac', 'last_seen', 'source'} (opcionalmente só os vistos há até max_age s)."""
+        now = time.time()
+        with self._lock:
+            return [
+                {'ip': e['ip'], 'mac': mac, 'last_seen': e['last_seen'], 'source': e['source']}
+                for mac, e in self._inventory.items()
+                if max_age is None or now - e['last_seen'] <= max_age
+            ]
+
+    def stats(self):
+        with self._lock:
+            return {'running': self.running, 'devices': len(self._inventory), 'packets': self.packets_seen}
@@ -0,0 +1,141 @@
+# port_scanner.py
+"""
+Scanner TCP em massa, não bloqueante, baseado em selectors.
+
+Em vez de um connect bloqueante por porta (PORT_SCAN_TIMEOUT x portas x hosts),
+mantém milhares de conexões em andamento ao mesmo tempo sobre todos os pares
+host x porta, limitadas por um teto global de sockets abertos
+(config.PORT_SCAN_MAX_SOCKETS), compartilhado entre todas as threads.
+Cada connect (SYN) retira uma ficha da classe 'tcp' do orçamento global de pacotes.
+"""
+
+import collections
+import errno
+import selectors
+import socket
+import struct
+import threading
+import time
+
+import config
+import ratelimit
+
+# Linger com timeout 0: o close() envia RST e não deixa sockets em TIME_WAIT
+_LINGER_RST = struct.pack('ii', 1, 0)
+
+_socket_slots = None
+_socket_slots_lock = threading.Lock()
+
+
+def _get_socket_slots():
+    """Semáforo global que limita o número de descritores abertos pelo scanner."""
+    global _socket_slots
+    with _socket_slots_lock:
+        if _socket_slots is None:
+            _socket_slots = threading.BoundedSemaphore(config.PORT_SCAN_MAX_SOCKETS)
+        return _socket_slots
+
+
+def scan_ports(ips, ports=None, timeout=None):
+    """
+    Testa todas as combinações IP x porta com connects não bloqueantes.
+
+    Retorna {ip: {'open_ports': [...]}} com as portas na ordem de 'ports'.
+    """
+    if ports is None:
+        ports = config.PORTS_TO_SCAN
+    if timeout is None:
+        timeout = config.PORT_SCAN_TIMEOUT
+
+    ips = list(dict.fromkeys(ips))
+    open_ports = {ip: set() for ip in ips}
+    pending = collections.deque((ip, port) for ip in ips for port in ports)
+    slots = _get_socket_slots()
+    budget = ratelimit.get_budget()
+    throttled_since = None
+
+    selector = selectors.DefaultSelector()
+    # Como o timeout é igual para todos, a fila de prazos já fica ordenada
+    deadlines = collections.deque()
+    in_flight = {}
+
+    def _close(sock):
+        selector.unregister(sock)
+        del in_flight[sock]
+        sock.close()
+        slots.release()
+
+    try:
+        while pending or in_flight:
+            # 1. Abre novas conexões enquanto houver descritores livres e orçamento de pacotes
+            budget_wait = 0.0
+            while pending:
+                # Sem conexões próprias em andamento, espera um pouco por um slot
+                # liberado por outra thread em vez de girar em falso.
+                acquired = slots.acquire(blocking=False) if in_flight else slots.acquire(timeout=0.05)
+                if not acquired:
+                    break
+                budget_wait = budget.try_acquire('tcp')
+                if budget_wait > 0:
+                    slots.release()
+                    if throttled_since is None:
+                        throttled_since = time.monotonic()
+                    break
+                if throttled_since is not None:
+                    budget.record_throttled('tcp', time.monotonic() - throttled_since)
+                    throttled_since = None
+                ip, port = pending.popleft()
+                try:
+                    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                except OSError:
+                    # EMFILE/ENFILE: devolve o alvo para a fila e espera conexões terminarem
+                    slots.release()
+                    pending.appendleft((ip, port))
+                    break
+                sock.setblocking(False)
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, _LINGER_RST)
+                result = sock.connect_ex((ip, port))
+                if result == 0:
+                    open_ports[ip].add(port)
+                    sock.close()
+                    slots.release()
+                elif result in (errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY):
+                    selector.register(sock, selectors.EVENT_WRITE, (ip, port))
+                    in_flight[sock] = (ip, port)
+                    deadlines.append((time.monotonic() + timeout, sock))
+                else:
+                    # Recusada/inalcançável de imediato
+                    sock.close()
+                    slots.release()
+
+            if not in_flight:
+                if budget_wait > 0:
+                    time.sleep(budget_wait)
+                continue
+
+            # 2. Processa conexões concluídas (sucesso ou erro)
+            wait = max(0.0, deadlines[0][0] - time.monotonic()) if deadlines else timeout
+            if budget_wait > 0:
+                wait = min(wait, budget_wait)
+            for key, _ in selector.select(timeout=wait):
+                sock = key.fileobj
+                ip, port = key.data
+                if sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0:
+                    open_ports[ip].add(port)
+                _close(sock)
+
+            # 3. Expira conexões que estouraram o timeout (portas filtradas)
+            now = time.monotonic()
+            while deadlines and deadlines[0][0] <= now:
+                _, sock = deadlines.popleft()
+                if sock in in_flight:
+                    _close(sock)
+            # Remove da frente os prazos de sockets que já foram fechados
+            while deadlines and deadlines[0][1] not in in_flight:
+                deadlines.popleft()
+    finally:
+        for sock in list(in_flight):
+            _close(sock)
+        selector.close()
+
+    return {ip: {'open_ports': [p for p in ports if p in open_ports[ip]]} for ip in ips}
@@ -0,0 +1,412 @@
+# probe_engine.py
+"""
+Motor de sondagem concorrente dos dispositivos descobertos.
+
+Substitui os laços sequenciais do orquestrador (ping, portas, SNMP, fabricante)
+por um pool de threads limitado, em que:
+- Cada host percorre seus estágios sempre na mesma ordem
+  (ping -> portas -> classificação -> SNMP -> fabricante)
+- Hosts diferentes são sondados ao mesmo tempo
+- Cada estágio tem seu próprio limite de concorrência (config.*_WORKERS)
+- Com um prazo (deadline.ScanDeadline), estágios vencidos não são iniciados e
+  sondagens ainda na fila são canceladas; cada dispositivo registra em 'stages'
+  os estágios concluídos
+- probe_stream() gera cada resultado assim que o host termina, para que o
+  orquestrador grave em micro-lotes (database.ScanWriter) sem esperar pelos mais lentos
+
+Devolve os mesmos dicionários de dispositivo usados por database.salvar_resultado_scan.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import config
+import discovery
+from deadline import sondagem_completa
+from oui_db import OUI_DATABASE
+
+# Fabricantes típicos de equipamentos de infraestrutura (switches, APs, firewalls)
+NETWORK_VENDORS = {'cisco', 'ubiquiti', 'palo alto'}
+
+
+def classificar_papel(device, default_gateway):
+    """
+    Classifica o papel do dispositivo a partir do gateway, portas, fabricante e TTL.
+    Altera o dicionário recebido (chave 'role').
+    """
+    ip = device.get('ip')
+    ports = set(device.get('open_ports', []))
+    producer = (device.get('producer') or '').lower()
+    ttl = device.get('ttl')
+
+    # 1. Regra do Gateway (Prioridade Máxima - sempre Roteador)
+    if ip == default_gateway:
+        device['role'] = 'Roteador'
+        return
+
+    # 2. Regras baseadas em Portas e Fabricante
+    if ports:
+        if (22 in ports or 23 in ports) and any(vendor in producer for vendor in NETWORK_VENDORS):
+            device['role'] = 'Switch Gerenciável'
+            return
+        elif (80 in ports or 443 in ports) and 'ubiquiti' in producer:
+            device['role'] = 'Access Point'
+            return
+        elif 3389 in ports:
+            device['role'] = 'Servidor Windows'
+            return
+        elif 80 in ports or 443 in ports:
+            device['role'] = 'Servidor Web'
+            return
+
+    # 3. Regras de Fallback baseadas em TTL
+    if ttl is not None and ttl <= 64:
+        device['role'] = 'Roteador'
+    else:
+        device['role'] = 'Host'
+
+
+def identificar_fabricante(mac):
+    """Consulta o fabricante no dicionário OUI local (limitado a 20 caracteres)."""
+    try:
+        oui = mac.replace(':', '').replace('-', '').upper()[:6]
+        vendor = OUI_DATABASE.get(oui, 'Desconhecido')
+        return vendor[:20]
+    except Exception:
+        return 'N/A'
+
+
+class _StageBatcher:
+    """
+    Junta as chamadas de um estágio feitas pelos workers em rodadas de uma
+    função em lote ('run': lista de IPs -> {ip: resultado}): o primeiro worker
+    a chegar espera 'window' segundos pelos outros, executa o lote inteiro com
+    uma única chamada e entrega o resultado de cada um. Os demais só esperam.
+    Usado para o ping (discovery_ping_batch) e para as portas
+    (discovery_tcp_ports_batch).
+    """
+
+    def __init__(self, run, window, stage):
+        self.run = run
+        self.window = window
+        self.stage = stage
+        self._lock = threading.Lock()
+        self._forming = None  # Lote aberto: {'ips', 'done', 'results'}
+
+    def submit(self, ip):
+        with self._lock:
+            batch = self._forming
+            leader = batch is None
+            if leader:
+                batch = self._forming = {'ips': [], 'done': threading.Event(), 'results': {}}
+            batch['ips'].append(ip)
+
+        if leader:
+            time.sleep(self.window)
+            with self._lock:
+                self._forming = None
+            try:
+                batch['results'] = self.run(batch['ips'])
+            finally:
+                batch['done'].set()
+        else:
+            batch['done'].wait()
+
+        result = batch['results'].get(ip)
+        if result is None:
+            raise RuntimeError(f"{self.stage} em lote sem resultado para {ip}")
+        return result
+
+
+class ProbeEngine:
+    """
+    Pool de threads que sonda vários hosts em paralelo.
+
+    Cada host é tratado por uma única tarefa (garantindo a ordem dos estágios),
+    e cada estágio é protegido por um semáforo que limita quantos hosts podem
+    estar nele ao mesmo tempo.
+    """
+
+    def __init__(self, ping_workers=None, port_workers=None, snmp_workers=None, cache=None, snmp_cache=None,
+                 passive=None):
+        # Cache opcional de enriquecimento (cache.EnrichmentCache): hosts com
+        # entrada válida pulam o scan de portas e o SNMP.
+        self.cache = cache
+        # Memória de credenciais e cache negativo SNMP (cache.SnmpCredentialCache)
+        self.snmp_cache = snmp_cache
+        # Escuta passiva (passive.PassiveListener): hosts vistos há pouco dispensam o ping
+        self.passive = passive
+        self.ping_workers = ping_workers or config.PING_WORKERS
+        self.port_workers = port_workers or config.PORT_SCAN_WORKERS
+        self.snmp_workers = snmp_workers or config.SNMP_WORKERS
+
+        self._stage_slots = {
+            'ping': threading.BoundedSemaphore(self.ping_workers),
+            'ports': threading.BoundedSemaphore(self.port_workers),
+            'snmp': threading.BoundedSemaphore(self.snmp_workers),
+        }
+        # Um host ocupa no máximo um estágio por vez, então a soma dos limites
+        # é suficiente para manter todos os estágios cheios simultaneamente.
+        total_workers = self.ping_workers + self.port_workers + self.snmp_workers
+        self._executor = ThreadPoolExecutor(max_workers=total_workers, thread_name_prefix='probe')
+        # Os hosts na vaga de ping (ou de portas) são sondados juntos, no máximo
+        # ping_workers (port_workers) por rodada
+        self._pinger = _StageBatcher(discovery.discovery_ping_batch, config.PING_BATCH_WINDOW, 'ping')
+        self._port_scanner = _StageBatcher(discovery.discovery_tcp_ports_batch, config.PORT_BATCH_WINDOW, 'portas')
+
+    def matches(self, ping_workers, port_workers, snmp_workers):
+        """Indica se o motor já foi criado com os limites informados."""
+        return (self.ping_workers, self.port_workers, self.snmp_workers) == (ping_workers, port_workers, snmp_workers)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+    def probe_devices(self, devices, default_gateway, deadline=None):
+        """
+        Sonda todos os dispositivos ({'ip', 'mac'}) e devolve a lista
+        enriquecida, na mesma ordem da entrada.
+
+        'devices' pode ser um gerador (ex.: discovery.discovery_arp_stream):
+        cada host é submetido ao pool assim que é produzido.
+
+        Com 'deadline', ao fim do prazo do ciclo as sondagens ainda na fila são
+        canceladas (o dispositivo volta com status 'unknown' e 'stages' vazio) e
+        as que estão em andamento terminam o estágio atual e pulam os seguintes.
+        """
+        submitted = [(device, self._executor.submit(self._probe_host, device, default_gateway, deadline))
+                     for device in devices]
+        results = []
+        for device, future in submitted:
+            try:
+                results.append(future.result(timeout=deadline.remaining() if deadline else None))
+            except FutureTimeoutError:
+                if future.cancel():
+                    results.append(_marcar_nao_sondado(device))
+                else:
+                    results.append(future.result())
+        return results
+
+    def probe_stream(self, devices, default_gateway, deadline=None):
+        """
+        Versão em streaming de probe_devices: gera cada dispositivo assim que a
+        sondagem dele termina (ordem de conclusão), sem esperar pelos demais.
+
+        A entrada é consumida por uma thread própria, então hosts descobertos
+        enquanto outros ainda são sondados entram no pool imediatamente. Com
+        'deadline', as sondagens ainda na fila ao fim do prazo do ciclo são
+        canceladas e geradas como não sondadas.
+        """
+        done = queue.Queue()
+        pending = {}  # future -> device
+        pending_lock = threading.Lock()
+        feeding = threading.Event()
+        feeding.set()
+
+        def _on_done(future):
+            with pending_lock:
+                device = pending[future]
+            result = _marcar_nao_sondado(device) if future.cancelled() else future.result()
+            # Sai de 'pending' e entra em 'done' atomicamente (o consumidor testa os dois)
+            with pending_lock:
+                del pending[future]
+                done.put(result)
+
+        def _feed():
+            try:
+                for device in devices:
+                    future = self._executor.submit(self._probe_host, device, default_gateway, deadline)
+                    with pending_lock:
+                        pending[future] = device
+                    future.add_done_callback(_on_done)
+            except Exception as e:
+                print(f"(Probe: Erro na descoberta: {e})")
+            finally:
+                feeding.clear()
+                done.put(None)  # Acorda o consumidor para reavaliar o fim
+
+        feeder = threading.Thread(target=_feed, name='probe-feed', daemon=True)
+        feeder.start()
+
+        cancelled = False
+        while True:
+            with pending_lock:
+                finished = not feeding.is_set() and not pending
+            if finished and done.empty():
+                break
+            if not cancelled and deadline is not None and deadline.expired():
+                # Prazo do ciclo: cancela o que ainda não começou (o callback gera o resultado)
+                with pending_lock:
+                    queued = list(pending)
+                for future in queued:
+                    future.cancel()
+                cancelled = True
+            timeout = deadline.remaining() if deadline is not None and not cancelled else None
+            try:
+                device = done.get(timeout=timeout if timeout else 0.5)
+            except queue.Empty:
+                continue
+            if device is not None:
+                yield device
+
+    def _probe_host(self, device, default_gateway, deadline=None):
+        """Executa todos os estágios, em ordem, para um único host."""
+        ip = device['ip']
+        if deadline is not None:
+            device['stages'] = []
+        try:
+            # 1. Ping e Definição de Status
+            # (os prazos são verificados depois de obter a vaga no estágio, pois a espera pode ser longa)
+            if self._passively_online(device):
+                ping_result = self._passive_ping_result(device)
+            else:
+                with self._stage_slots['ping']:
+                    if _expirado(deadline, 'ping'):
+                        return _marcar_nao_sondado(device)
+                    if discovery.ping_nativo_disponivel():
+                        ping_result = self._pinger.submit(ip)
+                    else:
+                        # Ping do sistema: um processo por host, em paralelo pelos workers
+                        ping_result = discovery.discovery_ping(ip)
+            if ping_result.get('status') == 'online':
+                device.update(ping_result)
+            else:
+                # Se o ping falhou, o dispositivo está "não responsivo"
+                device['status'] = 'unresponsive'
+                device['ttl'] = None
+            online = device.get('status') == 'online'
+            self._stage_done(device, 'ping', deadline)
+
+            # Dispositivo sem mudanças (mesmo IP/TTL) e com resultado recente: usa o cache
+            cached = None
+            if self.cache is not None and device.get('status') == 'online' and device.get('mac'):
+                cached = self.cache.get(device['mac'], ip, device.get('ttl'))
+
+            if cached is not None:
+                device['open_ports'] = list(cached['open_ports'])
+                classificar_papel(device, default_gateway)
+                if ip != default_gateway:
+                    _aplicar_snmp(device, cached['snmp'])
+                device['producer'] = cached['producer']
+                self._stage_done(device, 'ports', deadline)
+                self._stage_done(device, 'snmp', deadline)
+                return device
+
+            # 2. Scan de Portas (apenas para dispositivos online)
+            device['open_ports'] = []
+            if online:
+                with self._stage_slots['ports']:
+                    if not _expirado(deadline, 'ports'):
+                        device.update(self._port_scanner.submit(ip))
+                        self._stage_done(device, 'ports', deadline)
+            else:
+                self._stage_done(device, 'ports', deadline)
+
+            # 3. Classificação de Papel
+            classificar_papel(device, default_gateway)
+
+            # 4. Enriquecimento SNMP (sobrescreve o palpite do TTL, mas não o do gateway)
+            snmp_info = {}
+            if online and ip != default_gateway:
+                snmp_info = self._query_snmp(device, deadline)
+                if snmp_info is not None:  # None: estágio pulado pelo prazo
+                    _aplicar_snmp(device, snmp_info)
+                    self._stage_done(device, 'snmp', deadline)
+            else:
+                self._stage_done(device, 'snmp', deadline)
+        except Exception as e:
+            print(f"(Probe: Erro ao sondar {ip}: {e})")
+            device.setdefault('status', 'unresponsive')
+            device.setdefault('open_ports', [])
+            device.setdefault('role', 'Host')
+            snmp_info = None
+
+        # 5. Enriquecimento de Fabricante
+        if device.get('mac'):
+            device['producer'] = identificar_fabricante(device['mac'])
+
+        # Só guarda no cache sondagens completas de dispositivos online
+        if (self.cache is not None and snmp_info is not None and sondagem_completa(device)
+                and device.get('status') == 'online' and device.get('mac')):
+            self.cache.put(device['mac'], ip, device.get('ttl'), device['open_ports'], snmp_info, device.get('producer'))
+
+        return device
+
+    @staticmethod
+    def _stage_done(device, stage, deadline):
+        if deadline is not None:
+            device['stages'].append(stage)
+
+    def _passively_online(self, device):
+        return (self.passive is not None and device.get('mac')
+                and self.passive.seen_recently(device['mac'], config.PASSIVE_FRESHNESS))
+
+    def _passive_ping_result(self, device):
+        """
+        Status 'online' para um host confirmado pelo tráfego observado, sem enviar ping.
+        O TTL é o último conhecido (cache), para manter a classificação e o cache estáveis.
+        """
+        ttl = None
+        if self.cache is not None:
+            entry = self.cache.peek(device['mac'])
+            if entry is not None and entry['ip'] == device['ip']:
+                ttl = entry['ping_ttl']
+        return {'status': 'online', 'ttl': ttl, 'avg_latency': None, 'packet_loss': None}
+
+    def _query_snmp(self, device, deadline=None):
+        """
+        Consulta SNMP respeitando o cache negativo e a credencial lembrada do host.
+        Retorna {} para hosts em backoff ou que não responderam a nenhuma community,
+        e None se o prazo do estágio se esgotou antes da consulta.
+        """
+        ip = device['ip']
+        mac = device.get('mac')
+        if self.snmp_cache is None or not mac:
+            with self._stage_slots['snmp']:
+                if _expirado(deadline, 'snmp'):
+                    return None
+                return discovery.discovery_snmp_basic(ip)
+
+        open_ports = device.get('open_ports', [])
+        ping_ttl = device.get('ttl')
+        if not self.snmp_cache.should_query(mac, open_ports, ping_ttl):
+            return {}
+
+        with self._stage_slots['snmp']:
+            if _expirado(deadline, 'snmp'):
+                return None
+            for community in self.snmp_cache.candidates(mac):
+                snmp_info = discovery.discovery_snmp_basic(ip, community)
+                if snmp_info:
+                    self.snmp_cache.record_success(mac, community)
+                    return snmp_info
+
+        self.snmp_cache.record_failure(mac, open_ports, ping_ttl)
+        return {}
+
+
+def _expirado(deadline, stage):
+    return deadline is not None and deadline.expired(stage)
+
+
+def _marcar_nao_sondado(device):
+    """Dispositivo descoberto cuja sondagem foi cancelada pelo prazo do ciclo."""
+    device.setdefault('status', 'unknown')
+    device.setdefault('open_ports', [])
+    device.setdefault('role', 'Host')
+    device['stages'] = []
+    if device.get('mac'):
+        device['producer'] = identificar_fabricante(device['mac'])
+    return device
+
+
+def _aplicar_snmp(device, snmp_info):
+    """Mescla a resposta SNMP no dispositivo, preservando o papel quando o SNMP não o define."""
+    if snmp_info and snmp_info.get('role'):  # Se SNMP retornou um papel
+        device.update(snmp_info)  # Atualiza, sobrescrevendo o TTL
+    elif snmp_info:
+        # Atualiza outras informações SNMP mas mantém o role detectado
+        snmp_info_copy = snmp_info.copy()
+        snmp_info_copy.pop('role', None)
+        device.update(snmp_info_copy)
@@ -0,0 +1,165 @@
+# ratelimit.py
+"""
+Orçamento global de pacotes por segundo, compartilhado por todas as sondagens.
+
+ARP, ICMP, TCP (connect) e SNMP retiram fichas do mesmo balde antes de enviar
+cada pacote, para que a soma de todos os tipos nunca passe de um teto seguro
+para os switches de acesso (storm control):
+- Um balde de fichas global (PACKET_BUDGET_PPS)
+- Um sub-orçamento por classe de sondagem (PACKET_BUDGET_CLASS_PPS)
+- Contadores de pacotes e de tempo de espera (throttling) por classe
+
+Um pacote só sai quando há fichas nos dois baldes (global e da classe).
+Taxa 0 significa sem limite.
+"""
+
+import threading
+import time
+
+import config
+
+CLASSES = ('arp', 'icmp', 'tcp', 'snmp')
+
+
+class TokenBucket:
+    """
+    Balde de fichas com reserva: quem pede fichas que ainda não existem fica
+    devendo (saldo negativo) e recebe o tempo que precisa esperar antes de enviar.
+    """
+
+    def __init__(self, rate, burst_seconds=None):
+        self.burst_seconds = burst_seconds if burst_seconds is not None else config.PACKET_BUDGET_BURST
+        self._tokens = 0.0
+        self._updated = time.monotonic()
+        self.set_rate(rate)
+        self._tokens = self.capacity
+
+    def set_rate(self, rate):
+        self.rate = max(0, rate or 0)
+        self.capacity = max(1.0, self.rate * self.burst_seconds)
+        self._tokens = min(self._tokens, self.capacity) if self.rate else self.capacity
+
+    def _refill(self, now):
+        if self.rate:
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def available_in(self, n, now):
+        """Segundos até haver 'n' fichas (0 se já houver)."""
+        self._refill(now)
+        if not self.rate or self._tokens >= n:
+            return 0.0
+        return (n - self._tokens) / self.rate
+
+    def take(self, n, now):
+        """Retira 'n' fichas (o saldo pode ficar negativo) e retorna a espera necessária."""
+        self._refill(now)
+        if not self.rate:
+            return 0.0
+        self._tokens -= n
+        return -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+
+class PacketBudget:
+    """Balde global + um balde por classe, com contadores por classe."""
+
+    def __init__(self, total_pps=None, class_pps=None):
+        self._lock = threading.Lock()
+        self._total = TokenBucket(config.PACKET_BUDGET_PPS if total_pps is None else total_pps)
+        class_pps = dict(config.PACKET_BUDGET_CLASS_PPS, **(class_pps or {}))
+        self._classes = {name: TokenBucket(class_pps.get(name, 0)) for name in CLASSES}
+        self._packets = {name: 0 for name in CLASSES}
+        self._throttled = {name: 0.0 for name in CLASSES}
+        self._throttle_events = {name: 0 for name in CLASSES}
+
+    def configure(self, total_pps=None, class_pps=None):
+        """Ajusta as taxas em tempo de execução (None mantém o valor atual)."""
+        with self._lock:
+            if total_pps is not None and total_pps != self._total.rate:
+                self._total.set_rate(total_pps)
+            for name, rate in (class_pps or {}).items():
+                if name in self._classes and rate != self._classes[name].rate:
+                    self._classes[name].set_rate(rate)
+
+    def acquire(self, probe_class, n=1):
+        """Bloqueia a thread chamadora até que 'n' pacotes da classe possam ser enviados."""
+        wait = self.charge(probe_class, n)
+        if wait > 0:
+            time.sleep(wait)
+
+    def charge(self, probe_class, n=1):
+        """
+        Debita 'n' pacotes sem esperar e retorna a espera que eles exigiriam. Usado
+        para pacotes que outros processos enviam já na taxa certa: o débito faz as
+        demais classes deste processo respeitarem o teto global enquanto isso.
+        """
+        with self._lock:
+            now = time.monotonic()
+            wait = max(self._total.take(n, now), self._classes[probe_class].take(n, now))
+            self._packets[probe_class] += n
+            if wait > 0:
+                self._throttled[probe_class] += wait
+                self._throttle_events[probe_class] += 1
+        return wait
+
+    def try_acquire(self, probe_class, n=1):
+        """
+        Versão não bloqueante, para laços de eventos: retira as fichas e retorna 0
+        se houver saldo; caso contrário não retira nada e retorna a espera necessária.
+        """
+        with self._lock:
+            now = time.monotonic()
+            wait = max(self._total.available_in(n, now), self._classes[probe_class].available_in(n, now))
+            if wait > 0:
+                return wait
+            self._total.take(n, now)
+            self._classes[probe_class].take(n, now)
+            self._packets[probe_class] += n
+            return 0.0
+
+    def record_throttled(self, probe_class, seconds):
+        """Contabiliza uma espera feita pelo próprio chamador (após try_acquire)."""
+        with self._lock:
+            self._throttled[probe_class] += seconds
+            self._throttle_events[probe_class] += 1
+
+    def rate_for(self, probe_class):
+        """Taxa efetiva máxima de uma classe (menor entre a global e a da classe; 0 = sem limite)."""
+        rates = [r for r in (self._total.rate, self._classes[probe_class].rate) if r]
+        return min(rates) if rates else 0
+
+    def reset_stats(self):
+        with self._lock:
+            for name in CLASSES:
+                self._packets[name] = 0
+                self._throttled[name] = 0.0
+                self._throttle_events[name] = 0
+
+    def stats(self):
+        """Taxas configuradas e contadores por classe (para exibição na CLI)."""
+        with self._lock:
+            return {
+                'total_pps': self._total.rate,
+                'classes': {
+                    name: {
+                        'pps': self._classes[name].rate,
+                        'packets': self._packets[name],
+                        'throttled': self._throttled[name],
+                        'throttle_events': self._throttle_events[name]
+                    }
+                    for name in CLASSES
+                }
+            }
+
+
+_budget = None
+_budget_lock = threading.Lock()
+
+
+def get_budget():
+    """Orçamento de pacotes compartilhado pelo processo (criado no primeiro uso)."""
+    global _budget
+    with _budget_lock:
+        if _budget is None:
+            _budget = PacketBudget()
+        return _budget
@@ -0,0 +1,348 @@
+# retention.py
+"""
+Retenção, compactação e arquivamento do histórico de scans.
+
+Regras (por rede, pela idade do scan):
+- até RETENTION_FULL_DAYS dias: todos os scans
+- até RETENTION_HOURLY_DAYS dias: o último scan completo de cada hora
+- depois: o último scan completo de cada dia (até RETENTION_DAILY_DAYS, se
+  definido; depois disso, nenhum)
+O último scan de cada rede e os scans reimportados (pinned) nunca saem.
+
+Os scans podados vão, já reconstruídos (mesmo formato de scan view), para
+arquivos JSON Lines comprimidos por dia em ARCHIVE_DIR (scans-AAAA-MM-DD.jsonl.gz),
+e ficam indexados na tabela archived_scans: continuam consultáveis
+(get_archived_scan) e podem voltar ao banco (reimport_day).
+
+O RetentionWorker roda em segundo plano a cada RETENTION_INTERVAL segundos,
+em lotes de RETENTION_BATCH scans (cada lote é uma transação curta na thread
+de escrita do banco), e devolve as páginas livres ao sistema com
+'PRAGMA incremental_vacuum' em passos de VACUUM_STEP_PAGES páginas. Na
+mesma passada, apaga os eventos de device_events mais antigos que
+EVENTS_RETENTION_DAYS dias que todos os consumidores já leram (um evento
+além do cursor de algum consumidor nunca é apagado).
+
+Bancos novos já nascem com auto_vacuum incremental. Um banco criado antes
+disso precisa de um VACUUM completo, que reescreve o arquivo inteiro e não
+pode rodar na thread de escrita: converta-o com o serviço parado,
+
+    sudo venv/bin/python retention.py compact
+"""
+
+import argparse
+import gzip
+import sqlite3
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import config
+import database
+
+
+def _archive_path(day):
+    return os.path.join(config.ARCHIVE_DIR, f'scans-{day}.jsonl.gz')
+
+
+def plan_prune(now=None):
+    """scan_ids a podar pelas regras de retenção, do mais antigo ao mais novo."""
+    now = now or datetime.now()
+    full_cutoff = now - timedelta(days=config.RETENTION_FULL_DAYS)
+    hourly_cutoff = now - timedelta(days=config.RETENTION_HOURLY_DAYS)
+    daily_cutoff = now - timedelta(days=config.RETENTION_DAILY_DAYS) if config.RETENTION_DAILY_DAYS else None
+
+    with database._reader() as conn:
+        latest = {row['scan_id'] for row in conn.execute(
+            'SELECT MAX(scan_id) AS scan_id FROM scans WHERE complete = 1 GROUP BY network')}
+        rows = conn.execute('''
+            SELECT scan_id, timestamp, network, complete FROM scans
+            WHERE timestamp < ? AND pinned = 0 ORDER BY timestamp
+        ''', (full_cutoff,)).fetchall()
+
+    prune = []
+    keep = {}  # (rede, hora ou dia) -> scan completo mais recente do intervalo
+    for row in rows:
+        timestamp = str(row['timestamp'])
+        if daily_cutoff is not None and timestamp < str(daily_cutoff) and row['scan_id'] not in latest:
+            prune.append(row['scan_id'])
+            continue
+        if not row['complete']:
+            prune.append(row['scan_id'])
+            continue
+        bucket = timestamp[:13] if timestamp >= str(hourly_cutoff) else timestamp[:10]
+        previous = keep.get((row['network'], bucket))
+        if previous is not None:
+            prune.append(previous)
+        keep[(row['network'], bucket)] = row['scan_id']
+    return sorted(set(prune) - latest)
+
+
+def _read_scans(scan_ids):
+    """Scans completos (metadados, dispositivos e links) para o arquivo."""
+    scans = []
+    with database._reader() as conn:
+        for scan_id in scan_ids:
+            row = conn.execute('''SELECT scan_id, timestamp, complete, network, total, online_count
+                                  FROM scans WHERE scan_id = ?''', (scan_id,)).fetchone()
+            if row is None:
+                continue
+            scan = dict(row)
+            scan['timestamp'] = str(scan['timestamp'])
+            scan['devices'] = database._scan_devices(conn, scan_id)
+            scan['links'] = [dict(link) for link in conn.execute(
+                'SELECT src_mac AS src, dst_mac AS dst, type FROM links WHERE scan_id = ?', (scan_id,))]
+            scans.append(scan)
+    return scans
+
+
+def _append_archive(scans):
+    """Acrescenta os scans aos arquivos dos seus dias (um membro gzip por lote)."""
+    os.makedirs(config.ARCHIVE_DIR, exist_ok=True)
+    by_day = {}
+    for scan in scans:
+        by_day.setdefault(scan['timestamp'][:10], []).append(scan)
+    for day, day_scans in by_day.items():
+        with open(_archive_path(day), 'ab') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='wb') as archive:
+                for scan in day_scans:
+                    archive.write(json.dumps(scan, separators=(',', ':')).encode() + b'\n')
+            raw.flush()
+            os.fsync(raw.fileno())
+
+
+def _delete_scans(cursor, scans):
+    """Remove os scans arquivados do banco e os registra em archived_scans."""
+    scan_ids = [(scan['scan_id'],) for scan in scans]
+    cursor.executemany('DELETE FROM devices WHERE scan_id = ?', scan_ids)
+    cursor.executemany('DELETE FROM links WHERE scan_id = ?', scan_ids)
+    cursor.executemany('DELETE FROM scans WHERE scan_id = ?', scan_ids)
+    cursor.executemany(
+        '''INSERT OR REPLACE INTO archived_scans (scan_id, timestamp, network, day, total, online_count)
+           VALUES (?, ?, ?, ?, ?, ?)''',
+        [(s['scan_id'], s['timestamp'], s['network'], s['timestamp'][:10], s['total'], s['online_count'])
+         for s in scans])
+    # Modo 'delta': intervalos que não contêm mais nenhum scan da rede
+    low, high = min(s['scan_id'] for s in scans), max(s['scan_id'] for s in scans)
+    cursor.execute('''
+        DELETE FROM device_states
+        WHERE last_scan >= ? AND first_scan <= ?
+          AND NOT EXISTS (SELECT 1 FROM scans s WHERE s.network IS device_states.network
+                          AND s.scan_id BETWEEN device_states.first_scan AND device_states.last_scan)
+    ''', (low, high))
+    return len(scans)
+
+
+def _prune_events(cursor, cutoff):
+    """Apaga os eventos anteriores a 'cutoff' já lidos por todos os consumidores."""
+    # Sem consumidores, vale só a idade; com eles, nada depois do cursor mais atrasado sai
+    cursor.execute('''
+        DELETE FROM device_events WHERE timestamp < ? AND event_id <= (
+            SELECT ifnull(MIN(last_event), (SELECT MAX(event_id) FROM device_events)) FROM event_consumers)
+    ''', (cutoff,))
+    return cursor.rowcount
+
+
+def _vacuum_step(cursor, pages):
+    """Devolve até 'pages' páginas livres; retorna quantas ainda restam."""
+    # executescript roda o pragma até o fim (cada passo do execute libera uma página só)
+    cursor.executescript(f'PRAGMA incremental_vacuum({int(pages)})')
+    return cursor.execute('PRAGMA freelist_count').fetchone()[0]
+
+
+def incremental_vacuum_enabled():
+    with database._reader() as conn:
+        return conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2
+
+
+def compact_database(path=None):
+    """
+    Converte um banco antigo para auto_vacuum incremental (VACUUM completo).
+    Usa uma conexão própria, fora da thread de escrita: rode com o serviço parado.
+    Retorna False se o banco já estava convertido.
+    """
+    conn = sqlite3.connect(path or database.DB_FILE, isolation_level=None)
+    try:
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+            return False
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('VACUUM')
+        return True
+    finally:
+        conn.close()
+
+
+def _checkpoint(cursor):
+    cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchall()
+
+
+def run_once(now=None, stop=None, silent=False):
+    """
+    Uma passada completa: poda e arquiva em lotes, depois compacta o arquivo.
+    Retorna {'archived', 'vacuumed'} (scans arquivados, passos de vacuum).
+    """
+    archived = 0
+    scan_ids = plan_prune(now)
+    for start in range(0, len(scan_ids), config.RETENTION_BATCH):
+        if stop is not None and stop.is_set():
+            break
+        scans = _read_scans(scan_ids[start:start + config.RETENTION_BATCH])
+        if not scans:
+            continue
+        # Primeiro o arquivo (com fsync), depois a remoção: uma queda no meio só repete o lote
+        _append_archive(scans)
+        archived += database._write(_delete_scans, scans).result()
+
+    if config.EVENTS_RETENTION_DAYS:
+        cutoff = (now or datetime.now()) - timedelta(days=config.EVENTS_RETENTION_DAYS)
+        database._write(_prune_events, cutoff).result()
+
+    steps = 0
+    remaining = None
+    vacuum = incremental_vacuum_enabled()
+    if not vacuum and not silent:
+        print("(Retenção: Banco sem auto_vacuum incremental; o espaço podado não volta ao sistema. "
+              "Converta-o com o serviço parado: 'python retention.py compact'.)")
+    # Passos pequenos: as gravações do orquestrador entram na fila entre um e outro
+    while vacuum and not (stop and stop.is_set()):
+        left = database._write(_vacuum_step, config.VACUUM_STEP_PAGES).result()
+        steps += 1
+        if not left or left == remaining:
+            break
+        remaining = left
+        time.sleep(0.01)
+    database._write(_checkpoint).result()
+    if archived and not silent:
+        print(f"(Retenção: {archived} scan(s) arquivado(s) em {config.ARCHIVE_DIR}; {steps} passo(s) de vacuum.)")
+    return {'archived': archived, 'vacuumed': steps}
+
+
+def read_day(day):
+    """Scans arquivados de um dia ('AAAA-MM-DD'), por scan_id (um reenvio substitui o anterior)."""
+    path = _archive_path(day)
+    if not os.path.exists(path):
+        return []
+    scans = {}
+    with gzip.open(path, 'rt') as archive:
+        for line in archive:
+            scan = json.loads(line)
+            scans[scan['scan_id']] = scan
+    return [scans[scan_id] for scan_id in sorted(scans)]
+
+
+def list_archived(limit=None):
+    """Índice dos scans arquivados, do mais novo ao mais antigo."""
+    with database._reader() as conn:
+        rows = conn.execute('''SELECT scan_id, timestamp, network, day, total, online_count
+                               FROM archived_scans ORDER BY timestamp DESC LIMIT ?''',
+                            (limit if limit is not None else -1,)).fetchall()
+    return [dict(row) for row in rows]
+
+
+def get_archived_scan(scan_id):
+    """Scan arquivado (com os dispositivos), ou None."""
+    with database._reader() as conn:
+        row = conn.execute('SELECT day FROM archived_scans WHERE scan_id = ?', (scan_id,)).fetchone()
+    if row is None:
+        return None
+    return next((scan for scan in read_day(row['day']) if scan['scan_id'] == scan_id), None)
+
+
+def _restore_scans(cursor, scans):
+    """
+    Devolve scans arquivados ao banco, com o scan_id original e marcados como
+    'pinned' (a retenção não os poda de novo). Os dispositivos voltam como
+    cópias completas; intervalos do modo 'delta' que atravessam o scan são
+    cortados nele, para não o contarem duas vezes.
+    """
+    restored = 0
+    for scan in scans:
+        scan_id = scan['scan_id']
+        if cursor.execute('SELECT 1 FROM scans WHERE scan_id = ?', (scan_id,)).fetchone():
+            continue
+        network = scan['network']
+        cursor.execute('''INSERT INTO scans (scan_id, timestamp, complete, network, total, online_count, pinned)
+                          VALUES (?, ?, ?, ?, ?, ?, 1)''',
+                       (scan_id, scan['timestamp'], scan['complete'], network, scan['total'], scan['online_count']))
+        spanning = cursor.execute('''SELECT * FROM device_states
+                                     WHERE network IS ? AND first_scan <= ? AND last_scan >= ?''',
+                                  (network, scan_id, scan_id)).fetchall()
+        for state in spanning:
+            cursor.execute('DELETE FROM device_states WHERE state_id = ?', (state['state_id'],))
+            for first, last in ((state['first_scan'], scan_id - 1), (scan_id + 1, state['last_scan'])):
+                if first <= last:
+                    values = dict(state)
+                    values.pop('state_id')
+                    values.update(first_scan=first, last_scan=last)
+                    cursor.execute(f'''INSERT INTO device_states ({', '.join(values)})
+                                       VALUES ({', '.join('?' * len(values))})''', tuple(values.values()))
+        database._insert_device_rows(cursor, scan_id, database._device_rows(scan['devices'], network),
+                                     scan['timestamp'])
+        cursor.executemany('INSERT INTO links (scan_id, src_mac, dst_mac, type) VALUES (?, ?, ?, ?)',
+                           [(scan_id, link['src'], link['dst'], link['type']) for link in scan['links']])
+        cursor.execute('DELETE FROM archived_scans WHERE scan_id = ?', (scan_id,))
+        restored += 1
+    return restored
+
+
+def reimport_day(day):
+    """Reimporta os scans arquivados de um dia; retorna quantos voltaram ao banco."""
+    scans = read_day(day)
+    if not scans:
+        return 0
+    return database._write(_restore_scans, scans).result()
+
+
+class RetentionWorker:
+    """Thread de retenção: uma passada a cada RETENTION_INTERVAL segundos."""
+
+    def __init__(self, interval=None):
+        self.interval = interval or config.RETENTION_INTERVAL
+        self._stop = threading.Event()
+        self._thread = None
+        self.last_run = None
+        self.last_result = None
+        self.total_archived = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='retention', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval if self.last_run else 60):
+            self.run_now(silent=True)
+
+    def run_now(self, silent=False):
+        try:
+            self.last_result = run_once(stop=self._stop, silent=silent)
+        except Exception as e:
+            print(f"(Retenção: Erro na passada de retenção: {e})")
+            return None
+        self.last_run = time.time()
+        self.total_archived += self.last_result['archived']
+        return self.last_result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Manutenção offline do banco de scans.')
+    parser.add_argument('command', choices=['compact'],
+                        help="compact: converte o banco para auto_vacuum incremental (VACUUM completo)")
+    parser.add_argument('--db', default=database.DB_FILE, help=f'arquivo do banco (padrão: {database.DB_FILE})')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        parser.error(f"banco {args.db} não encontrado")
+    size = os.path.getsize(args.db)
+    if compact_database(args.db):
+        print(f"(Retenção: {args.db} convertido para auto_vacuum incremental; "
+              f"{size / 1e6:.1f} MB -> {os.path.getsize(args.db) / 1e6:.1f} MB.)")
+    else:
+        print(f"(Retenção: {args.db} já usa auto_vacuum incremental.)")
+
+
+if __name__ == '__main__':
+    main()
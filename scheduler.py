@@ -0,0 +1,183 @@
+# scheduler.py
+"""
+Agendador adaptativo de sondagens por dispositivo.
+
+Em vez de sondar a rede inteira a cada intervalo global, cada dispositivo
+conhecido tem seu próprio horário de próxima sondagem, mantido em uma fila de
+prioridade (heap). O intervalo depende da classe do dispositivo:
+- 'flapping': mudou várias vezes em pouco tempo (sondado a cada poucos segundos)
+- 'recent':   mudou recentemente ou acabou de aparecer
+- 'stable':   sem mudanças há algum tempo (sondado a cada poucos minutos)
+
+As varreduras ARP da sub-rede inteira têm cadência própria (orquestrador) e só
+servem para achar dispositivos novos, que mudaram de IP ou que saíram da rede.
+
+Dispositivos com sondagem incompleta (prazo do ciclo esgotado) voltam para a
+frente da fila, para serem sondados antes de todos os outros.
+"""
+
+import heapq
+import random
+import threading
+import time
+from collections import deque
+
+import config
+from deadline import mesclar_parcial, sondagem_completa
+
+CLASSES = ('flapping', 'recent', 'stable')
+
+
+def _fingerprint(device):
+    """Campos cuja alteração conta como mudança do dispositivo."""
+    return (
+        device.get('ip'),
+        device.get('status'),
+        tuple(sorted(device.get('open_ports', []))),
+        device.get('role'),
+        device.get('snmp_name')
+    )
+
+
+class ProbeScheduler:
+    """
+    Fila de prioridade {mac: próxima sondagem} com o último resultado de cada dispositivo.
+    Thread-safe: o orquestrador agenda e a CLI consulta as estatísticas.
+    """
+
+    def __init__(self, intervals=None):
+        self.intervals = dict(intervals or config.SCHEDULER_INTERVALS)
+        self._heap = []       # (due, seq, mac); entradas obsoletas são descartadas no pop
+        self._entries = {}    # mac -> {'device', 'due', 'class', 'changes', 'fingerprint'}
+        self._seq = 0
+        self._lock = threading.Lock()
+        self.probes = 0
+        self.changes = 0
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def _classify(self, entry, now):
+        changes = entry['changes']
+        while changes and now - changes[0] > config.SCHEDULER_FLAP_WINDOW:
+            changes.popleft()
+        if len(changes) >= config.SCHEDULER_FLAP_CHANGES:
+            return 'flapping'
+        if changes and now - changes[-1] <= config.SCHEDULER_RECENT_WINDOW:
+            return 'recent'
+        return 'stable'
+
+    def _push(self, mac, entry, now, jitter=True):
+        interval = self.intervals[entry['class']]
+        # Espalha os horários para que hosts sondados juntos não vençam juntos
+        if jitter:
+            interval *= random.uniform(0.9, 1.1)
+        entry['due'] = now + interval
+        self._seq += 1
+        heapq.heappush(self._heap, (entry['due'], self._seq, mac))
+
+    def observe(self, device, now=None):
+        """
+        Registra o resultado de uma sondagem e reagenda o dispositivo.
+        Retorna True se ele é novo ou mudou desde a última sondagem.
+        """
+        now = now or time.time()
+        mac = device['mac'].lower()
+        fingerprint = _fingerprint(device)
+        with self._lock:
+            self.probes += 1
+            entry = self._entries.get(mac)
+            if entry is None:
+                entry = {'changes': deque(), 'fingerprint': None, 'class': 'recent'}
+                self._entries[mac] = entry
+
+            if not sondagem_completa(device):
+                # Parcial: não conta como mudança; completa o que faltou na frente da fila
+                if entry.get('device') is not None:
+                    device = mesclar_parcial(entry['device'], device)
+                entry['device'] = device
+                entry['due'] = 0.0
+                self._seq += 1
+                heapq.heappush(self._heap, (0.0, self._seq, mac))
+                return False
+
+            changed = entry['fingerprint'] != fingerprint
+            if changed:
+                entry['changes'].append(now)
+                self.changes += 1
+            entry['fingerprint'] = fingerprint
+            entry['device'] = device
+            entry['class'] = self._classify(entry, now)
+            self._push(mac, entry, now)
+            return changed
+
+    def incomplete(self):
+        """Quantidade de dispositivos cujo último resultado é parcial."""
+        with self._lock:
+            return sum(1 for entry in self._entries.values() if not sondagem_completa(entry['device']))
+
+    def known_ip(self, mac):
+        """IP atual do dispositivo na fila, ou None se ele não for conhecido."""
+        with self._lock:
+            entry = self._entries.get(mac.lower())
+            return entry['device'].get('ip') if entry else None
+
+    def retain(self, macs):
+        """Mantém apenas os MACs informados (os demais saíram da rede). Retorna quantos saíram."""
+        keep = {mac.lower() for mac in macs}
+        with self._lock:
+            gone = [mac for mac in self._entries if mac not in keep]
+            for mac in gone:
+                del self._entries[mac]
+            return len(gone)
+
+    def pop_due(self, now=None):
+        """Remove da fila e devolve ({'ip', 'mac'}) os dispositivos cuja sondagem venceu."""
+        now = now or time.time()
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                when, _seq, mac = heapq.heappop(self._heap)
+                entry = self._entries.get(mac)
+                if entry is None or entry['due'] != when:
+                    continue  # Dispositivo removido ou reagendado depois
+                entry['due'] = None
+                due.append({'ip': entry['device']['ip'], 'mac': mac})
+        return due
+
+    def next_due(self):
+        """Instante (epoch) da próxima sondagem agendada, ou None se a fila estiver vazia."""
+        with self._lock:
+            while self._heap:
+                when, _seq, mac = self._heap[0]
+                entry = self._entries.get(mac)
+                if entry is not None and entry['due'] == when:
+                    return when
+                heapq.heappop(self._heap)
+            return None
+
+    def devices(self):
+        """Último resultado de todos os dispositivos conhecidos, ordenado por IP."""
+        with self._lock:
+            devices = [entry['device'] for entry in self._entries.values()]
+        return sorted(devices, key=lambda d: tuple(int(p) for p in d['ip'].split('.')))
+
+    def stats(self):
+        """Profundidade da fila, dispositivos por classe e intervalos (para a CLI)."""
+        now = time.time()
+        with self._lock:
+            per_class = {name: 0 for name in CLASSES}
+            overdue = 0
+            for entry in self._entries.values():
+                per_class[entry['class']] += 1
+                if entry['due'] is not None and entry['due'] <= now:
+                    overdue += 1
+            return {
+                'queue_depth': sum(1 for e in self._entries.values() if e['due'] is not None),
+                'overdue': overdue,
+                'per_class': per_class,
+                'intervals': dict(self.intervals),
+                'probes': self.probes,
+                'changes': self.changes
+            }
@@ -0,0 +1,191 @@
+# snmp_engine.py
+"""
+Motor SNMP compartilhado e não bloqueante.
+
+Mantém um único SnmpEngine de longa duração, dirigido por uma thread própria
+com a API asyncore do pysnmp 4.4 (a hlapi asyncio dessa versão usa
+@asyncio.coroutine, que não existe mais no Python 3.11), em vez de criar um
+SnmpEngine novo por host:
+- Centenas de agentes podem ser consultados ao mesmo tempo (até
+  SNMP_MAX_CONCURRENT pedidos em voo; os demais esperam na fila)
+- As consultas usam OIDs numéricos já resolvidos (sem lookup de MIB por chamada)
+- Uma consulta nunca bloqueia a thread chamadora além do tempo de todas as
+  tentativas (SNMP_TIMEOUT x (SNMP_RETRIES + 1)) mais uma folga
+
+O SnmpEngine não é thread-safe: só a thread 'snmp-engine' toca nele. As outras
+threads entregam os pedidos por uma fila e recebem concurrent.futures.Future.
+
+Se a hlapi asyncore do pysnmp não estiver disponível, get_engine() retorna None
+e discovery.py volta a usar a consulta síncrona.
+"""
+
+import asyncore
+import collections
+import concurrent.futures
+import queue
+import threading
+import time
+
+import config
+import ratelimit
+
+try:
+    from pysnmp.hlapi.asyncore import (
+        getCmd,
+        SnmpEngine,
+        CommunityData,
+        UdpTransportTarget,
+        ContextData,
+        ObjectType,
+        ObjectIdentity
+    )
+    _HLAPI_ERROR = None
+except (ImportError, AttributeError) as e:
+    _HLAPI_ERROR = e
+
+# OIDs numéricos (evita resolver SNMPv2-MIB / IP-MIB a cada consulta)
+OID_SYS_DESCR = (1, 3, 6, 1, 2, 1, 1, 1, 0)
+OID_SYS_NAME = (1, 3, 6, 1, 2, 1, 1, 5, 0)
+OID_IP_FORWARDING = (1, 3, 6, 1, 2, 1, 4, 1, 0)
+
+# Espera máxima do laço por pacotes enquanto há consultas em voo (s): também é
+# o atraso máximo para um pedido novo sair
+_POLL_INTERVAL = 0.01
+# Folga (s) somada ao tempo das tentativas ao esperar um resultado: cobre a
+# espera na fila (SNMP_MAX_CONCURRENT) e o atraso do laço
+_RESULT_MARGIN = 2.0
+
+
+def parse_basic_varbinds(varBinds):
+    """
+    Converte as varbinds de sysName/sysDescr/ipForwarding no dicionário
+    usado pelo restante do sistema ('snmp_name', 'snmp_description', 'role').
+    """
+    snmp_data = {}
+    for name, value in varBinds:
+        oid = tuple(name)
+        if oid == OID_SYS_NAME:
+            snmp_data['snmp_name'] = str(value)
+        elif oid == OID_SYS_DESCR:
+            snmp_data['snmp_description'] = str(value)
+        elif oid == OID_IP_FORWARDING:
+            try:
+                # O valor 1 significa 'forwarding' (é um roteador)
+                # O valor 2 significa 'not-forwarding' (é um host)
+                snmp_data['role'] = 'Roteador' if int(value) == 1 else 'Host'
+            except (TypeError, ValueError):
+                # noSuchObject / noSuchInstance
+                pass
+
+    # Se a role não foi descoberta via ipForwarding, deixa em branco
+    if 'role' not in snmp_data:
+        snmp_data['role'] = 'N/A'
+    return snmp_data
+
+
+class SnmpQueryEngine:
+    """
+    Executa consultas SNMP básicas em uma thread dedicada, com um único SnmpEngine.
+    Os métodos públicos podem ser chamados de qualquer thread.
+    """
+
+    def __init__(self):
+        self._requests = queue.Queue()
+        self._snmp_engine = SnmpEngine()
+        # Resolvidos uma única vez e reaproveitados em toda consulta
+        self._basic_var_binds = [
+            ObjectType(ObjectIdentity(oid)) for oid in (OID_SYS_NAME, OID_SYS_DESCR, OID_IP_FORWARDING)
+        ]
+        self._in_flight = 0
+        self._thread = threading.Thread(target=self._run, name='snmp-engine', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        backlog = collections.deque()
+        while True:
+            # Sem consultas em voo, dorme até chegar um pedido; com consultas, só recolhe os que já chegaram
+            try:
+                backlog.append(self._requests.get(timeout=None if not self._in_flight and not backlog else 0))
+                while True:
+                    backlog.append(self._requests.get_nowait())
+            except queue.Empty:
+                pass
+
+            while backlog and self._in_flight < config.SNMP_MAX_CONCURRENT:
+                self._send(*backlog.popleft())
+
+            dispatcher = self._snmp_engine.transportDispatcher
+            if dispatcher is not None and self._in_flight:
+                try:
+                    asyncore.loop(timeout=_POLL_INTERVAL, use_poll=True, map=dispatcher.getSocketMap(), count=1)
+                    # Timeouts e retransmissões do pysnmp
+                    dispatcher.handleTimerTick(time.time())
+                except Exception as e:
+                    print(f"(SNMP: Erro no laço do motor: {e})")
+
+    def _send(self, ip, community, future):
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            getCmd(
+                self._snmp_engine,
+                CommunityData(community or config.SNMP_COMMUNITY, mpModel=1),
+                UdpTransportTarget((ip, config.SNMP_PORT), timeout=config.SNMP_TIMEOUT, retries=config.SNMP_RETRIES),
+                ContextData(),
+                *self._basic_var_binds,
+                lookupMib=False,
+                cbFun=self._on_response,
+                cbCtx=future
+            )
+        except Exception:
+            future.set_result({})
+            return
+        self._in_flight += 1
+
+    def _on_response(self, snmpEngine, sendRequestHandle, errorIndication, errorStatus, errorIndex,
+                     varBinds, future):
+        self._in_flight -= 1
+        result = {}
+        try:
+            if not errorIndication and not errorStatus:
+                result = parse_basic_varbinds(varBinds)
+        finally:
+            # Sempre resolve o Future, mesmo se a resposta vier malformada
+            future.set_result(result)
+
+    def submit(self, ip, community=None):
+        """
+        Agenda a consulta de um IP e retorna um concurrent.futures.Future.
+        Respeita o orçamento global de pacotes (classe 'snmp') na thread chamadora.
+        """
+        ratelimit.get_budget().acquire('snmp')
+        future = concurrent.futures.Future()
+        self._requests.put((ip, community, future))
+        return future
+
+    def query(self, ip, community=None):
+        """
+        Consulta um único IP (bloqueia apenas a thread chamadora).
+        Retorna {} se o resultado não chegar a tempo.
+        """
+        future = self.submit(ip, community)
+        try:
+            return future.result(timeout=config.SNMP_TIMEOUT * (config.SNMP_RETRIES + 1) + _RESULT_MARGIN)
+        except concurrent.futures.TimeoutError:
+            future.cancel()  # Se ainda estiver na fila, não chega a ser enviado
+            return {}
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """Retorna o motor SNMP compartilhado, ou None se a hlapi asyncore não estiver disponível."""
+    global _engine
+    if _HLAPI_ERROR is not None:
+        return None
+    with _engine_lock:
+        if _engine is None:
+            _engine = SnmpQueryEngine()
+        return _engine
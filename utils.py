@@ -7,11 +7,13 @@ Contém helpers para:
 - Auto-detecção de rede ativa local (netifaces)
 - Conversão e formatação de endereços MAC
 - Cálculo automático de CIDR para scanning
+- Leitura da tabela de vizinhos (ARP) do kernel
 
 Integra com oui_db.py para resolução rápida de vendors.
 """
 
 import ipaddress
+import subprocess
 import netifaces  # Importa a biblioteca correta
 from oui_db import OUI_DATABASE
 
@@ -77,4 +79,75 @@ def get_default_gateway_ip():
         gw_ip = default_ipv4[0]
         return gw_ip
     except Exception:
-        return None
\ No newline at end of file
+        return None
+
+def get_default_interface():
+    """Retorna o nome da interface da rota padrão IPv4 (ex: 'eth0') ou None."""
+    try:
+        gateways = netifaces.gateways()
+        default_ipv4 = gateways.get('default', {}).get(netifaces.AF_INET)
+        if not default_ipv4:
+            return None
+        return default_ipv4[1]
+    except Exception:
+        return None
+
+
+# Flag ATF_COM da tabela ARP do kernel: entrada resolvida (MAC conhecido)
+ATF_COM = 0x2
+
+# Estados NUD de um vizinho confirmado há pouco; STALE, DELAY, PROBE, FAILED e
+# INCOMPLETE podem ser de hosts que já saíram da rede
+FRESH_NUD_STATES = {'REACHABLE', 'PERMANENT'}
+
+
+def read_neighbor_table(interface=None, path='/proc/net/arp'):
+    """
+    Lê a tabela de vizinhos IPv4 do kernel (somente Linux) e retorna como lista
+    de {'ip', 'mac'} os vizinhos confirmados há pouco (estado NUD em
+    FRESH_NUD_STATES, via 'ip neigh'), opcionalmente só os da interface dada.
+
+    Sem o iproute2, lê /proc/net/arp, que não informa o estado: vêm todas as
+    entradas resolvidas, inclusive as vencidas. Em qualquer caso, quem usa a
+    tabela trata os vizinhos só como candidatos a sondar, não como online.
+    Retorna lista vazia se a tabela não puder ser lida.
+    """
+    neighbors = _read_ip_neigh(interface)
+    if neighbors is not None:
+        return neighbors
+    neighbors = []
+    try:
+        with open(path) as f:
+            next(f, None)  # Cabeçalho
+            for line in f:
+                fields = line.split()
+                if len(fields) < 6:
+                    continue
+                ip, _hw_type, flags, mac, _mask, device = fields[:6]
+                if interface and device != interface:
+                    continue
+                if not int(flags, 16) & ATF_COM or mac == '00:00:00:00:00:00':
+                    continue
+                neighbors.append({'ip': ip, 'mac': mac.lower()})
+    except (OSError, ValueError):
+        return []
+    return neighbors
+
+
+def _read_ip_neigh(interface=None):
+    """Vizinhos frescos segundo 'ip -4 neigh show', ou None se o comando não estiver disponível."""
+    command = ['ip', '-4', 'neigh', 'show'] + (['dev', interface] if interface else [])
+    try:
+        output = subprocess.run(command, capture_output=True, text=True, timeout=5, check=True).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    neighbors = []
+    for line in output.splitlines():
+        # '192.168.1.1 dev eth0 lladdr aa:bb:cc:dd:ee:ff router REACHABLE' ('dev' omitido com 'dev X' no comando)
+        fields = line.split()
+        if not fields or 'lladdr' not in fields or fields[-1] not in FRESH_NUD_STATES:
+            continue
+        mac = fields[fields.index('lladdr') + 1].lower()
+        if mac != '00:00:00:00:00:00':
+            neighbors.append({'ip': fields[0], 'mac': mac})
+    return neighbors